@@ -22,6 +22,9 @@ def get_config():
     arch.hidden_dim = 256
     arch.out_dim = 1
     arch.activation = "tanh"
+    arch.remat = "none"
+    arch.compute_dtype = None
+    arch.matmul_precision = None
     arch.periodicity = ml_collections.ConfigDict(
         {"period": (2 * jnp.pi, 1.0), "axis": (0, 1), "trainable": (True, False)}
     )
@@ -39,6 +42,7 @@ def get_config():
     optim.decay_rate = 0.9
     optim.decay_steps = 2000
     optim.grad_accum_steps = 0
+    optim.num_microbatches = 1
 
     # Training
     config.training = training = ml_collections.ConfigDict()
@@ -51,11 +55,19 @@ def get_config():
     weighting.scheme = None
     weighting.init_weights = ml_collections.ConfigDict({"ics": 1.0, "res": 1.0})
     weighting.momentum = 0.9
+    weighting.running_average = "weights"
     weighting.update_every_steps = 1000
+    weighting.ntk_num_points = None
+    weighting.ntk_num_probes = None
+    weighting.ntk_chunk_size = None
+    weighting.temperature = 0.1
+    weighting.alpha = 0.999
+    weighting.lookback = 0.999
 
     weighting.use_causal = True
     weighting.causal_tol = 1.0
     weighting.num_chunks = 32
+    weighting.chunk_sampling = False
 
     # Logging
     config.logging = logging = ml_collections.ConfigDict()
@@ -72,6 +84,11 @@ def get_config():
     saving.save_every_steps = None
     saving.num_keep_ckpts = 10
 
+    # Parametric training
+    config.parametric = parametric = ml_collections.ConfigDict()
+    parametric.dom = None
+    parametric.log_scale = False
+
     # # Input shape for initializing Flax models
     config.input_dim = 2
 
@@ -5,7 +5,7 @@ from jax import lax, jit, grad, vmap
 
 from jaxpi.models import ForwardIVP
 from jaxpi.evaluator import BaseEvaluator
-from jaxpi.utils import ntk_fn, flatten_pytree
+from jaxpi.utils import flatten_pytree
 
 from matplotlib import pyplot as plt
 
@@ -23,73 +23,92 @@ class Advection(ForwardIVP):
         self.t1 = t_star[-1]
 
         # Predictions over a grid
-        self.u_pred_fn = vmap(vmap(self.u_net, (None, None, 0)), (None, 0, None))
-        self.r_pred_fn = vmap(vmap(self.r_net, (None, None, 0)), (None, 0, None))
+        self.u_pred_fn = vmap(
+            vmap(self.u_net, (None, None, 0, None)), (None, 0, None, None)
+        )
+        self.r_pred_fn = vmap(
+            vmap(self.r_net, (None, None, 0, None)), (None, 0, None, None)
+        )
 
-    def u_net(self, params, t, x):
-        z = jnp.stack([t, x])
+    def u_net(self, params, t, x, c):
+        # The advection speed is a network input for parametric training
+        z = jnp.stack([t, x, *self.coef_inputs(c)])
         u = self.state.apply_fn(params, z)
         return u[0]
 
-    def r_net(self, params, t, x):
-        u = self.u_net(params, t, x)
-        u_t = grad(self.u_net, argnums=1)(params, t, x)
-        u_x = grad(self.u_net, argnums=2)(params, t, x)
-        return u_t + self.c * u_x
+    def r_net(self, params, t, x, c):
+        u = self.u_net(params, t, x, c)
+        u_t = grad(self.u_net, argnums=1)(params, t, x, c)
+        u_x = grad(self.u_net, argnums=2)(params, t, x, c)
+        return u_t + c * u_x
 
-    @partial(jit, static_argnums=(0,))
-    def res_and_w(self, params, batch):
-        # Sort temporal coordinates for computing  temporal weights
-        t_sorted = batch[:, 0].sort()
+    def advection_speed(self, batch):
+        """Returns the advection speed of every residual point.
+
+        For parametric training the speeds are sampled with the residual points (the
+        last column of `batch`), otherwise every point uses the fixed speed `c`.
+        """
+        if self.coef_dom is None:
+            return jnp.full(batch.shape[0], self.c)
+        return batch[:, 2]
+
+    def causal_residuals(self, params, batch):
         # Compute residuals over the full domain
-        r_pred = vmap(self.r_net, (None, 0, 0))(params, t_sorted, batch[:, 1])
-        # Split residuals into chunks
-        r_pred = r_pred.reshape(self.num_chunks, -1)
-        l = jnp.mean(r_pred**2, axis=1)
-        # Compute temporal weights
-        w = lax.stop_gradient(jnp.exp(-self.tol * (self.M @ l)))
-        return l, w
+        c = self.advection_speed(batch)
+        r_pred = vmap(self.r_net, (None, 0, 0, 0))(params, batch[:, 0], batch[:, 1], c)
+        return (r_pred,)
 
     @partial(jit, static_argnums=(0,))
-    def losses(self, params, batch):
-        # Initial condition loss
-        u_pred = vmap(self.u_net, (None, None, 0))(params, self.t0, self.x_star)
+    def losses(self, params, batch, causal=None):
+        # Initial condition loss, the initial points reuse the sampled speeds
+        c = self.advection_speed(batch)
+        c_ics = jnp.resize(c, self.x_star.shape[0])
+        u_pred = vmap(self.u_net, (None, None, 0, 0))(params, self.t0, self.x_star, c_ics)
         ics_loss = jnp.mean((self.u0 - u_pred) ** 2)
 
         # Residual loss
         if self.config.weighting.use_causal == True:
-            l, w = self.res_and_w(params, batch)
-            res_loss = jnp.mean(l * w)
+            if causal is None:
+                causal = self.causal_terms(params, batch)
+            (l,) = causal["losses"]
+            res_loss = jnp.mean(l * causal["weights"])
         else:
-            r_pred = vmap(self.r_net, (None, 0, 0))(params, batch[:, 0], batch[:, 1])
+            r_pred = vmap(self.r_net, (None, 0, 0, 0))(
+                params, batch[:, 0], batch[:, 1], c
+            )
             res_loss = jnp.mean((r_pred) ** 2)
 
         loss_dict = {"ics": ics_loss, "res": res_loss}
         return loss_dict
 
     @partial(jit, static_argnums=(0,))
-    def compute_diag_ntk(self, params, batch):
-        ics_ntk = vmap(ntk_fn, (None, None, None, 0))(
-            self.u_net, params, self.t0, self.x_star
+    def compute_diag_ntk(self, params, batch, causal=None, key=None):
+        keys = self.ntk_keys(key)
+        c = self.advection_speed(batch)
+        c_ics = jnp.resize(c, self.x_star.shape[0])
+        ics_ntk = self.diag_ntk(
+            self.u_net, params, self.t0, self.x_star, c_ics, key=next(keys)
         )
 
         # Consider the effect of causal weights
         if self.config.weighting.use_causal:
-            # sort the time step for causal loss
-            batch = jnp.array([batch[:, 0].sort(), batch[:, 1]]).T
-            res_ntk = vmap(ntk_fn, (None, None, 0, 0))(
-                self.r_net, params, batch[:, 0], batch[:, 1]
+            if causal is None:
+                causal = self.causal_terms(params, batch)
+            # the points in time order for the causal chunks, with their speeds
+            batch = causal["batch"]
+            res_ntk = self.diag_ntk(
+                self.r_net,
+                params,
+                batch[:, 0],
+                batch[:, 1],
+                self.advection_speed(batch),
+                key=next(keys),
             )
-
-            res_ntk = res_ntk.reshape(self.num_chunks, -1)  # shape: (num_chunks, -1)
-            res_ntk = jnp.mean(
-                res_ntk, axis=1
-            )  # average convergence rate over each chunk
-            _, casual_weights = self.res_and_w(params, batch)
-            res_ntk = res_ntk * casual_weights  # multiply by causal weights
+            # average convergence rate over each chunk, times the causal weights
+            res_ntk = self.causal_ntk(res_ntk, causal)
         else:
-            res_ntk = vmap(ntk_fn, (None, None, 0, 0))(
-                self.r_net, params, batch[:, 0], batch[:, 1]
+            res_ntk = self.diag_ntk(
+                self.r_net, params, batch[:, 0], batch[:, 1], c, key=next(keys)
             )
 
         ntk_dict = {"ics": ics_ntk, "res": res_ntk}
@@ -97,8 +116,8 @@ class Advection(ForwardIVP):
         return ntk_dict
 
     @partial(jit, static_argnums=(0,))
-    def compute_l2_error(self, params, u_test):
-        u_pred = self.u_pred_fn(params, self.t_star, self.x_star)
+    def compute_l2_error(self, params, u_test, c):
+        u_pred = self.u_pred_fn(params, self.t_star, self.x_star, c)
         error = jnp.linalg.norm(u_pred - u_test) / jnp.linalg.norm(u_test)
         return error
 
@@ -108,11 +127,14 @@ class AdvectionEvaluator(BaseEvaluator):
         super().__init__(config, model)
 
     def log_errors(self, params, u_ref):
-        l2_error = self.model.compute_l2_error(params, u_ref)
+        # A parametric model is queried at the speed of the reference solution
+        l2_error = self.model.compute_l2_error(params, u_ref, self.model.c)
         self.log_dict["l2_error"] = l2_error
 
     def log_preds(self, params):
-        u_pred = self.model.u_pred_fn(params, self.model.t_star, self.model.x_star)
+        u_pred = self.model.u_pred_fn(
+            params, self.model.t_star, self.model.x_star, self.model.c
+        )
         fig = plt.figure(figsize=(6, 5))
         plt.imshow(u_pred.T, cmap="jet")
         self.log_dict["u_pred"] = fig
@@ -121,10 +143,6 @@ class AdvectionEvaluator(BaseEvaluator):
     def __call__(self, state, batch, u_ref):
         self.log_dict = super().__call__(state, batch)
 
-        if self.config.weighting.use_causal:
-            _, causal_weight = self.model.res_and_w(state.params, batch)
-            self.log_dict["cas_weight"] = causal_weight.min()
-
         if self.config.logging.log_errors:
             self.log_errors(state.params, u_ref)
 
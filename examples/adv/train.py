@@ -10,8 +10,9 @@ import ml_collections
 # from absl import logging
 import wandb
 
-from jaxpi.samplers import UniformSampler
+from jaxpi.samplers import UniformSampler, ParametricSampler, CausalChunkSampler
 from jaxpi.logging import Logger
+from jaxpi.parallel import unreplicate
 from jaxpi.utils import save_checkpoint
 
 import models
@@ -48,7 +49,21 @@ def train_and_evaluate(config: ml_collections.ConfigDict, workdir: str):
     # Initialize model
     model = models.Advection(config, u0, t_star, x_star, c)
     # Initialize residual sampler
-    res_sampler = iter(UniformSampler(dom, config.training.batch_size_per_device))
+    res_sampler = UniformSampler(dom, config.training.batch_size_per_device)
+
+    # Sample an advection speed for every residual point for parametric training
+    if model.coef_dom is not None:
+        res_sampler = ParametricSampler(
+            res_sampler, config.parametric.dom, log_scale=config.parametric.log_scale
+        )
+
+    # Stratify the residual times over the causal chunks, in chunk order
+    if config.weighting.use_causal and config.weighting.chunk_sampling:
+        res_sampler = CausalChunkSampler(
+            res_sampler, dom[0], config.weighting.num_chunks
+        )
+
+    res_sampler = iter(res_sampler)
 
     evaluator = models.AdvectionEvaluator(config, model)
 
@@ -60,7 +75,7 @@ def train_and_evaluate(config: ml_collections.ConfigDict, workdir: str):
         model.state = model.step(model.state, batch)
 
         # Update weights
-        if config.weighting.scheme in ["grad_norm", "ntk"]:
+        if config.weighting.scheme in ["grad_norm", "ntk", "lr_annealing"]:
             if step % config.weighting.update_every_steps == 0:
                 model.state = model.update_weights(model.state, batch)
 
@@ -68,8 +83,8 @@ def train_and_evaluate(config: ml_collections.ConfigDict, workdir: str):
         if jax.process_index() == 0:
             if step % config.logging.log_every_steps == 0:
                 # Get the first replica of the state and batch
-                state = jax.device_get(tree_map(lambda x: x[0], model.state))
-                batch = jax.device_get(tree_map(lambda x: x[0], batch))
+                state = jax.device_get(unreplicate(model.state))
+                batch = jax.device_get(unreplicate(batch))
 
                 log_dict = evaluator(state, batch, u_ref)
                 wandb.log(log_dict, step)
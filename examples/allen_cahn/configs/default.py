@@ -22,6 +22,9 @@ def get_config():
     arch.hidden_dim = 256
     arch.out_dim = 1
     arch.activation = "tanh"
+    arch.remat = "none"  # or "per_layer", "dots_saveable" to recompute activations
+    arch.compute_dtype = None  # e.g. "bfloat16" for the hidden matmuls
+    arch.matmul_precision = None  # e.g. "default" for tf32 hidden matmuls on GPU
     arch.periodicity = ml_collections.ConfigDict(
         {"period": (jnp.pi,), "axis": (1,), "trainable": (False,)}
     )
@@ -40,22 +43,37 @@ def get_config():
     optim.decay_rate = 0.9
     optim.decay_steps = 2000
     optim.grad_accum_steps = 0
+    optim.num_microbatches = 1
 
     # Training
     config.training = training = ml_collections.ConfigDict()
     training.max_steps = 200000
     training.batch_size_per_device = 4096
+    training.steps_per_call = 1  # > 1 fuses steps into one lax.scan
+    training.res_sampler = "uniform"  # "sobol", "halton", "lhs", or "rad" (residual-adaptive)
+    training.rad = ml_collections.ConfigDict(
+        {"pool_size": 65536, "k": 1.0, "c": 1.0, "refresh_every_steps": 1000}
+    )
 
     # Weighting
     config.weighting = weighting = ml_collections.ConfigDict()
     weighting.scheme = "grad_norm"
     weighting.init_weights = ml_collections.ConfigDict({"ics": 1.0, "res": 1.0})
     weighting.momentum = 0.9
+    weighting.running_average = "weights"  # or "grad_norms": reweight at every step
     weighting.update_every_steps = 1000
+    weighting.ntk_num_points = None  # points per NTK loss term, None for all
+    weighting.ntk_num_probes = None  # random JVP probes, None for exact NTK
+    weighting.ntk_chunk_size = None  # points per exact NTK pass, None for all at once
+    # Temperature of SoftAdapt and ReLoBRaLo, which reweight every step from the losses
+    weighting.temperature = 0.1
+    weighting.alpha = 0.999  # ReLoBRaLo weight of the history
+    weighting.lookback = 0.999  # ReLoBRaLo probability of keeping the history
 
     weighting.use_causal = True
     weighting.causal_tol = 1.0
     weighting.num_chunks = 32
+    weighting.chunk_sampling = False  # draw residual points per causal chunk, no sort
 
     # Logging
     config.logging = logging = ml_collections.ConfigDict()
@@ -72,6 +90,28 @@ def get_config():
     saving.save_every_steps = None
     saving.num_keep_ckpts = 10
 
+    # Parallelism: "pmap" over local devices or "sharding" over a global device mesh
+    config.parallel = parallel = ml_collections.ConfigDict()
+    parallel.backend = "pmap"
+
+    # Compilation
+    config.compilation = compilation = ml_collections.ConfigDict()
+    compilation.cache_dir = None  # persistent XLA cache directory, e.g. "~/.cache/jaxpi"
+    compilation.min_compile_time_secs = 1.0
+
+    # Population: train `size` members with one vmapped step, None for a single model
+    config.population = population = ml_collections.ConfigDict()
+    population.size = None
+    population.seeds = None  # per member, defaults to seed, seed + 1, ...
+    population.learning_rates = None  # per member, defaults to optim.learning_rate
+    population.causal_tols = None  # per member, defaults to weighting.causal_tol
+    population.momentums = None  # per member, defaults to weighting.momentum
+
+    # Parametric training, sample eps and k per residual point over dom
+    config.parametric = parametric = ml_collections.ConfigDict()
+    parametric.dom = None  # e.g. [[5e-5, 2e-4], [4.0, 6.0]]
+    parametric.log_scale = True
+
     # Input shape for initializing Flax models
     config.input_dim = 2
 
@@ -22,6 +22,9 @@ def get_config():
     arch.hidden_dim = 256
     arch.out_dim = 1
     arch.activation = "tanh"
+    arch.remat = "none"
+    arch.compute_dtype = None
+    arch.matmul_precision = None
     arch.periodicity = ml_collections.ConfigDict(
         {"period": (jnp.pi,), "axis": (1,), "trainable": (False,)}
     )
@@ -40,22 +43,36 @@ def get_config():
     optim.decay_rate = 0.9
     optim.decay_steps = 2000
     optim.grad_accum_steps = 0
+    optim.num_microbatches = 1
 
     # Training
     config.training = training = ml_collections.ConfigDict()
     training.max_steps = 200000
     training.batch_size_per_device = 4096
+    training.steps_per_call = 1
+    training.res_sampler = "uniform"
+    training.rad = ml_collections.ConfigDict(
+        {"pool_size": 65536, "k": 1.0, "c": 1.0, "refresh_every_steps": 1000}
+    )
 
     # Weighting
     config.weighting = weighting = ml_collections.ConfigDict()
     weighting.scheme = "grad_norm"
     weighting.init_weights = ml_collections.ConfigDict({"ics": 1.0, "res": 1.0})
     weighting.momentum = 0.9
+    weighting.running_average = "weights"
     weighting.update_every_steps = 1000
+    weighting.ntk_num_points = None
+    weighting.ntk_num_probes = None
+    weighting.ntk_chunk_size = None
+    weighting.temperature = 0.1
+    weighting.alpha = 0.999
+    weighting.lookback = 0.999
 
     weighting.use_causal = None
     weighting.causal_tol = 1.0
     weighting.num_chunks = 32
+    weighting.chunk_sampling = False
 
     # Logging
     config.logging = logging = ml_collections.ConfigDict()
@@ -72,6 +89,28 @@ def get_config():
     saving.save_every_steps = None
     saving.num_keep_ckpts = 10
 
+    # Parallelism
+    config.parallel = parallel = ml_collections.ConfigDict()
+    parallel.backend = "pmap"
+
+    # Compilation
+    config.compilation = compilation = ml_collections.ConfigDict()
+    compilation.cache_dir = None
+    compilation.min_compile_time_secs = 1.0
+
+    # Population
+    config.population = population = ml_collections.ConfigDict()
+    population.size = None
+    population.seeds = None
+    population.learning_rates = None
+    population.causal_tols = None
+    population.momentums = None
+
+    # Parametric training
+    config.parametric = parametric = ml_collections.ConfigDict()
+    parametric.dom = None
+    parametric.log_scale = True
+
     # Input shape for initializing Flax models
     config.input_dim = 2
 
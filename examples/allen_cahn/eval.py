@@ -23,10 +23,10 @@ def evaluate(config: ml_collections.ConfigDict, workdir: str):
     params = model.state.params
 
     # Compute L2 error
-    l2_error = model.compute_l2_error(params, u_ref)
+    l2_error = model.compute_l2_error(params, u_ref, model.eps, model.k)
     print("L2 error: {:.3e}".format(l2_error))
 
-    u_pred = model.u_pred_fn(params, model.t_star, model.x_star)
+    u_pred = model.u_pred_fn(params, model.t_star, model.x_star, model.eps, model.k)
     TT, XX = jnp.meshgrid(t_star, x_star, indexing="ij")
 
     # plot
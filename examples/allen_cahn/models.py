@@ -5,7 +5,7 @@ from jax import lax, jit, grad, vmap
 
 from jaxpi.models import ForwardIVP
 from jaxpi.evaluator import BaseEvaluator
-from jaxpi.utils import ntk_fn, flatten_pytree
+from jaxpi.utils import flatten_pytree
 
 from matplotlib import pyplot as plt
 
@@ -21,73 +21,104 @@ class AllenCahn(ForwardIVP):
         self.t0 = t_star[0]
         self.t1 = t_star[-1]
 
+        # Diffusion and reaction coefficients of u_t = eps * u_xx + k * (u - u^3)
+        self.eps = 0.0001
+        self.k = 5.0
+
         # Predictions over a grid
-        self.u_pred_fn = vmap(vmap(self.u_net, (None, None, 0)), (None, 0, None))
-        self.r_pred_fn = vmap(vmap(self.r_net, (None, None, 0)), (None, 0, None))
+        self.u_pred_fn = vmap(
+            vmap(self.u_net, (None, None, 0, None, None)), (None, 0, None, None, None)
+        )
+        self.r_pred_fn = vmap(
+            vmap(self.r_net, (None, None, 0, None, None)), (None, 0, None, None, None)
+        )
 
-    def u_net(self, params, t, x):
-        z = jnp.stack([t, x])
+    def u_net(self, params, t, x, eps, k):
+        # The coefficients are network inputs for parametric training
+        z = jnp.stack([t, x, *self.coef_inputs(eps, k)])
         u = self.state.apply_fn(params, z)
         return u[0]
 
-    def r_net(self, params, t, x):
-        u = self.u_net(params, t, x)
-        u_t = grad(self.u_net, argnums=1)(params, t, x)
-        u_x = grad(self.u_net, argnums=2)(params, t, x)
-        u_xx = grad(grad(self.u_net, argnums=2), argnums=2)(params, t, x)
-        return u_t + 5 * u**3 - 5 * u - 0.0001 * u_xx
-
-    @partial(jit, static_argnums=(0,))
-    def res_and_w(self, params, batch):
-        "Compute residuals and weights for causal training"
-        # Sort time coordinates
-        t_sorted = batch[:, 0].sort()
-        r_pred = vmap(self.r_net, (None, 0, 0))(params, t_sorted, batch[:, 1])
-        # Split residuals into chunks
-        r_pred = r_pred.reshape(self.num_chunks, -1)
-        l = jnp.mean(r_pred**2, axis=1)
-        w = lax.stop_gradient(jnp.exp(-self.tol * (self.M @ l)))
-        return l, w
+    def r_net(self, params, t, x, eps, k):
+        u = self.u_net(params, t, x, eps, k)
+        u_t = grad(self.u_net, argnums=1)(params, t, x, eps, k)
+        u_x = grad(self.u_net, argnums=2)(params, t, x, eps, k)
+        u_xx = grad(grad(self.u_net, argnums=2), argnums=2)(params, t, x, eps, k)
+        return u_t + k * u**3 - k * u - eps * u_xx
+
+    def coefficients(self, batch):
+        """Returns the diffusion and reaction coefficients of every residual point.
+
+        For parametric training they are sampled with the residual points (the last
+        two columns of `batch`), otherwise every point uses the fixed `eps` and `k`.
+        """
+        if self.coef_dom is None:
+            n = batch.shape[0]
+            return jnp.full(n, self.eps), jnp.full(n, self.k)
+        return batch[:, 2], batch[:, 3]
+
+    def causal_residuals(self, params, batch):
+        eps, k = self.coefficients(batch)
+        r_pred = vmap(self.r_net, (None, 0, 0, 0, 0))(
+            params, batch[:, 0], batch[:, 1], eps, k
+        )
+        return (r_pred,)
 
     @partial(jit, static_argnums=(0,))
-    def losses(self, params, batch):
-        # Initial condition loss
-        u_pred = vmap(self.u_net, (None, None, 0))(params, self.t0, self.x_star)
+    def losses(self, params, batch, causal=None):
+        # Initial condition loss, the initial points reuse the sampled coefficients
+        eps, k = self.coefficients(batch)
+        eps_ics = jnp.resize(eps, self.x_star.shape[0])
+        k_ics = jnp.resize(k, self.x_star.shape[0])
+        u_pred = vmap(self.u_net, (None, None, 0, 0, 0))(
+            params, self.t0, self.x_star, eps_ics, k_ics
+        )
         ics_loss = jnp.mean((self.u0 - u_pred) ** 2)
 
         # Residual loss
         if self.config.weighting.use_causal == True:
-            l, w = self.res_and_w(params, batch)
-            res_loss = jnp.mean(l * w)
+            if causal is None:
+                causal = self.causal_terms(params, batch)
+            (l,) = causal["losses"]
+            res_loss = jnp.mean(l * causal["weights"])
         else:
-            r_pred = vmap(self.r_net, (None, 0, 0))(params, batch[:, 0], batch[:, 1])
+            r_pred = vmap(self.r_net, (None, 0, 0, 0, 0))(
+                params, batch[:, 0], batch[:, 1], eps, k
+            )
             res_loss = jnp.mean((r_pred) ** 2)
 
         loss_dict = {"ics": ics_loss, "res": res_loss}
         return loss_dict
 
     @partial(jit, static_argnums=(0,))
-    def compute_diag_ntk(self, params, batch):
-        ics_ntk = vmap(ntk_fn, (None, None, None, 0))(
-            self.u_net, params, self.t0, self.x_star
+    def compute_diag_ntk(self, params, batch, causal=None, key=None):
+        keys = self.ntk_keys(key)
+        eps, k = self.coefficients(batch)
+        eps_ics = jnp.resize(eps, self.x_star.shape[0])
+        k_ics = jnp.resize(k, self.x_star.shape[0])
+        ics_ntk = self.diag_ntk(
+            self.u_net, params, self.t0, self.x_star, eps_ics, k_ics, key=next(keys)
         )
 
         # Consider the effect of causal weights
         if self.config.weighting.use_causal:
-            # sort the time step for causal loss
-            batch = jnp.array([batch[:, 0].sort(), batch[:, 1]]).T
-            res_ntk = vmap(ntk_fn, (None, None, 0, 0))(
-                self.r_net, params, batch[:, 0], batch[:, 1]
+            if causal is None:
+                causal = self.causal_terms(params, batch)
+            # the points in time order for the causal chunks, with their coefficients
+            batch = causal["batch"]
+            res_ntk = self.diag_ntk(
+                self.r_net,
+                params,
+                batch[:, 0],
+                batch[:, 1],
+                *self.coefficients(batch),
+                key=next(keys),
             )
-            res_ntk = res_ntk.reshape(self.num_chunks, -1)  # shape: (num_chunks, -1)
-            res_ntk = jnp.mean(
-                res_ntk, axis=1
-            )  # average convergence rate over each chunk
-            _, casual_weights = self.res_and_w(params, batch)
-            res_ntk = res_ntk * casual_weights  # multiply by causal weights
+            # average convergence rate over each chunk, times the causal weights
+            res_ntk = self.causal_ntk(res_ntk, causal)
         else:
-            res_ntk = vmap(ntk_fn, (None, None, 0, 0))(
-                self.r_net, params, batch[:, 0], batch[:, 1]
+            res_ntk = self.diag_ntk(
+                self.r_net, params, batch[:, 0], batch[:, 1], eps, k, key=next(keys)
             )
 
         ntk_dict = {"ics": ics_ntk, "res": res_ntk}
@@ -95,8 +126,8 @@ class AllenCahn(ForwardIVP):
         return ntk_dict
 
     @partial(jit, static_argnums=(0,))
-    def compute_l2_error(self, params, u_test):
-        u_pred = self.u_pred_fn(params, self.t_star, self.x_star)
+    def compute_l2_error(self, params, u_test, eps, k):
+        u_pred = self.u_pred_fn(params, self.t_star, self.x_star, eps, k)
         error = jnp.linalg.norm(u_pred - u_test) / jnp.linalg.norm(u_test)
         return error
 
@@ -106,11 +137,16 @@ class AllenCanhEvaluator(BaseEvaluator):
         super().__init__(config, model)
 
     def log_errors(self, params, u_ref):
-        l2_error = self.model.compute_l2_error(params, u_ref)
+        # A parametric model is queried at the coefficients of the reference solution
+        l2_error = self.model.compute_l2_error(
+            params, u_ref, self.model.eps, self.model.k
+        )
         self.log_dict["l2_error"] = l2_error
 
     def log_preds(self, params):
-        u_pred = self.model.u_pred_fn(params, self.model.t_star, self.model.x_star)
+        u_pred = self.model.u_pred_fn(
+            params, self.model.t_star, self.model.x_star, self.model.eps, self.model.k
+        )
         fig = plt.figure(figsize=(6, 5))
         plt.imshow(u_pred.T, cmap="jet")
         self.log_dict["u_pred"] = fig
@@ -119,10 +155,6 @@ class AllenCanhEvaluator(BaseEvaluator):
     def __call__(self, state, batch, u_ref):
         self.log_dict = super().__call__(state, batch)
 
-        if self.config.weighting.use_causal:
-            _, causal_weight = self.model.res_and_w(state.params, batch)
-            self.log_dict["cas_weight"] = causal_weight.min()
-
         if self.config.logging.log_errors:
             self.log_errors(state.params, u_ref)
 
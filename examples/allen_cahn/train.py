@@ -3,14 +3,24 @@ import time
 
 import jax
 import jax.numpy as jnp
+from jax import vmap
 from jax.tree_util import tree_map
 
 import ml_collections
 from absl import logging
 import wandb
 
-from jaxpi.samplers import UniformSampler
+from jaxpi.samplers import (
+    UniformSampler,
+    SobolSampler,
+    HaltonSampler,
+    LatinHypercubeSampler,
+    ParametricSampler,
+    ResidualAdaptiveSampler,
+    CausalChunkSampler,
+)
 from jaxpi.logging import Logger
+from jaxpi.parallel import create_mesh, unreplicate
 from jaxpi.utils import save_checkpoint
 
 import models
@@ -38,33 +48,125 @@ def train_and_evaluate(config: ml_collections.ConfigDict, workdir: str):
     # Define domain
     dom = jnp.array([[t0, t1], [x0, x1]])
 
-    # Define residual sampler
-    res_sampler = iter(UniformSampler(dom, config.training.batch_size_per_device))
-
     # Initialize model
     model = models.AllenCahn(config, u0, t_star, x_star)
 
+    # Define residual sampler
+    mesh = create_mesh(config)
+
+    # Quasi-Monte Carlo samplers draw low-discrepancy points over the same domain
+    qmc_samplers = {
+        "sobol": SobolSampler,
+        "halton": HaltonSampler,
+        "lhs": LatinHypercubeSampler,
+    }
+
+    def create_sampler(batch_size):
+        sampler_cls = qmc_samplers.get(config.training.res_sampler, UniformSampler)
+        sampler = sampler_cls(dom, batch_size, mesh=mesh)
+
+        # Sample the coefficients for every residual point for parametric training
+        if config.parametric.dom is not None:
+            sampler = ParametricSampler(
+                sampler,
+                config.parametric.dom,
+                log_scale=config.parametric.log_scale,
+                mesh=mesh,
+            )
+
+        return sampler
+
+    if config.training.res_sampler in ["uniform", *qmc_samplers]:
+        sampler = create_sampler(config.training.batch_size_per_device)
+
+        # Stratify the residual times over the causal chunks, in chunk order
+        if config.weighting.use_causal and config.weighting.chunk_sampling:
+            sampler = CausalChunkSampler(
+                sampler, dom[0], config.weighting.num_chunks, mesh=mesh
+            )
+
+    elif config.training.res_sampler == "rad":
+        if config.training.steps_per_call > 1:
+            raise ValueError("The rad sampler requires training.steps_per_call = 1")
+        if config.weighting.use_causal and config.weighting.chunk_sampling:
+            raise ValueError("The rad sampler does not support weighting.chunk_sampling")
+
+        def residual_fn(params, batch):
+            eps, k = model.coefficients(batch)
+            return vmap(model.r_net, (None, 0, 0, 0, 0))(
+                params, batch[:, 0], batch[:, 1], eps, k
+            )
+
+        # Sample proportionally to the residuals over a pool of candidates
+        rad = config.training.rad
+        sampler = ResidualAdaptiveSampler(
+            create_sampler(rad.pool_size),
+            residual_fn,
+            config.training.batch_size_per_device,
+            k=rad.k,
+            c=rad.c,
+            mesh=mesh,
+        )
+
+    else:
+        raise NotImplementedError(
+            f"Residual sampler {config.training.res_sampler} not supported yet!"
+        )
+
+    res_sampler = iter(sampler)
+
     # Initialize evaluator
     evaluator = models.AllenCanhEvaluator(config, model)
 
+    # Number of optimizer steps fused into one compiled call
+    steps_per_call = config.training.steps_per_call
+
     print("Waiting for JIT...")
     start_time = time.time()
-    for step in range(config.training.max_steps):
-        batch = next(res_sampler)
-        model.state = model.step(model.state, batch)
-
-        if config.weighting.scheme in ["grad_norm", "ntk"]:
-            if step % config.weighting.update_every_steps == 0:
-                model.state = model.update_weights(model.state, batch)
+    for step in range(0, config.training.max_steps, steps_per_call):
+        if steps_per_call > 1:
+            model.state, _ = model.train_steps(model.state, steps_per_call, sampler)
+        else:
+            # Rescore the candidate pool of the rad sampler with the current model
+            if config.training.res_sampler == "rad":
+                if step % config.training.rad.refresh_every_steps == 0:
+                    sampler.refresh(model.state.params)
+
+            batch = next(res_sampler)
+            update = step % config.weighting.update_every_steps == 0
+
+            if config.weighting.scheme in ["grad_norm", "lr_annealing"] and update:
+                # Reuse the per-loss gradients for both the weights and the update
+                model.state = model.step_and_reweight(model.state, batch)
+            else:
+                model.state = model.step(model.state, batch)
+
+                if config.weighting.scheme == "ntk" and update:
+                    model.state = model.update_weights(model.state, batch)
 
         # Log training metrics, only use host 0 to record results
         if jax.process_index() == 0:
             if step % config.logging.log_every_steps == 0:
+                if steps_per_call > 1:
+                    batch = next(res_sampler)
+
                 # Get the first replica of the state and batch
-                state = jax.device_get(tree_map(lambda x: x[0], model.state))
-                batch = jax.device_get(tree_map(lambda x: x[0], batch))
-                log_dict = evaluator(state, batch, u_ref)
-                wandb.log(log_dict, step)
+                state = jax.device_get(unreplicate(model.state))
+                batch = jax.device_get(unreplicate(batch))
+                if model.population_size is None:
+                    log_dict = evaluator(state, batch, u_ref)
+                    wandb.log(log_dict, step)
+                else:
+                    # One entry per population member
+                    log_dict = evaluator.population(state, batch, u_ref)
+                    wandb.log(
+                        {
+                            f"member_{i}/{key}": value[i]
+                            for key, value in log_dict.items()
+                            for i in range(model.population_size)
+                        },
+                        step,
+                    )
 
                 end_time = time.time()
                 logger.log_iter(step, start_time, end_time, log_dict)
@@ -72,9 +174,9 @@ def train_and_evaluate(config: ml_collections.ConfigDict, workdir: str):
 
         # Saving
         if config.saving.save_every_steps is not None:
-            if (step + 1) % config.saving.save_every_steps == 0 or (
-                step + 1
-            ) == config.training.max_steps:
+            if (step + steps_per_call) % config.saving.save_every_steps == 0 or (
+                step + steps_per_call
+            ) >= config.training.max_steps:
                 ckpt_path = os.path.join(os.getcwd(), config.wandb.name, "ckpt")
                 save_checkpoint(model.state, ckpt_path, keep=config.saving.num_keep_ckpts)
 
@@ -25,6 +25,9 @@ def get_config():
     arch.hidden_dim = 256
     arch.out_dim = 3
     arch.activation = "tanh"  # gelu works better than tanh
+    arch.remat = "none"
+    arch.compute_dtype = None
+    arch.matmul_precision = None
     arch.periodicity = None
     arch.fourier_emb = ml_collections.ConfigDict(
         {"embed_scale": 10.0, "embed_dim": 256}
@@ -43,11 +46,16 @@ def get_config():
     optim.decay_rate = 0.9
     optim.decay_steps = 2000
     optim.grad_accum_steps = 0
+    optim.num_microbatches = 1
 
     # Training
     config.training = training = ml_collections.ConfigDict()
     training.max_steps = 100000
     training.batch_size_per_device = 4096
+    training.res_sampler = "nodes"
+    training.pool = ml_collections.ConfigDict(
+        {"size": None, "refresh_every_epochs": None, "point_weights_lr": None}
+    )
 
     # Weighting
     config.weighting = weighting = ml_collections.ConfigDict()
@@ -66,7 +74,14 @@ def get_config():
         }
     )
     weighting.momentum = 0.9
+    weighting.running_average = "weights"
     weighting.update_every_steps = 1000  # 100 for grad norm and 1000 for ntk
+    weighting.ntk_num_points = None
+    weighting.ntk_num_probes = None
+    weighting.ntk_chunk_size = None
+    weighting.temperature = 0.1
+    weighting.alpha = 0.999
+    weighting.lookback = 0.999
 
     # Logging
     config.logging = logging = ml_collections.ConfigDict()
@@ -7,7 +7,6 @@ from jax.flatten_util import ravel_pytree
 
 from jaxpi.models import ForwardBVP
 from jaxpi.evaluator import BaseEvaluator
-from jaxpi.utils import ntk_fn
 
 
 class NavierStokes2D(ForwardBVP):
@@ -111,7 +110,7 @@ class NavierStokes2D(ForwardBVP):
         return v_out
 
     @partial(jit, static_argnums=(0,))
-    def losses(self, params, batch):
+    def losses(self, params, batch, point_weights=None):
         # Inflow boundary conditions
         u_in_pred = self.u_pred_fn(
             params, self.inflow_coords[:, 0], self.inflow_coords[:, 1]
@@ -147,9 +146,11 @@ class NavierStokes2D(ForwardBVP):
             params, batch[:, 0], batch[:, 1]
         )
 
-        ru_loss = jnp.mean(ru_pred**2)
-        rv_loss = jnp.mean(rv_pred**2)
-        rc_loss = jnp.mean(rc_pred**2)
+        # Self-adaptive weights of the residual points, with a pool
+        w = 1.0 if point_weights is None else point_weights
+        ru_loss = jnp.mean(w * ru_pred**2)
+        rv_loss = jnp.mean(w * rv_pred**2)
+        rc_loss = jnp.mean(w * rc_pred**2)
 
         loss_dict = {
             "u_in": u_in_loss,
@@ -166,36 +167,61 @@ class NavierStokes2D(ForwardBVP):
         return loss_dict
 
     @partial(jit, static_argnums=(0,))
-    def compute_diag_ntk(self, params, batch):
-        u_in_ntk = vmap(ntk_fn, (None, None, 0, 0))(
-            self.u_net, params, self.inflow_coords[:, 0], self.inflow_coords[:, 1]
+    def compute_diag_ntk(self, params, batch, key=None):
+        keys = self.ntk_keys(key)
+        u_in_ntk = self.diag_ntk(
+            self.u_net,
+            params,
+            self.inflow_coords[:, 0],
+            self.inflow_coords[:, 1],
+            key=next(keys),
         )
-        v_in_ntk = vmap(ntk_fn, (None, None, 0, 0))(
-            self.v_net, params, self.inflow_coords[:, 0], self.inflow_coords[:, 1]
+        v_in_ntk = self.diag_ntk(
+            self.v_net,
+            params,
+            self.inflow_coords[:, 0],
+            self.inflow_coords[:, 1],
+            key=next(keys),
         )
 
-        u_out_ntk = vmap(ntk_fn, (None, None, 0, 0))(
-            self.u_out_net, params, self.outflow_coords[:, 0], self.outflow_coords[:, 1]
+        u_out_ntk = self.diag_ntk(
+            self.u_out_net,
+            params,
+            self.outflow_coords[:, 0],
+            self.outflow_coords[:, 1],
+            key=next(keys),
         )
-        v_out_ntk = vmap(ntk_fn, (None, None, 0, 0))(
-            self.v_out_net, params, self.outflow_coords[:, 0], self.outflow_coords[:, 1]
+        v_out_ntk = self.diag_ntk(
+            self.v_out_net,
+            params,
+            self.outflow_coords[:, 0],
+            self.outflow_coords[:, 1],
+            key=next(keys),
         )
 
-        u_noslip_ntk = vmap(ntk_fn, (None, None, 0, 0))(
-            self.u_net, params, self.noslip_coords[:, 0], self.noslip_coords[:, 1]
+        u_noslip_ntk = self.diag_ntk(
+            self.u_net,
+            params,
+            self.noslip_coords[:, 0],
+            self.noslip_coords[:, 1],
+            key=next(keys),
         )
-        v_noslip_ntk = vmap(ntk_fn, (None, None, 0, 0))(
-            self.v_net, params, self.noslip_coords[:, 0], self.noslip_coords[:, 1]
+        v_noslip_ntk = self.diag_ntk(
+            self.v_net,
+            params,
+            self.noslip_coords[:, 0],
+            self.noslip_coords[:, 1],
+            key=next(keys),
         )
 
-        ru_ntk = vmap(ntk_fn, (None, None, 0, 0))(
-            self.ru_net, params, batch[:, 0], batch[:, 1]
+        ru_ntk = self.diag_ntk(
+            self.ru_net, params, batch[:, 0], batch[:, 1], key=next(keys)
         )
-        rv_ntk = vmap(ntk_fn, (None, None, 0, 0))(
-            self.rv_net, params, batch[:, 0], batch[:, 1]
+        rv_ntk = self.diag_ntk(
+            self.rv_net, params, batch[:, 0], batch[:, 1], key=next(keys)
         )
-        rc_ntk = vmap(ntk_fn, (None, None, 0, 0))(
-            self.rc_net, params, batch[:, 0], batch[:, 1]
+        rc_ntk = self.diag_ntk(
+            self.rc_net, params, batch[:, 0], batch[:, 1], key=next(keys)
         )
 
         ntk_dict = {
@@ -15,12 +15,13 @@ import wandb
 
 import matplotlib.pyplot as plt
 
-from jaxpi.samplers import SpaceSampler
+from jaxpi.samplers import SpaceSampler, MeshSampler, PoolSampler
 from jaxpi.logging import Logger
+from jaxpi.parallel import unreplicate
 from jaxpi.utils import save_checkpoint
 
 import models
-from utils import get_dataset, inflow_profile
+from utils import get_dataset, get_cells, inflow_profile
 
 
 def train_and_evaluate(config: ml_collections.ConfigDict, workdir: str):
@@ -43,6 +44,10 @@ def train_and_evaluate(config: ml_collections.ConfigDict, workdir: str):
         nu,
     ) = get_dataset()
 
+    # Mesh cells, the node indices are unaffected by the nondimensionalization
+    if config.training.res_sampler == "cells":
+        cells = get_cells()
+
     u_inflow, _ = inflow_profile(inflow_coords[:, 1])
 
     # Nondimensionalization
@@ -67,8 +72,33 @@ def train_and_evaluate(config: ml_collections.ConfigDict, workdir: str):
     # Initialize evaluator
     evaluator = models.NavierStokesEvaluator(config, model)
 
-    # Initialize  residual sampler
-    res_sampler = iter(SpaceSampler(coords, config.training.batch_size_per_device))
+    # Initialize residual sampler, with a pool it draws the pool that the minibatches
+    # are then iterated from
+    pool = config.training.pool
+    batch_size = config.training.batch_size_per_device
+    if pool.size is not None:
+        batch_size = pool.size
+
+    if config.training.res_sampler == "nodes":
+        res_sampler = SpaceSampler(coords, batch_size)
+
+    elif config.training.res_sampler == "cells":
+        res_sampler = MeshSampler(coords, cells, batch_size)
+
+    else:
+        raise NotImplementedError(
+            f"Residual sampler {config.training.res_sampler} not supported yet!"
+        )
+
+    if pool.size is not None:
+        res_sampler = PoolSampler(
+            res_sampler,
+            config.training.batch_size_per_device,
+            pool.refresh_every_epochs,
+            with_indices=pool.point_weights_lr is not None,
+        )
+
+    res_sampler = iter(res_sampler)
 
     # jit warm up
     print("Waiting for JIT...")
@@ -78,7 +108,7 @@ def train_and_evaluate(config: ml_collections.ConfigDict, workdir: str):
         model.state = model.step(model.state, batch)
 
         # Update weights if necessary
-        if config.weighting.scheme in ["grad_norm", "ntk"]:
+        if config.weighting.scheme in ["grad_norm", "ntk", "lr_annealing"]:
             if step % config.weighting.update_every_steps == 0:
                 model.state = model.update_weights(model.state, batch)
 
@@ -86,8 +116,10 @@ def train_and_evaluate(config: ml_collections.ConfigDict, workdir: str):
         if jax.process_index() == 0:
             if step % config.logging.log_every_steps == 0:
                 # Get the first replica of the state and batch
-                state = jax.device_get(tree_map(lambda x: x[0], model.state))
-                batch = jax.device_get(tree_map(lambda x: x[0], batch))
+                state = jax.device_get(unreplicate(model.state))
+                batch = jax.device_get(unreplicate(batch))
+                if pool.point_weights_lr is not None:
+                    batch, _ = batch  # drop the pool indices
                 log_dict = evaluator(state, batch, coords, u_ref, v_ref)
                 wandb.log(log_dict, step)
 
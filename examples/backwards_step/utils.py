@@ -3,6 +3,8 @@ import jax.numpy as jnp
 import scipy.io
 import pyvista as pv
 
+from jaxpi.geometry import Segment
+
 
 def inflow_profile(y):
     u = jnp.where(y > 0, 24 * y * (0.5 - y), 0)
@@ -17,28 +19,11 @@ def get_dataset():
     v_ref = jnp.array(data["Velocity"][:, 1])
     p_ref = jnp.array(data["Pressure"])
     coords = jnp.array(data.points)
-    inflow_coords = jnp.concatenate(
-        [jnp.zeros(100).reshape(-1, 1), jnp.linspace(-0.5, 0.5, 100).reshape(-1, 1)],
-        axis=1,
-    )
-    outflow_coords = jnp.concatenate(
-        [
-            15 * jnp.ones(100).reshape(-1, 1),
-            jnp.linspace(-0.5, 0.5, 100).reshape(-1, 1),
-        ],
-        axis=1,
-    )
-    top_wall_coords = jnp.concatenate(
-        [jnp.linspace(0, 15, 1500).reshape(-1, 1), 0.5 * jnp.ones(1500).reshape(-1, 1)],
-        axis=1,
-    )
-    bot_wall_coords = jnp.concatenate(
-        [
-            jnp.linspace(0, 15, 1500).reshape(-1, 1),
-            -0.5 * jnp.ones(1500).reshape(-1, 1),
-        ],
-        axis=1,
-    )
+    # Sides of the channel [0, 15] x [-0.5, 0.5]
+    inflow_coords = Segment((0, -0.5), (0, 0.5)).boundary_grid(100)
+    outflow_coords = Segment((15, -0.5), (15, 0.5)).boundary_grid(100)
+    top_wall_coords = Segment((0, 0.5), (15, 0.5)).boundary_grid(1500)
+    bot_wall_coords = Segment((0, -0.5), (15, -0.5)).boundary_grid(1500)
     wall_coords = jnp.concatenate([top_wall_coords, bot_wall_coords], axis=0)
     nu = 1.0 / 800.0
 
@@ -52,3 +37,11 @@ def get_dataset():
         wall_coords,
         nu,
     )
+
+
+def get_cells():
+    """Triangulates the cells of the FEM mesh, indexing the same points as `get_dataset`"""
+    reader = pv.get_reader("./data/flow.vtu")
+    data = reader.read().triangulate()
+    cells = jnp.array(data.cells_dict[pv.CellType.TRIANGLE])
+    return cells
@@ -5,7 +5,7 @@ from jax import lax, jit, grad, vmap, jacrev
 
 from jaxpi.models import ForwardIVP
 from jaxpi.evaluator import BaseEvaluator
-from jaxpi.utils import ntk_fn, flatten_pytree
+from jaxpi.utils import flatten_pytree
 
 from matplotlib import pyplot as plt
 
@@ -43,28 +43,22 @@ class Burgers(ForwardIVP):
         u_xx = grad(grad(self.u_net, argnums=2), argnums=2)(params, t, x)
         return u_t + u * u_x - 0.01 / jnp.pi * u_xx
 
-    @partial(jit, static_argnums=(0,))
-    def res_and_w(self, params, batch):
-        "Compute residuals and weights for causal training"
-        # Sort time coordinates
-        t_sorted = batch[:, 0].sort()
-        r_pred = vmap(self.r_net, (None, 0, 0))(params, t_sorted, batch[:, 1])
-        # Split residuals into chunks
-        r_pred = r_pred.reshape(self.num_chunks, -1)
-        l = jnp.mean(r_pred**2, axis=1)
-        w = lax.stop_gradient(jnp.exp(-self.tol * (self.M @ l)))
-        return l, w
+    def causal_residuals(self, params, batch):
+        r_pred = vmap(self.r_net, (None, 0, 0))(params, batch[:, 0], batch[:, 1])
+        return (r_pred,)
 
     @partial(jit, static_argnums=(0,))
-    def losses(self, params, batch):
+    def losses(self, params, batch, causal=None):
         # Initial condition loss
         u_pred = vmap(self.u_net, (None, None, 0))(params, self.t0, self.x_star)
         ics_loss = jnp.mean((self.u0 - u_pred) ** 2)
 
         # Residual loss
         if self.config.weighting.use_causal == True:
-            l, w = self.res_and_w(params, batch)
-            res_loss = jnp.mean(l * w)
+            if causal is None:
+                causal = self.causal_terms(params, batch)
+            (l,) = causal["losses"]
+            res_loss = jnp.mean(l * causal["weights"])
         else:
             r_pred = vmap(self.r_net, (None, 0, 0))(params, batch[:, 0], batch[:, 1])
             res_loss = jnp.mean((r_pred) ** 2)
@@ -73,27 +67,26 @@ class Burgers(ForwardIVP):
         return loss_dict
 
     @partial(jit, static_argnums=(0,))
-    def compute_diag_ntk(self, params, batch):
-        ics_ntk = vmap(ntk_fn, (None, None, None, 0))(
-            self.u_net, params, self.t0, self.x_star
+    def compute_diag_ntk(self, params, batch, causal=None, key=None):
+        keys = self.ntk_keys(key)
+        ics_ntk = self.diag_ntk(
+            self.u_net, params, self.t0, self.x_star, key=next(keys)
         )
 
         # Consider the effect of causal weights
         if self.config.weighting.use_causal:
-            # sort the time step for causal loss
-            batch = jnp.array([batch[:, 0].sort(), batch[:, 1]]).T
-            res_ntk = vmap(ntk_fn, (None, None, 0, 0))(
-                self.r_net, params, batch[:, 0], batch[:, 1]
+            if causal is None:
+                causal = self.causal_terms(params, batch)
+            # the points in time order for the causal chunks
+            batch = causal["batch"]
+            res_ntk = self.diag_ntk(
+                self.r_net, params, batch[:, 0], batch[:, 1], key=next(keys)
             )
-            res_ntk = res_ntk.reshape(self.num_chunks, -1)  # shape: (num_chunks, -1)
-            res_ntk = jnp.mean(
-                res_ntk, axis=1
-            )  # average convergence rate over each chunk
-            _, casual_weights = self.res_and_w(params, batch)
-            res_ntk = res_ntk * casual_weights  # multiply by causal weights
+            # average convergence rate over each chunk, times the causal weights
+            res_ntk = self.causal_ntk(res_ntk, causal)
         else:
-            res_ntk = vmap(ntk_fn, (None, None, 0, 0))(
-                self.r_net, params, batch[:, 0], batch[:, 1]
+            res_ntk = self.diag_ntk(
+                self.r_net, params, batch[:, 0], batch[:, 1], key=next(keys)
             )
 
         ntk_dict = {"ics": ics_ntk, "res": res_ntk}
@@ -126,10 +119,6 @@ class BurgersEvaluator(BaseEvaluator):
     def __call__(self, state, batch, u_ref):
         self.log_dict = super().__call__(state, batch)
 
-        if self.config.weighting.use_causal:
-            _, causal_weight = self.model.res_and_w(state.params, batch)
-            self.log_dict["cas_weight"] = causal_weight.min()
-
         if self.config.logging.log_errors:
             self.log_errors(state.params, u_ref)
 
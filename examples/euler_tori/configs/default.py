@@ -22,6 +22,9 @@ def get_config():
     arch.hidden_dim = 256
     arch.out_dim = 4
     arch.activation = "tanh"
+    arch.remat = "none"  # or "per_layer", "dots_saveable" to recompute activations
+    arch.compute_dtype = None  # e.g. "bfloat16" for the hidden matmuls
+    arch.matmul_precision = None  # e.g. "default" for tf32 hidden matmuls on GPU
     arch.periodicity = ml_collections.ConfigDict(
         {
             "period": (2 * jnp.pi, 2 * jnp.pi),
@@ -44,6 +47,7 @@ def get_config():
     optim.decay_rate = 0.9
     optim.decay_steps = 2000
     optim.grad_accum_steps = 0
+    optim.num_microbatches = 1
 
     # Training
     config.training = training = ml_collections.ConfigDict()
@@ -65,11 +69,20 @@ def get_config():
         }
     )
     weighting.momentum = 0.9
+    weighting.running_average = "weights"  # or "grad_norms": reweight at every step
     weighting.update_every_steps = 1000
+    weighting.ntk_num_points = None  # points per NTK loss term, None for all
+    weighting.ntk_num_probes = None  # random JVP probes, None for exact NTK
+    weighting.ntk_chunk_size = None  # points per exact NTK pass, None for all at once
+    # Temperature of SoftAdapt and ReLoBRaLo, which reweight every step from the losses
+    weighting.temperature = 0.1
+    weighting.alpha = 0.999  # ReLoBRaLo weight of the history
+    weighting.lookback = 0.999  # ReLoBRaLo probability of keeping the history
 
     weighting.use_causal = True
     weighting.causal_tol = 1.0
     weighting.num_chunks = 16
+    weighting.chunk_sampling = False  # draw residual points per causal chunk, no sort
 
     # Logging
     config.logging = logging = ml_collections.ConfigDict()
@@ -15,7 +15,7 @@ import optax
 
 from jaxpi import archs
 from jaxpi.models import ForwardIVP
-from jaxpi.utils import jacobian_fn, ntk_fn
+from jaxpi.utils import jacobian_fn
 from jaxpi.evaluator import BaseEvaluator
 
 from utils import u0_v0_rho0
@@ -103,84 +103,102 @@ class Euler(ForwardIVP):
         _, _, _, rd = self.r_net(params, t, x, y)
         return rd
 
-    @partial(jit, static_argnums=(0,))
-    def res_and_w(self, params, batch):
-        t_sorted = batch[:, 0].sort()
+    def causal_residuals(self, params, batch):
         ru_pred, rv_pred, rc_pred, rd_pred = self.r_pred_fn(
-            params, t_sorted, batch[:, 1], batch[:, 2]
+            params, batch[:, 0], batch[:, 1], batch[:, 2]
         )
-
-        ru_pred = ru_pred.reshape(self.num_chunks, -1)
-        rv_pred = rv_pred.reshape(self.num_chunks, -1)
-        rc_pred = rc_pred.reshape(self.num_chunks, -1)
-        rd_pred = rd_pred.reshape(self.num_chunks, -1)
-
-        l_ru = jnp.mean(ru_pred**2, axis=1)
-        l_rv = jnp.mean(rv_pred**2, axis=1)
-        l_rc = jnp.mean(rc_pred**2, axis=1)
-        l_rd = jnp.mean(rd_pred**2, axis=1)
-
-        gamma_ru = lax.stop_gradient(jnp.exp(-self.tol * (self.M @ l_ru)))
-        gamma_rv = lax.stop_gradient(jnp.exp(-self.tol * (self.M @ l_rv)))
-        gamma_rc = lax.stop_gradient(jnp.exp(-self.tol * (self.M @ l_rc)))
-        gamma_rd = lax.stop_gradient(jnp.exp(-self.tol * (self.M @ l_rd)))
-
-        gamma = jnp.vstack([gamma_ru, gamma_rv, gamma_rc, gamma_rd])
-        gamma = gamma.min(0)
-
-        return l_ru, l_rv, l_rc, l_rd, gamma
+        return ru_pred, rv_pred, rc_pred, rd_pred
 
     @partial(jit, static_argnums=(0,))
-    def compute_diag_ntk(self, params, batch):
-        u_ic_ntk = vmap(ntk_fn, (None, None, 0, 0, 0))(self.u_net, params, 0.0, self.xy[:, 0], self.xy[:, 1])
-        v_ic_ntk = vmap(ntk_fn, (None, None, 0, 0, 0))(self.v_net, params, 0.0, self.xy[:, 0], self.xy[:, 1])
-        rho_ic_ntk = vmap(ntk_fn, (None, None, 0, 0, 0))(self.rho_net, params, 0.0, self.xy[:, 0], self.xy[:, 1])
+    def compute_diag_ntk(self, params, batch, causal=None, key=None):
+        keys = self.ntk_keys(key)
+        u_ic_ntk = self.diag_ntk(
+            self.u_net, params, 0.0, self.xy[:, 0], self.xy[:, 1], key=next(keys)
+        )
+        v_ic_ntk = self.diag_ntk(
+            self.v_net, params, 0.0, self.xy[:, 0], self.xy[:, 1], key=next(keys)
+        )
+        rho_ic_ntk = self.diag_ntk(
+            self.rho_net, params, 0.0, self.xy[:, 0], self.xy[:, 1], key=next(keys)
+        )
 
         # Consider the effect of causal weights
         if self.config.weighting.use_causal:
-            # sort the time step for causal loss
-            batch = jnp.array([batch[:, 0].sort(), batch[:, 1], batch[:, 2]]).T
-            ru_ntk = vmap(ntk_fn, (None, None, 0, 0, 0))(
-                self.ru_net, params, batch[:, 0], batch[:, 1], batch[:, 2]
+            if causal is None:
+                causal = self.causal_terms(params, batch)
+            # the points in time order for the causal chunks
+            batch = causal["batch"]
+            ru_ntk = self.diag_ntk(
+                self.ru_net,
+                params,
+                batch[:, 0],
+                batch[:, 1],
+                batch[:, 2],
+                key=next(keys),
             )
-            rv_ntk = vmap(ntk_fn, (None, None, 0, 0, 0))(
-                self.rv_net, params, batch[:, 0], batch[:, 1], batch[:, 2]
+            rv_ntk = self.diag_ntk(
+                self.rv_net,
+                params,
+                batch[:, 0],
+                batch[:, 1],
+                batch[:, 2],
+                key=next(keys),
             )
-            rc_ntk = vmap(ntk_fn, (None, None, 0, 0, 0))(
-                self.rv_net, params, batch[:, 0], batch[:, 1], batch[:, 2]
+            rc_ntk = self.diag_ntk(
+                self.rv_net,
+                params,
+                batch[:, 0],
+                batch[:, 1],
+                batch[:, 2],
+                key=next(keys),
             )
-            rd_ntk = vmap(ntk_fn, (None, None, 0, 0, 0))(
-                self.rd_net, params, batch[:, 0], batch[:, 1], batch[:, 2]
+            rd_ntk = self.diag_ntk(
+                self.rd_net,
+                params,
+                batch[:, 0],
+                batch[:, 1],
+                batch[:, 2],
+                key=next(keys),
             )
 
-            ru_ntk = ru_ntk.reshape(self.num_chunks, -1)
-            rv_ntk = rv_ntk.reshape(self.num_chunks, -1)
-            rc_ntk = rc_ntk.reshape(self.num_chunks, -1)
-            rd_ntk = rd_ntk.reshape(self.num_chunks, -1)
-
-            ru_ntk = jnp.mean(ru_ntk, axis=1)
-            rv_ntk = jnp.mean(rv_ntk, axis=1)
-            rc_ntk = jnp.mean(rc_ntk, axis=1)
-            rd_ntk = jnp.mean(rd_ntk, axis=1)
-
-            _, _, _, _, casual_weights = self.res_and_w(params, batch)
-            ru_ntk = ru_ntk * casual_weights
-            rv_ntk = rv_ntk * casual_weights
-            rc_ntk = rc_ntk * casual_weights
-            rd_ntk = rd_ntk * casual_weights
+            # average convergence rate over each chunk, times the causal weights
+            ru_ntk = self.causal_ntk(ru_ntk, causal)
+            rv_ntk = self.causal_ntk(rv_ntk, causal)
+            rc_ntk = self.causal_ntk(rc_ntk, causal)
+            rd_ntk = self.causal_ntk(rd_ntk, causal)
 
         else:
-            ru_ntk = vmap(ntk_fn, (None, None, 0, 0, 0))(
-                self.ru_net, params, batch[:, 0], batch[:, 1], batch[:, 2]
+            ru_ntk = self.diag_ntk(
+                self.ru_net,
+                params,
+                batch[:, 0],
+                batch[:, 1],
+                batch[:, 2],
+                key=next(keys),
             )
-            rv_ntk = vmap(ntk_fn, (None, None, 0, 0, 0))(
-                self.rv_net, params, batch[:, 0], batch[:, 1], batch[:, 2]
+            rv_ntk = self.diag_ntk(
+                self.rv_net,
+                params,
+                batch[:, 0],
+                batch[:, 1],
+                batch[:, 2],
+                key=next(keys),
             )
-            rc_ntk = vmap(ntk_fn, (None, None, 0, 0, 0))(
-                self.rv_net, params, batch[:, 0], batch[:, 1], batch[:, 2]
+            rc_ntk = self.diag_ntk(
+                self.rv_net,
+                params,
+                batch[:, 0],
+                batch[:, 1],
+                batch[:, 2],
+                key=next(keys),
             )
-            rd_ntk = vmap(ntk_fn, (None, None, 0, 0, 0))(
-                self.rd_net, params, batch[:, 0], batch[:, 1], batch[:, 2]
+            rd_ntk = self.diag_ntk(
+                self.rd_net,
+                params,
+                batch[:, 0],
+                batch[:, 1],
+                batch[:, 2],
+                key=next(keys),
             )
 
         ntk_dict = {
@@ -196,7 +214,7 @@ class Euler(ForwardIVP):
         return ntk_dict
 
     @partial(jit, static_argnums=(0,))
-    def losses(self, params, batch):
+    def losses(self, params, batch, causal=None):
         # Initial condition losses
         u0_pred = vmap(self.u_net, (None, None, 0, 0))(
             params, 0.0, self.xy[:, 0], self.xy[:, 1]
@@ -215,7 +233,10 @@ class Euler(ForwardIVP):
 
         # Residual losses
         if self.config.weighting.use_causal == True:
-            ru_l, rv_l, rc_l, rd_l, gamma = self.res_and_w(params, batch)
+            if causal is None:
+                causal = self.causal_terms(params, batch)
+            ru_l, rv_l, rc_l, rd_l = causal["losses"]
+            gamma = causal["weights"]
             ru_loss = jnp.mean(ru_l * gamma)
             rv_loss = jnp.mean(rv_l * gamma)
             rc_loss = jnp.mean(rc_l * gamma)
@@ -281,10 +302,6 @@ class EulerEvaluator(BaseEvaluator):
         if self.config.logging.log_errors:
             self.log_errors(state.params, t, coords, u_ref, v_ref, rho_ref)
 
-        if self.config.weighting.use_causal:
-            _, _, _, _, causal_weight = self.model.res_and_w(state.params, batch)
-            self.log_dict["cas_weight"] = causal_weight.min()
-
         if self.config.logging.log_preds:
             self.log_preds()
 
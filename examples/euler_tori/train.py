@@ -12,8 +12,9 @@ import numpy as np
 import ml_collections
 import wandb
 
-from jaxpi.samplers import UniformSampler
+from jaxpi.samplers import UniformSampler, CausalChunkSampler
 from jaxpi.logging import Logger
+from jaxpi.parallel import unreplicate
 from jaxpi.utils import save_checkpoint
 
 import models
@@ -44,7 +45,15 @@ def train_and_evaluate(config: ml_collections.ConfigDict, workdir: str):
 
     dom = jnp.array([[t0, t1], [x0, x1], [y0, y1]])
 
-    res_sampler = iter(UniformSampler(dom, config.training.batch_size_per_device))
+    res_sampler = UniformSampler(dom, config.training.batch_size_per_device)
+
+    # Stratify the residual times over the causal chunks, in chunk order
+    if config.weighting.use_causal and config.weighting.chunk_sampling:
+        res_sampler = CausalChunkSampler(
+            res_sampler, dom[0], config.weighting.num_chunks
+        )
+
+    res_sampler = iter(res_sampler)
 
     # Set initial condition
     res = 128
@@ -64,7 +73,7 @@ def train_and_evaluate(config: ml_collections.ConfigDict, workdir: str):
         batch = next(res_sampler)
         model.state = model.step(model.state, batch)
 
-        if config.weighting.scheme in ["grad_norm", "ntk"]:
+        if config.weighting.scheme in ["grad_norm", "ntk", "lr_annealing"]:
             if step % config.weighting.update_every_steps == 0:
                 model.state = model.update_weights(model.state, batch)
 
@@ -72,8 +81,8 @@ def train_and_evaluate(config: ml_collections.ConfigDict, workdir: str):
         if jax.process_index() == 0:
             if step % config.logging.log_every_steps == 0:
                 # Get the first replica of the state and batch
-                state = jax.device_get(tree_map(lambda x: x[0], model.state))
-                batch = jax.device_get(tree_map(lambda x: x[0], batch))
+                state = jax.device_get(unreplicate(model.state))
+                batch = jax.device_get(unreplicate(batch))
                 log_dict = evaluator(state, batch, t, coords, u_ref, v_ref, rho_ref)
                 wandb.log(log_dict, step)
 
@@ -10,8 +10,9 @@ import ml_collections
 from absl import logging
 import wandb
 
-from jaxpi.samplers import UniformSampler
+from jaxpi.samplers import UniformSampler, CausalChunkSampler
 from jaxpi.logging import Logger
+from jaxpi.parallel import unreplicate
 from jaxpi.utils import save_checkpoint
 
 import models
@@ -32,7 +33,7 @@ def train_one_window(config, workdir, model, res_sampler, u_ref, idx):
         model.state = model.step(model.state, batch)
 
         # Update weights if necessary
-        if config.weighting.scheme in ["grad_norm", "ntk"]:
+        if config.weighting.scheme in ["grad_norm", "ntk", "lr_annealing"]:
             if step % config.weighting.update_every_steps == 0:
                 model.state = model.update_weights(model.state, batch)
 
@@ -40,8 +41,8 @@ def train_one_window(config, workdir, model, res_sampler, u_ref, idx):
         if jax.process_index() == 0:
             if step % config.logging.log_every_steps == 0:
                 # Get the first replica of the state and batch
-                state = jax.device_get(tree_map(lambda x: x[0], model.state))
-                batch = jax.device_get(tree_map(lambda x: x[0], batch))
+                state = jax.device_get(unreplicate(model.state))
+                batch = jax.device_get(unreplicate(batch))
                 log_dict = evaluator(state, batch, u_ref)
                 wandb.log(log_dict, step + step_offset)
 
@@ -82,7 +83,15 @@ def train_and_evaluate(config: ml_collections.ConfigDict, workdir: str):
     dom = jnp.array([[t0, t1], [x0, x1]])
 
     # Initialize the residual sampler
-    res_sampler = iter(UniformSampler(dom, config.training.batch_size))
+    res_sampler = UniformSampler(dom, config.training.batch_size)
+
+    # Stratify the residual times over the causal chunks, in chunk order
+    if config.weighting.use_causal and config.weighting.chunk_sampling:
+        res_sampler = CausalChunkSampler(
+            res_sampler, dom[0], config.weighting.num_chunks
+        )
+
+    res_sampler = iter(res_sampler)
 
     for idx in range(config.training.num_time_windows):
         print("Training time window {}".format(idx + 1))
@@ -97,7 +106,7 @@ def train_and_evaluate(config: ml_collections.ConfigDict, workdir: str):
 
         # Update the initial condition for the next time window
         if config.training.num_time_windows > 1:
-            state = jax.device_get(jax.tree_util.tree_map(lambda x: x[0], model.state))
+            state = jax.device_get(unreplicate(model.state))
             params = state.params
             u0 = vmap(model.u_net, (None, None, 0))(
                 params, t_star[num_time_steps], x_star
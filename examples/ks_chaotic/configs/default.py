@@ -25,6 +25,9 @@ def get_config():
     arch.hidden_dim = 256
     arch.out_dim = 1
     arch.activation = "tanh"
+    arch.remat = "none"  # or "per_layer", "dots_saveable" to recompute activations
+    arch.compute_dtype = None  # e.g. "bfloat16" for the hidden matmuls
+    arch.matmul_precision = None  # e.g. "default" for tf32 hidden matmuls on GPU
     arch.periodicity = ml_collections.ConfigDict(
         {"period": (1.0,), "axis": (1,), "trainable": (False,)}
     )
@@ -43,6 +46,7 @@ def get_config():
     optim.decay_rate = 0.9
     optim.decay_steps = 1000
     optim.grad_accum_steps = 0
+    optim.num_microbatches = 1
 
     config.training = training = ml_collections.ConfigDict()
     training.max_steps = 100000
@@ -54,11 +58,20 @@ def get_config():
     weighting.scheme = "grad_norm"
     weighting.init_weights = ml_collections.ConfigDict({"ics": 1.0, "res": 1.0})
     weighting.momentum = 0.9
+    weighting.running_average = "weights"  # or "grad_norms": reweight at every step
     weighting.update_every_steps = 1000
+    weighting.ntk_num_points = None  # points per NTK loss term, None for all
+    weighting.ntk_num_probes = None  # random JVP probes, None for exact NTK
+    weighting.ntk_chunk_size = None  # points per exact NTK pass, None for all at once
+    # Temperature of SoftAdapt and ReLoBRaLo, which reweight every step from the losses
+    weighting.temperature = 0.1
+    weighting.alpha = 0.999  # ReLoBRaLo weight of the history
+    weighting.lookback = 0.999  # ReLoBRaLo probability of keeping the history
 
     weighting.use_causal = True
     weighting.causal_tol = 1.0
     weighting.num_chunks = 16
+    weighting.chunk_sampling = False  # draw residual points per causal chunk, no sort
 
     # Logging
     config.logging = logging = ml_collections.ConfigDict()
@@ -75,6 +88,12 @@ def get_config():
     saving.save_every_steps = None
     saving.num_keep_ckpts = 10
 
+    # Compilation
+    config.compilation = compilation = ml_collections.ConfigDict()
+    compilation.cache_dir = None  # persistent XLA cache directory, e.g. "~/.cache/jaxpi"
+    compilation.min_compile_time_secs = 1.0
+    compilation.aot = True  # compile the train step before the first batch
+
     # # Input shape for initializing Flax models
     config.input_dim = 2
 
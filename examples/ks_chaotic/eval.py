@@ -20,7 +20,6 @@ def evaluate(config: ml_collections.ConfigDict, workdir: str):
     u_ref, t_star, x_star = get_dataset(config.time_fraction)
 
     u_ref = u_ref[:-1, :]
-    u0 = u_ref[0, :]
 
     num_time_steps = len(t_star) // config.training.num_time_windows
     t = t_star[:num_time_steps]
@@ -28,7 +27,7 @@ def evaluate(config: ml_collections.ConfigDict, workdir: str):
     # Initialize the model
     # Warning: t must be the same as the one used in training, otherwise the prediction will be wrong
     # This is because the input t is scaled inside the model forward pass
-    model = models.KS(config, u0, t, x_star)
+    model = models.KS(config, t, x_star)
 
     u_pred_list = []
     for idx in range(config.training.num_time_windows):
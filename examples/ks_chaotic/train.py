@@ -10,39 +10,43 @@ import ml_collections
 from absl import logging
 import wandb
 
-from jaxpi.samplers import UniformSampler
+from jaxpi.samplers import UniformSampler, CausalChunkSampler
 from jaxpi.logging import Logger
-from jaxpi.utils import save_checkpoint
+from jaxpi.parallel import replicate, unreplicate
+from jaxpi.utils import save_checkpoint, compilation_cache_stats
 
 import models
 from utils import get_dataset
 
 
-def train_one_window(config, workdir, model, res_sampler, u_ref, idx):
+def train_one_window(config, workdir, model, res_sampler, u0, u_ref, idx):
     logger = Logger()
 
     evaluator = models.KSEvaluator(config, model)
 
+    # The initial condition is passed to the compiled functions as a traced argument
+    u0_replicated = replicate(u0, model.mesh)
+
     step_offset = idx * config.training.max_steps
 
     print("Waiting for JIT...")
     start_time = time.time()
     for step in range(config.training.max_steps):
         batch = next(res_sampler)
-        model.state = model.step(model.state, batch)
+        model.state = model.step(model.state, batch, u0_replicated)
 
         # Update weights if necessary
-        if config.weighting.scheme in ["grad_norm", "ntk"]:
+        if config.weighting.scheme in ["grad_norm", "ntk", "lr_annealing"]:
             if step % config.weighting.update_every_steps == 0:
-                model.state = model.update_weights(model.state, batch)
+                model.state = model.update_weights(model.state, batch, u0_replicated)
 
         # Log training metrics, only use host 0 to record results
         if jax.process_index() == 0:
             if step % config.logging.log_every_steps == 0:
                 # Get the first replica of the state and batch
-                state = jax.device_get(tree_map(lambda x: x[0], model.state))
-                batch = jax.device_get(tree_map(lambda x: x[0], batch))
-                log_dict = evaluator(state, batch, u_ref)
+                state = jax.device_get(unreplicate(model.state))
+                batch = jax.device_get(unreplicate(batch))
+                log_dict = evaluator(state, batch, u0, u_ref)
                 wandb.log(log_dict, step + step_offset)
 
                 end_time = time.time()
@@ -84,25 +88,49 @@ def train_and_evaluate(config: ml_collections.ConfigDict, workdir: str):
     dom = jnp.array([[t0, t1], [x0, x1]])
 
     # Initialize the residual sampler
-    res_sampler = iter(UniformSampler(dom, config.training.batch_size))
+    res_sampler = UniformSampler(dom, config.training.batch_size)
+
+    # Stratify the residual times over the causal chunks, in chunk order
+    if config.weighting.use_causal and config.weighting.chunk_sampling:
+        res_sampler = CausalChunkSampler(
+            res_sampler, dom[0], config.weighting.num_chunks
+        )
+
+    # A single model serves all time windows, the initial condition of each window
+    # is a traced argument, so step, update_weights and losses are compiled once
+    model = models.KS(config, t, x_star)
+    init_state = model.state
+
+    # Compile the train step ahead of time for the shapes of the residual batches,
+    # shape-stable reruns load it from the cache
+    if config.compilation.aot:
+        start_time = time.time()
+        model.compile(model.state, res_sampler.batch_spec(), replicate(u0, model.mesh))
+        logging.info(
+            "Compiled train step in {:.2f}s, compilation cache {}".format(
+                time.time() - start_time, compilation_cache_stats()
+            )
+        )
+
+    res_sampler = iter(res_sampler)
 
     for idx in range(config.training.num_time_windows):
         print("Training time window {}".format(idx + 1))
         # Get the reference solution for the current time window
         u = u_ref[num_time_steps * idx : num_time_steps * (idx + 1), :]
 
-        # Initialize the model
-        model = models.KS(config, u0, t, x_star)
+        # Every time window starts from the initial parameters
+        model.state = init_state
 
         # Training the current time window
-        model = train_one_window(config, workdir, model, res_sampler, u, idx)
+        model = train_one_window(config, workdir, model, res_sampler, u0, u, idx)
 
         # Update the initial condition for the next time window
         if config.training.num_time_windows > 1:
-            state = jax.device_get(jax.tree_util.tree_map(lambda x: x[0], model.state))
+            state = jax.device_get(unreplicate(model.state))
             params = state.params
             u0 = vmap(model.u_net, (None, None, 0))(
                 params, t_star[num_time_steps], x_star
             )
 
-            del model, state, params
+            del state, params
@@ -22,6 +22,9 @@ def get_config():
     arch.hidden_dim = 256
     arch.out_dim = 3
     arch.activation = "tanh"
+    arch.remat = "none"  # or "per_layer", "dots_saveable" to recompute activations
+    arch.compute_dtype = None  # e.g. "bfloat16" for the hidden matmuls
+    arch.matmul_precision = None  # e.g. "default" for tf32 hidden matmuls on GPU
     arch.periodicity = False
     arch.fourier_emb = ml_collections.ConfigDict(
         {"embed_scale": 10.0, "embed_dim": 256}
@@ -40,12 +43,17 @@ def get_config():
     optim.decay_rate = 0.9
     optim.decay_steps = 2000
     optim.grad_accum_steps = 0
+    optim.num_microbatches = 1
 
     # Training
     config.training = training = ml_collections.ConfigDict()
     training.Re = [100, 400, 1000]
     training.max_steps = [20000, 40000, 140000]
     training.batch_size = 1024
+    training.pool = ml_collections.ConfigDict(
+        {"size": None, "refresh_every_epochs": None, "point_weights_lr": None}
+    )  # a fixed pool of size points per device, iterated in shuffled epochs
+    # With point_weights_lr, self-adaptive per-point weights ascend the loss
 
     # Weighting
     config.weighting = weighting = ml_collections.ConfigDict()
@@ -54,7 +62,15 @@ def get_config():
         {"u_bc": 1.0, "v_bc": 1.0, "ru": 1.0, "rv": 1.0, "rc": 1.0}
     )
     weighting.momentum = 0.9
+    weighting.running_average = "weights"  # or "grad_norms": reweight at every step
     weighting.update_every_steps = 1000
+    weighting.ntk_num_points = None  # points per NTK loss term, None for all
+    weighting.ntk_num_probes = None  # random JVP probes, None for exact NTK
+    weighting.ntk_chunk_size = None  # points per exact NTK pass, None for all at once
+    # Temperature of SoftAdapt and ReLoBRaLo, which reweight every step from the losses
+    weighting.temperature = 0.1
+    weighting.alpha = 0.999  # ReLoBRaLo weight of the history
+    weighting.lookback = 0.999  # ReLoBRaLo probability of keeping the history
 
     # Logging
     config.logging = logging = ml_collections.ConfigDict()
@@ -71,6 +87,12 @@ def get_config():
     saving.save_every_steps = None
     saving.num_keep_ckpts = 10
 
+    # Parametric training, sample Re per residual point over dom instead of the curriculum
+    config.parametric = parametric = ml_collections.ConfigDict()
+    parametric.dom = None  # e.g. [[100, 3200]]
+    parametric.log_scale = True
+    parametric.max_steps = 200000
+
     # Input shape for initializing Flax models
     config.input_dim = 2
 
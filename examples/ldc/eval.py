@@ -337,16 +337,20 @@ def evaluate(config: ml_collections.ConfigDict, workdir: str, Re: int):
     model = models.NavierStokes2D(config)
 
     # Restore checkpoint
-    path = os.path.join(".", "ckpt", config.wandb.name, "Re{}".format(Re))
+    # A parametric model covers all Reynolds numbers with a single checkpoint
+    if model.coef_dom is not None:
+        path = os.path.join(".", "ckpt", config.wandb.name, "parametric")
+    else:
+        path = os.path.join(".", "ckpt", config.wandb.name, "Re{}".format(Re))
     model.state = restore_checkpoint(model.state, path)
     params = model.state.params
 
     # Predict
-    u_pred = vmap(vmap(model.u_net, (None, None, 0)), (None, 0, None))(
-        params, x_star, y_star
+    u_pred = vmap(vmap(model.u_net, (None, None, 0, None)), (None, 0, None, None))(
+        params, x_star, y_star, 1 / Re
     )
-    v_pred = vmap(vmap(model.v_net, (None, None, 0)), (None, 0, None))(
-        params, x_star, y_star
+    v_pred = vmap(vmap(model.v_net, (None, None, 0, None)), (None, 0, None, None))(
+        params, x_star, y_star, 1 / Re
     )
 
     u_l2_error = jnp.sqrt(jnp.mean((u_ref - u_pred) ** 2)) / jnp.sqrt(
@@ -13,6 +13,8 @@ from ml_collections import config_flags
 import jax
 jax.config.update("jax_default_matmul_precision", "highest")
 
+from jaxpi.utils import enable_compilation_cache
+
 import train
 import eval
 
@@ -31,6 +33,8 @@ flags.DEFINE_integer("Re", 1000, "Reynolds number (default: 100)")
 
 
 def main(argv):
+    enable_compilation_cache(FLAGS.config)
+
     if FLAGS.config.mode == "train":
         train.train_and_evaluate(FLAGS.config, FLAGS.workdir)
 
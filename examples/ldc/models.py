@@ -7,7 +7,6 @@ from jax.flatten_util import ravel_pytree
 
 from jaxpi.models import ForwardBVP
 from jaxpi.evaluator import BaseEvaluator
-from jaxpi.utils import ntk_fn
 
 from utils import sample_points_on_square_boundary
 
@@ -15,6 +14,9 @@ from matplotlib import pyplot as plt
 
 
 class NavierStokes2D(ForwardBVP):
+    # The viscosity is a Python float, or None for parametric training
+    static_args = (0,)
+
     def __init__(self, config):
         super().__init__(config)
 
@@ -30,38 +32,41 @@ class NavierStokes2D(ForwardBVP):
         self.u_bc = self.v_bc.at[:num_pts].set(1.0)
 
         # Predictions over a grid
-        self.u_pred_fn = vmap(self.u_net, (None, 0, 0))
-        self.v_pred_fn = vmap(self.v_net, (None, 0, 0))
-        self.p_pred_fn = vmap(self.p_net, (None, 0, 0))
-        self.r_pred_fn = vmap(self.r_net, (None, None, 0, 0))
-
-    def neural_net(self, params, x, y):
-        z = jnp.stack([x, y])
+        self.u_pred_fn = vmap(self.u_net, (None, 0, 0, 0))
+        self.v_pred_fn = vmap(self.v_net, (None, 0, 0, 0))
+        self.p_pred_fn = vmap(self.p_net, (None, 0, 0, 0))
+        self.r_pred_fn = vmap(self.r_net, (None, 0, 0, 0))
+
+    def neural_net(self, params, x, y, nu):
+        # The Reynolds number is a network input for parametric training
+        z = jnp.stack([x, y, *self.coef_inputs(1 / nu)])
         outputs = self.state.apply_fn(params, z)
         u = outputs[0]
         v = outputs[1]
         p = outputs[2]
         return u, v, p
 
-    def u_net(self, params, x, y):
-        u, _, _ = self.neural_net(params, x, y)
+    def u_net(self, params, x, y, nu):
+        u, _, _ = self.neural_net(params, x, y, nu)
         return u
 
-    def v_net(self, params, x, y):
-        _, v, _ = self.neural_net(params, x, y)
+    def v_net(self, params, x, y, nu):
+        _, v, _ = self.neural_net(params, x, y, nu)
         return v
 
-    def p_net(self, params, x, y):
-        _, _, p = self.neural_net(params, x, y)
+    def p_net(self, params, x, y, nu):
+        _, _, p = self.neural_net(params, x, y, nu)
         return p
 
     def r_net(self, params, nu, x, y):
-        u, v, p = self.neural_net(params, x, y)
+        u, v, p = self.neural_net(params, x, y, nu)
 
-        (u_x, u_y), (v_x, v_y), (p_x, p_y) = jacrev(self.neural_net, argnums=(1, 2))(params, x, y)
+        (u_x, u_y), (v_x, v_y), (p_x, p_y) = jacrev(self.neural_net, argnums=(1, 2))(
+            params, x, y, nu
+        )
 
-        u_hessian = hessian(self.u_net, argnums=(1, 2))(params, x, y)
-        v_hessian = hessian(self.v_net, argnums=(1, 2))(params, x, y)
+        u_hessian = hessian(self.u_net, argnums=(1, 2))(params, x, y, nu)
+        v_hessian = hessian(self.v_net, argnums=(1, 2))(params, x, y, nu)
 
         u_xx = u_hessian[0][0]
         u_yy = u_hessian[1][1]
@@ -87,23 +92,43 @@ class NavierStokes2D(ForwardBVP):
         _, _, rc = self.r_net(params, nu, x, y)
         return rc
 
+    def viscosity(self, batch, nu):
+        """Returns the viscosity of every residual and boundary point.
+
+        For parametric training `nu` is None and the Reynolds numbers are sampled with
+        the residual points (the last column of `batch`), the boundary points reuse them.
+        """
+        if self.coef_dom is None:
+            nu_res = jnp.full(batch.shape[0], nu)
+        else:
+            nu_res = 1 / batch[:, 2]
+
+        nu_bc = jnp.resize(nu_res, self.x_bc1.shape[0])
+        return nu_res, nu_bc
+
     @partial(jit, static_argnums=(0,))
-    def losses(self, params, batch, nu):
+    def losses(self, params, batch, nu, point_weights=None):
+        nu_res, nu_bc = self.viscosity(batch, nu)
+
         # boundary condition losses
         # Compute forward pass of u and v
-        u_pred = self.u_pred_fn(params, self.x_bc1[:, 0], self.x_bc1[:, 1])
-        v_pred = self.v_pred_fn(params, self.x_bc2[:, 0], self.x_bc2[:, 1])
+        u_pred = self.u_pred_fn(params, self.x_bc1[:, 0], self.x_bc1[:, 1], nu_bc)
+        v_pred = self.v_pred_fn(params, self.x_bc2[:, 0], self.x_bc2[:, 1], nu_bc)
 
         # Compute losses
         u_bc_loss = jnp.mean((u_pred - self.u_bc) ** 2)
         v_bc_loss = jnp.mean(v_pred**2)
 
         # Compute forward pass of residual
-        ru_pred, rv_pred, rc_pred = self.r_pred_fn(params, nu, batch[:, 0], batch[:, 1])
+        ru_pred, rv_pred, rc_pred = self.r_pred_fn(
+            params, nu_res, batch[:, 0], batch[:, 1]
+        )
         # Compute losses
-        ru_loss = jnp.mean(ru_pred**2)
-        rv_loss = jnp.mean(rv_pred**2)
-        rc_loss = jnp.mean(rc_pred**2)
+        # Self-adaptive weights of the residual points, with a pool
+        w = 1.0 if point_weights is None else point_weights
+        ru_loss = jnp.mean(w * ru_pred**2)
+        rv_loss = jnp.mean(w * rv_pred**2)
+        rc_loss = jnp.mean(w * rc_pred**2)
 
         loss_dict = {
             "u_bc": u_bc_loss,
@@ -116,22 +141,35 @@ class NavierStokes2D(ForwardBVP):
         return loss_dict
 
     @partial(jit, static_argnums=(0,))
-    def compute_diag_ntk(self, params, batch, nu):
-        u_bc_ntk = vmap(ntk_fn, (None, None, 0, 0))(
-            self.u_net, params, self.x_bc1[:, 0], self.x_bc1[:, 1]
+    def compute_diag_ntk(self, params, batch, nu, key=None):
+        keys = self.ntk_keys(key)
+        nu_res, nu_bc = self.viscosity(batch, nu)
+
+        u_bc_ntk = self.diag_ntk(
+            self.u_net,
+            params,
+            self.x_bc1[:, 0],
+            self.x_bc1[:, 1],
+            nu_bc,
+            key=next(keys),
         )
-        v_bc_ntk = vmap(ntk_fn, (None, None, 0, 0))(
-            self.v_net, params, self.x_bc2[:, 0], self.x_bc2[:, 1]
+        v_bc_ntk = self.diag_ntk(
+            self.v_net,
+            params,
+            self.x_bc2[:, 0],
+            self.x_bc2[:, 1],
+            nu_bc,
+            key=next(keys),
         )
 
-        ru_ntk = vmap(ntk_fn, (None, None, None, 0, 0))(
-            self.ru_net, params, nu, batch[:, 0], batch[:, 1]
+        ru_ntk = self.diag_ntk(
+            self.ru_net, params, nu_res, batch[:, 0], batch[:, 1], key=next(keys)
         )
-        rv_ntk = vmap(ntk_fn, (None, None, None, 0, 0))(
-            self.rv_net, params, nu, batch[:, 0], batch[:, 1]
+        rv_ntk = self.diag_ntk(
+            self.rv_net, params, nu_res, batch[:, 0], batch[:, 1], key=next(keys)
         )
-        rc_ntk = vmap(ntk_fn, (None, None, None, 0, 0))(
-            self.rc_net, params, nu, batch[:, 0], batch[:, 1]
+        rc_ntk = self.diag_ntk(
+            self.rc_net, params, nu_res, batch[:, 0], batch[:, 1], key=next(keys)
         )
 
         ntk_dict = {
@@ -144,27 +182,13 @@ class NavierStokes2D(ForwardBVP):
 
         return ntk_dict
 
-    @partial(pmap, axis_name="batch", static_broadcasted_argnums=(0, 3))
-    def update_weights(self, state, batch, nu):
-        weights = self.compute_weights(state.params, batch, nu)
-        weights = lax.pmean(weights, "batch")
-        state = state.apply_weights(weights=weights)
-        return state
-
-    @partial(pmap, axis_name="batch", static_broadcasted_argnums=(0, 3))
-    def step(self, state, batch, nu):
-        grads = grad(self.loss)(state.params, state.weights, batch, nu)
-        grads = lax.pmean(grads, "batch")
-        state = state.apply_gradients(grads=grads)
-        return state
-
     @partial(jit, static_argnums=(0,))
-    def compute_l2_error(self, params, x_star, y_star, U_test):
-        u_pred = vmap(vmap(self.u_net, (None, None, 0)), (None, 0, None))(
-            params, x_star, y_star
+    def compute_l2_error(self, params, x_star, y_star, U_test, nu):
+        u_pred = vmap(vmap(self.u_net, (None, None, 0, None)), (None, 0, None, None))(
+            params, x_star, y_star, nu
         )
-        v_pred = vmap(vmap(self.v_net, (None, None, 0)), (None, 0, None))(
-            params, x_star, y_star
+        v_pred = vmap(vmap(self.v_net, (None, None, 0, None)), (None, 0, None, None))(
+            params, x_star, y_star, nu
         )
 
         U_pred = jnp.sqrt(u_pred**2 + v_pred**2)
@@ -177,16 +201,22 @@ class NavierStokesEvaluator(BaseEvaluator):
     def __init__(self, config, model):
         super().__init__(config, model)
 
-    def log_errors(self, params, x_star, y_star, U_ref):
-        l2_error = self.model.compute_l2_error(params, x_star, y_star, U_ref)
+    def log_errors(self, params, x_star, y_star, U_ref, nu):
+        l2_error = self.model.compute_l2_error(params, x_star, y_star, U_ref, nu)
         self.log_dict["l2_error"] = l2_error
 
-    def log_preds(self, params, x_star, y_star):
-        u_pred = vmap(vmap(self.model.u_net, (None, None, 0)), (None, 0, None))(
-            params, x_star, y_star
+    def log_parametric_errors(self, params, datasets):
+        # One network covers all Reynolds numbers, errors are computed by inference
+        for Re, (x_star, y_star, U_ref) in datasets.items():
+            l2_error = self.model.compute_l2_error(params, x_star, y_star, U_ref, 1 / Re)
+            self.log_dict["l2_error_Re{}".format(Re)] = l2_error
+
+    def log_preds(self, params, x_star, y_star, nu):
+        u_pred = vmap(vmap(self.model.u_net, (None, None, 0, None)), (None, 0, None, None))(
+            params, x_star, y_star, nu
         )
-        v_pred = vmap(vmap(self.model.v_net, (None, None, 0)), (None, 0, None))(
-            params, x_star, y_star
+        v_pred = vmap(vmap(self.model.v_net, (None, None, 0, None)), (None, 0, None, None))(
+            params, x_star, y_star, nu
         )
         U_pred = jnp.sqrt(u_pred**2 + v_pred**2)
 
@@ -199,9 +229,19 @@ class NavierStokesEvaluator(BaseEvaluator):
         self.log_dict = super().__call__(state, batch, nu)
 
         if self.config.logging.log_errors:
-            self.log_errors(state.params, x_star, y_star, U_ref)
+            self.log_errors(state.params, x_star, y_star, U_ref, nu)
 
         if self.config.logging.log_preds:
-            self.log_preds(state.params, x_star, y_star)
+            self.log_preds(state.params, x_star, y_star, nu)
+
+        return self.log_dict
+
+    def parametric(self, state, batch, datasets):
+        """Evaluates a parametric model (see `config.parametric`) at every Reynolds
+        number of `datasets`, a dict mapping Re to (x_star, y_star, U_ref)."""
+        self.log_dict = super().__call__(state, batch, None)
+
+        if self.config.logging.log_errors:
+            self.log_parametric_errors(state.params, datasets)
 
         return self.log_dict
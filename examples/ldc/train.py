@@ -15,8 +15,9 @@ import matplotlib.pyplot as plt
 
 import wandb
 
-from jaxpi.samplers import UniformSampler
+from jaxpi.samplers import UniformSampler, ParametricSampler, PoolSampler
 from jaxpi.logging import Logger
+from jaxpi.parallel import unreplicate
 from jaxpi.utils import save_checkpoint
 
 import models
@@ -37,8 +38,24 @@ def train_curriculum(config, workdir, model, step_offset, max_steps, Re):
     # Define domain
     dom = jnp.array([[x0, x1], [y0, y1]])
 
-    # Initialize  residual sampler
-    res_sampler = iter(UniformSampler(dom, config.training.batch_size))
+    # Initialize  residual sampler, optionally iterating over a fixed pool of points
+    pool = config.training.pool
+    if pool.size is None:
+        res_sampler = UniformSampler(dom, config.training.batch_size)
+    else:
+        res_sampler = PoolSampler(
+            UniformSampler(dom, pool.size),
+            config.training.batch_size,
+            pool.refresh_every_epochs,
+            with_indices=pool.point_weights_lr is not None,
+        )
+
+        # Every stage draws a new pool, whose point weights start over
+        if pool.point_weights_lr is not None:
+            point_weights = jnp.ones_like(model.state.point_weights)
+            model.state = model.state.replace(point_weights=point_weights)
+
+    res_sampler = iter(res_sampler)
 
     # Initialize evaluator
     evaluator = models.NavierStokesEvaluator(config, model)
@@ -57,7 +74,7 @@ def train_curriculum(config, workdir, model, step_offset, max_steps, Re):
         model.state = model.step(model.state, batch, nu)
 
         # Update weights if necessary
-        if config.weighting.scheme in ["grad_norm", "ntk"]:
+        if config.weighting.scheme in ["grad_norm", "ntk", "lr_annealing"]:
             if step % config.weighting.update_every_steps == 0:
                 model.state = model.update_weights(model.state, batch, nu)
 
@@ -65,8 +82,10 @@ def train_curriculum(config, workdir, model, step_offset, max_steps, Re):
         if jax.process_index() == 0:
             if step % config.logging.log_every_steps == 0:
                 # Get the first replica of the state and batch
-                state = jax.device_get(tree_map(lambda x: x[0], model.state))
-                batch = jax.device_get(tree_map(lambda x: x[0], batch))
+                state = jax.device_get(unreplicate(model.state))
+                batch = jax.device_get(unreplicate(batch))
+                if pool.point_weights_lr is not None:
+                    batch, _ = batch  # drop the pool indices
                 log_dict = evaluator(state, batch, x_star, y_star, U_ref, nu)
                 wandb.log(log_dict, step + step_offset)
 
@@ -90,6 +109,71 @@ def train_curriculum(config, workdir, model, step_offset, max_steps, Re):
     return model, step_offset
 
 
+def train_parametric(config, workdir, model):
+    # Reference solutions at the curriculum Reynolds numbers, only used for evaluation
+    datasets = {}
+    for Re in config.training.Re:
+        u_ref, v_ref, x_star, y_star, nu = get_dataset(Re)
+        datasets[Re] = (x_star, y_star, jnp.sqrt(u_ref**2 + v_ref**2))
+
+    # Define domain
+    dom = jnp.array([[x_star[0], x_star[-1]], [y_star[0], y_star[-1]]])
+
+    # Sample a Reynolds number for every residual point
+    res_sampler = iter(
+        ParametricSampler(
+            UniformSampler(dom, config.training.batch_size),
+            config.parametric.dom,
+            log_scale=config.parametric.log_scale,
+        )
+    )
+
+    # Initialize evaluator
+    evaluator = models.NavierStokesEvaluator(config, model)
+
+    # Initialize logger
+    logger = Logger()
+
+    # The viscosity comes with the batch, so step and update_weights are compiled once
+    nu = None
+
+    # jit warm up
+    print("Waiting for JIT...")
+    start_time = time.time()
+    for step in range(config.parametric.max_steps):
+        batch = next(res_sampler)
+        model.state = model.step(model.state, batch, nu)
+
+        # Update weights if necessary
+        if config.weighting.scheme in ["grad_norm", "ntk", "lr_annealing"]:
+            if step % config.weighting.update_every_steps == 0:
+                model.state = model.update_weights(model.state, batch, nu)
+
+        # Log training metrics, only use host 0 to record results
+        if jax.process_index() == 0:
+            if step % config.logging.log_every_steps == 0:
+                # Get the first replica of the state and batch
+                state = jax.device_get(unreplicate(model.state))
+                batch = jax.device_get(unreplicate(batch))
+                log_dict = evaluator.parametric(state, batch, datasets)
+                wandb.log(log_dict, step)
+
+                end_time = time.time()
+                # Report training metrics
+                logger.log_iter(step, start_time, end_time, log_dict)
+                start_time = end_time
+
+        # Save checkpoint
+        if config.saving.save_every_steps is not None:
+            if (step + 1) % config.saving.save_every_steps == 0 or (
+                step + 1
+            ) == config.parametric.max_steps:
+                ckpt_path = os.path.join(os.getcwd(), config.wandb.name, "ckpt", "parametric")
+                save_checkpoint(model.state, ckpt_path, keep=config.saving.num_keep_ckpts)
+
+    return model
+
+
 def train_and_evaluate(config: ml_collections.ConfigDict, workdir: str):
     # Initialize W&B
     wandb_config = config.wandb
@@ -98,6 +182,10 @@ def train_and_evaluate(config: ml_collections.ConfigDict, workdir: str):
     # Initialize model
     model = models.NavierStokes2D(config)
 
+    # A single run over a range of Reynolds numbers replaces the curriculum
+    if model.coef_dom is not None:
+        return train_parametric(config, workdir, model)
+
     # Curriculum training
     step_offset = 0
 
@@ -3,6 +3,8 @@ import scipy.io
 import jax.numpy as jnp
 from jax.flatten_util import ravel_pytree
 
+from jaxpi.geometry import Segment
+
 
 def get_dataset(Re):
     data = scipy.io.loadmat("data/ldc_Re{}.mat".format(Re))
@@ -16,23 +18,14 @@ def get_dataset(Re):
 
 
 def sample_points_on_square_boundary(num_pts_per_side, eps):
-    # Sample points along the top side (x=1 to x=0, y=1)
-    top_coords = jnp.linspace(0, 1, num_pts_per_side)
-    top = jnp.column_stack((top_coords, jnp.ones_like(top_coords)))
-
-    # Sample points along the bottom side (x=0 to x=1, y=0)
-    bottom_coords = jnp.linspace(0, 1, num_pts_per_side)
-    bottom = jnp.column_stack((bottom_coords, jnp.zeros_like(bottom_coords)))
-
-    # Sample points along the left side (x=0, y=1 to y=0)
-    left_coords = jnp.linspace(0, 1 - eps, num_pts_per_side)
-    left = jnp.column_stack((jnp.zeros_like(left_coords), left_coords))
-
-    # Sample points along the right side (x=1, y=0 to y=1)
-    right_coords = jnp.linspace(0, 1 - eps, num_pts_per_side)
-    right = jnp.column_stack((jnp.ones_like(right_coords), right_coords))
-
-    # Combine the points from all sides
-    points = jnp.vstack((top, bottom, left, right))
+    # Evenly spaced points on each side, the top (lid) side first, the left and right
+    # sides stop eps below the lid
+    sides = [
+        Segment((0, 1), (1, 1)),
+        Segment((0, 0), (1, 0)),
+        Segment((0, 0), (0, 1 - eps)),
+        Segment((1, 0), (1, 1 - eps)),
+    ]
+    points = jnp.vstack([side.boundary_grid(num_pts_per_side) for side in sides])
 
     return points
@@ -6,8 +6,8 @@ from jax.tree_util import tree_map
 from jax.flatten_util import ravel_pytree
 
 from jaxpi.models import ForwardBVP
+from jaxpi.geometry import Circle
 from jaxpi.evaluator import BaseEvaluator
-from jaxpi.utils import ntk_fn
 
 
 class NavierStokes2D(ForwardBVP):
@@ -21,8 +21,6 @@ class NavierStokes2D(ForwardBVP):
         cylinder_coords,
         Re,
     ):
-        super().__init__(config)
-
         self.u_in = u_inflow  # inflow profile
         self.Re = Re  # Reynolds number
 
@@ -36,6 +34,20 @@ class NavierStokes2D(ForwardBVP):
         # Non-dimensionalized domain length and width
         self.L, self.W = self.noslip_coords.max(axis=0) - self.noslip_coords.min(axis=0)
 
+        # Impose the inflow and no-slip conditions exactly, dropping their losses
+        self.hard_constraints = config.hard_constraints
+        output_transform, exact_losses = None, ()
+        if self.hard_constraints:
+            center = cylinder_coords.mean(axis=0)
+            radius = jnp.linalg.norm(cylinder_coords - center, axis=1).mean()
+            self.cylinder = Circle(center, radius)
+            self.u_max = jnp.max(u_inflow)
+
+            output_transform = (self.bc_distance, self.bc_lifting)
+            exact_losses = ("u_in", "v_in", "u_noslip", "v_noslip")
+
+        super().__init__(config, output_transform, exact_losses)
+
         # Predict functions over batch
         self.u_pred_fn = vmap(self.u_net, (None, 0, 0))
         self.v_pred_fn = vmap(self.v_net, (None, 0, 0))
@@ -52,6 +64,20 @@ class NavierStokes2D(ForwardBVP):
         p = outputs[2]
         return u, v, p
 
+    def bc_distance(self, z):
+        "Vanishes for u and v on the inflow, the walls and the cylinder"
+        x, y = z[0] * self.L, z[1] * self.W
+        d_cyl = self.cylinder.sdf(jnp.stack([x, y])) / self.W
+        d = z[0] * z[1] * (1 - z[1]) * d_cyl
+        return jnp.stack([d, d, jnp.ones_like(d)])
+
+    def bc_lifting(self, z):
+        "The parabolic inflow profile for u, blended to zero on the cylinder"
+        x, y = z[0] * self.L, z[1] * self.W
+        d_cyl = self.cylinder.sdf(jnp.stack([x, y]))
+        u = 4 * self.u_max * z[1] * (1 - z[1]) * d_cyl / (d_cyl + x)
+        return jnp.stack([u, jnp.zeros_like(u), jnp.zeros_like(u)])
+
     def u_net(self, params, x, y):
         u, _, _ = self.neural_net(params, x, y)
         return u
@@ -111,16 +137,30 @@ class NavierStokes2D(ForwardBVP):
 
     @partial(jit, static_argnums=(0,))
     def losses(self, params, batch):
-        # Inflow boundary conditions
-        u_in_pred = self.u_pred_fn(
-            params, self.inflow_coords[:, 0], self.inflow_coords[:, 1]
-        )
-        v_in_pred = self.v_pred_fn(
-            params, self.inflow_coords[:, 0], self.inflow_coords[:, 1]
-        )
-
-        u_in_loss = jnp.mean((u_in_pred - self.u_in) ** 2)
-        v_in_loss = jnp.mean(v_in_pred**2)
+        loss_dict = {}
+
+        if not self.hard_constraints:
+            # Inflow boundary conditions
+            u_in_pred = self.u_pred_fn(
+                params, self.inflow_coords[:, 0], self.inflow_coords[:, 1]
+            )
+            v_in_pred = self.v_pred_fn(
+                params, self.inflow_coords[:, 0], self.inflow_coords[:, 1]
+            )
+
+            loss_dict["u_in"] = jnp.mean((u_in_pred - self.u_in) ** 2)
+            loss_dict["v_in"] = jnp.mean(v_in_pred**2)
+
+            # No-slip boundary conditions
+            u_noslip_pred = self.u_pred_fn(
+                params, self.noslip_coords[:, 0], self.noslip_coords[:, 1]
+            )
+            v_noslip_pred = self.v_pred_fn(
+                params, self.noslip_coords[:, 0], self.noslip_coords[:, 1]
+            )
+
+            loss_dict["u_noslip"] = jnp.mean(u_noslip_pred**2)
+            loss_dict["v_noslip"] = jnp.mean(v_noslip_pred**2)
 
         # Outflow boundary conditions
         _, _, _, u_out_pred, v_out_pred = self.r_pred_fn(
@@ -130,17 +170,6 @@ class NavierStokes2D(ForwardBVP):
         u_out_loss = jnp.mean(u_out_pred**2)
         v_out_loss = jnp.mean(v_out_pred**2)
 
-        # No-slip boundary conditions
-        u_noslip_pred = self.u_pred_fn(
-            params, self.noslip_coords[:, 0], self.noslip_coords[:, 1]
-        )
-        v_noslip_pred = self.v_pred_fn(
-            params, self.noslip_coords[:, 0], self.noslip_coords[:, 1]
-        )
-
-        u_noslip_loss = jnp.mean(u_noslip_pred**2)
-        v_noslip_loss = jnp.mean(v_noslip_pred**2)
-
         # Residual losses
         ru_pred, rv_pred, rc_pred, _, _ = self.r_pred_fn(
             params, batch[:, 0], batch[:, 1]
@@ -150,64 +179,88 @@ class NavierStokes2D(ForwardBVP):
         rv_loss = jnp.mean(rv_pred**2)
         rc_loss = jnp.mean(rc_pred**2)
 
-        loss_dict = {
-            "u_in": u_in_loss,
-            "v_in": v_in_loss,
-            "u_out": u_out_loss,
-            "v_out": v_out_loss,
-            "u_noslip": u_noslip_loss,
-            "v_noslip": v_noslip_loss,
-            "ru": ru_loss,
-            "rv": rv_loss,
-            "rc": rc_loss,
-        }
+        loss_dict.update(
+            {
+                "u_out": u_out_loss,
+                "v_out": v_out_loss,
+                "ru": ru_loss,
+                "rv": rv_loss,
+                "rc": rc_loss,
+            }
+        )
 
         return loss_dict
 
     @partial(jit, static_argnums=(0,))
-    def compute_diag_ntk(self, params, batch):
-        u_in_ntk = vmap(ntk_fn, (None, None, 0, 0))(
-            self.u_net, params, self.inflow_coords[:, 0], self.inflow_coords[:, 1]
+    def compute_diag_ntk(self, params, batch, key=None):
+        keys = self.ntk_keys(key)
+        ntk_dict = {}
+
+        if not self.hard_constraints:
+            ntk_dict["u_in"] = self.diag_ntk(
+                self.u_net,
+                params,
+                self.inflow_coords[:, 0],
+                self.inflow_coords[:, 1],
+                key=next(keys),
+            )
+            ntk_dict["v_in"] = self.diag_ntk(
+                self.v_net,
+                params,
+                self.inflow_coords[:, 0],
+                self.inflow_coords[:, 1],
+                key=next(keys),
+            )
+
+            ntk_dict["u_noslip"] = self.diag_ntk(
+                self.u_net,
+                params,
+                self.noslip_coords[:, 0],
+                self.noslip_coords[:, 1],
+                key=next(keys),
+            )
+            ntk_dict["v_noslip"] = self.diag_ntk(
+                self.v_net,
+                params,
+                self.noslip_coords[:, 0],
+                self.noslip_coords[:, 1],
+                key=next(keys),
+            )
+
+        u_out_ntk = self.diag_ntk(
+            self.u_out_net,
+            params,
+            self.outflow_coords[:, 0],
+            self.outflow_coords[:, 1],
+            key=next(keys),
         )
-        v_in_ntk = vmap(ntk_fn, (None, None, 0, 0))(
-            self.v_net, params, self.inflow_coords[:, 0], self.inflow_coords[:, 1]
+        v_out_ntk = self.diag_ntk(
+            self.v_out_net,
+            params,
+            self.outflow_coords[:, 0],
+            self.outflow_coords[:, 1],
+            key=next(keys),
         )
 
-        u_out_ntk = vmap(ntk_fn, (None, None, 0, 0))(
-            self.u_out_net, params, self.outflow_coords[:, 0], self.outflow_coords[:, 1]
+        ru_ntk = self.diag_ntk(
+            self.ru_net, params, batch[:, 0], batch[:, 1], key=next(keys)
         )
-        v_out_ntk = vmap(ntk_fn, (None, None, 0, 0))(
-            self.v_out_net, params, self.outflow_coords[:, 0], self.outflow_coords[:, 1]
+        rv_ntk = self.diag_ntk(
+            self.rv_net, params, batch[:, 0], batch[:, 1], key=next(keys)
         )
-
-        u_noslip_ntk = vmap(ntk_fn, (None, None, 0, 0))(
-            self.u_net, params, self.noslip_coords[:, 0], self.noslip_coords[:, 1]
-        )
-        v_noslip_ntk = vmap(ntk_fn, (None, None, 0, 0))(
-            self.v_net, params, self.noslip_coords[:, 0], self.noslip_coords[:, 1]
+        rc_ntk = self.diag_ntk(
+            self.rc_net, params, batch[:, 0], batch[:, 1], key=next(keys)
         )
 
-        ru_ntk = vmap(ntk_fn, (None, None, 0, 0))(
-            self.ru_net, params, batch[:, 0], batch[:, 1]
-        )
-        rv_ntk = vmap(ntk_fn, (None, None, 0, 0))(
-            self.rv_net, params, batch[:, 0], batch[:, 1]
+        ntk_dict.update(
+            {
+                "u_out": u_out_ntk,
+                "v_out": v_out_ntk,
+                "ru": ru_ntk,
+                "rv": rv_ntk,
+                "rc": rc_ntk,
+            }
         )
-        rc_ntk = vmap(ntk_fn, (None, None, 0, 0))(
-            self.rc_net, params, batch[:, 0], batch[:, 1]
-        )
-
-        ntk_dict = {
-            "u_in": u_in_ntk,
-            "v_in": v_in_ntk,
-            "u_out": u_out_ntk,
-            "v_out": v_out_ntk,
-            "u_noslip": u_noslip_ntk,
-            "v_noslip": v_noslip_ntk,
-            "ru": ru_ntk,
-            "rv": rv_ntk,
-            "rc": rc_ntk,
-        }
 
         return ntk_dict
 
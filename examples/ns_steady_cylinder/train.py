@@ -15,12 +15,13 @@ import wandb
 
 import matplotlib.pyplot as plt
 
-from jaxpi.samplers import SpaceSampler
+from jaxpi.samplers import SpaceSampler, MeshSampler, prefetch
 from jaxpi.logging import Logger
+from jaxpi.parallel import unreplicate
 from jaxpi.utils import save_checkpoint
 
 import models
-from utils import get_dataset, parabolic_inflow
+from utils import get_dataset, get_cells, parabolic_inflow
 
 
 def train_and_evaluate(config: ml_collections.ConfigDict, workdir: str):
@@ -44,6 +45,10 @@ def train_and_evaluate(config: ml_collections.ConfigDict, workdir: str):
         nu,
     ) = get_dataset()
 
+    # Mesh cells, the node indices are unaffected by the nondimensionalization
+    if config.training.res_sampler == "cells":
+        cells = get_cells(coords)
+
     # Inflow boundary conditions
     U_max = 0.3  # maximum velocity
     u_inflow, _ = parabolic_inflow(inflow_coords[:, 1], U_max)
@@ -87,7 +92,19 @@ def train_and_evaluate(config: ml_collections.ConfigDict, workdir: str):
     evaluator = models.NavierStokesEvaluator(config, model)
 
     # Initialize  residual sampler
-    res_sampler = iter(SpaceSampler(coords, config.training.batch_size_per_device))
+    if config.training.res_sampler == "nodes":
+        res_sampler = SpaceSampler(coords, config.training.batch_size_per_device)
+
+    elif config.training.res_sampler == "cells":
+        res_sampler = MeshSampler(coords, cells, config.training.batch_size_per_device)
+
+    else:
+        raise NotImplementedError(
+            f"Residual sampler {config.training.res_sampler} not supported yet!"
+        )
+
+    # Keep the next batch in flight while the current step runs
+    res_sampler = prefetch(res_sampler)
 
     # jit warm up
     print("Waiting for JIT...")
@@ -97,7 +114,7 @@ def train_and_evaluate(config: ml_collections.ConfigDict, workdir: str):
         model.state = model.step(model.state, batch)
 
         # Update weights if necessary
-        if config.weighting.scheme in ["grad_norm", "ntk"]:
+        if config.weighting.scheme in ["grad_norm", "ntk", "lr_annealing"]:
             if step % config.weighting.update_every_steps == 0:
                 model.state = model.update_weights(model.state, batch)
 
@@ -105,8 +122,8 @@ def train_and_evaluate(config: ml_collections.ConfigDict, workdir: str):
         if jax.process_index() == 0:
             if step % config.logging.log_every_steps == 0:
                 # Get the first replica of the state and batch
-                state = jax.device_get(tree_map(lambda x: x[0], model.state))
-                batch = jax.device_get(tree_map(lambda x: x[0], batch))
+                state = jax.device_get(unreplicate(model.state))
+                batch = jax.device_get(unreplicate(batch))
                 log_dict = evaluator(state, batch, coords, u_ref, v_ref)
                 wandb.log(log_dict, step)
 
@@ -1,6 +1,7 @@
 import jax.numpy as jnp
 
 import scipy.io
+from scipy.spatial import Delaunay
 
 
 def parabolic_inflow(y, U_max):
@@ -32,3 +33,11 @@ def get_dataset():
         cylinder_coords,
         nu,
     )
+
+
+def get_cells(coords):
+    """Triangulates the mesh nodes, dropping the triangles inside the cylinder"""
+    cells = Delaunay(coords).simplices
+    centroids = coords[cells].mean(axis=1)
+    inside = jnp.linalg.norm(centroids - jnp.array([0.2, 0.2]), axis=1) < 0.05
+    return jnp.array(cells[~inside])
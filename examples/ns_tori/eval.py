@@ -24,17 +24,13 @@ def evaluate(config: ml_collections.ConfigDict, workdir: str):
     v_ref = v_ref[:-1, :]
     w_ref = w_ref[:-1, :]
 
-    u0 = u_ref[0, :]
-    v0 = v_ref[0, :]
-    w0 = w_ref[0, :]
-
     num_time_steps = len(t_star) // config.training.num_time_windows
     t = t_star[:num_time_steps]
 
     # Initialize the model
     # Warning: t must be the same as the one used in training, otherwise the prediction will be wrong
     # This is because the input t is scaled inside the model forward pass
-    model = models.NavierStokes(config, t, x_star, y_star, u0, v0, w0, nu)
+    model = models.NavierStokes(config, t, x_star, y_star, nu)
 
     u_pred_list = []
     v_pred_list = []
@@ -2,25 +2,22 @@ from functools import partial
 
 import jax
 import jax.numpy as jnp
-from jax import lax, jit, grad, vmap, jacrev, hessian
+from jax import lax, jit, grad, vmap
 from jax.tree_util import tree_map
 
 import optax
 
 from jaxpi import archs
+from jaxpi.derivatives import check_remat, partials
 from jaxpi.models import ForwardIVP
 from jaxpi.evaluator import BaseEvaluator
-from jaxpi.utils import ntk_fn
 
 
 class NavierStokes(ForwardIVP):
-    def __init__(self, config, t_star, x_star, y_star, u0, v0, w0, nu):
+    def __init__(self, config, t_star, x_star, y_star, nu):
+        check_remat(config.arch.get("remat", "none"))
         super().__init__(config)
 
-        self.u0 = u0
-        self.v0 = v0
-        self.w0 = w0
-
         self.t_star = t_star
         self.x_star = x_star
         self.y_star = y_star
@@ -75,17 +72,25 @@ class NavierStokes(ForwardIVP):
         return w
 
     def r_net(self, params, t, x, y):
-        u, v = self.neural_net(params, t, x, y)
-
-        u_x = grad(self.u_net, argnums=2)(params, t, x, y)
-        v_y = grad(self.v_net, argnums=3)(params, t, x, y)
-
-        w_t, w_x, w_y = jacrev(self.w_net, argnums=(1, 2, 3))(params, t, x, y)
-
-        w_hessian = hessian(self.w_net, argnums=(2, 3))(params, t, x, y)
-
-        w_xx = w_hessian[0][0]
-        w_yy = w_hessian[1][1]
+        # Vorticity w = v_x - u_y and its partials from one set of Taylor-mode passes
+        d = partials(
+            partial(self.neural_net, params),
+            "txy",
+            {
+                "u": ["x", "y", "ty", "xy", "yy", "xxy", "yyy"],
+                "v": ["x", "y", "tx", "xx", "xy", "xxx", "xyy"],
+            },
+            outnames=("u", "v"),
+        )(t, x, y)
+
+        u, v = d["u"], d["v"]
+        u_x, v_y = d["u_x"], d["v_y"]
+
+        w_t = d["v_tx"] - d["u_ty"]
+        w_x = d["v_xx"] - d["u_xy"]
+        w_y = d["v_xy"] - d["u_yy"]
+        w_xx = d["v_xxx"] - d["u_xxy"]
+        w_yy = d["v_xyy"] - d["u_yyy"]
 
         mom = w_t + u * w_x + v * w_y - self.nu * (w_xx + w_yy)
         cont = u_x + v_y
@@ -100,41 +105,28 @@ class NavierStokes(ForwardIVP):
         _, cont = self.r_net(params, t, x, y)
         return cont
 
-    @partial(jit, static_argnums=(0,))
-    def res_and_w(self, params, batch):
-        # Sort temporal coordinates
-        t_sorted = batch[:, 0].sort()
-        rm_pred, rc_pred = self.r_pred_fn(params, t_sorted, batch[:, 1], batch[:, 2])
-
-        rm_pred = rm_pred.reshape(self.num_chunks, -1)
-        rc_pred = rc_pred.reshape(self.num_chunks, -1)
-
-        rm_l = jnp.mean(rm_pred**2, axis=1)
-        rc_l = jnp.mean(rc_pred**2, axis=1)
-
-        rm_gamma = lax.stop_gradient(jnp.exp(-self.tol * (self.M @ rm_l)))
-        rc_gamma = lax.stop_gradient(jnp.exp(-self.tol * (self.M @ rc_l)))
-
-        # Take minimum of the causal weights
-        gamma = jnp.vstack([rm_gamma, rc_gamma])
-        gamma = gamma.min(0)
-
-        return rm_l, rc_l, gamma
+    def causal_residuals(self, params, batch):
+        rm_pred, rc_pred = self.r_pred_fn(params, batch[:, 0], batch[:, 1], batch[:, 2])
+        return rm_pred, rc_pred
 
     @partial(jit, static_argnums=(0,))
-    def losses(self, params, batch):
-        # Initial conditions loss
+    def losses(self, params, batch, ics, causal=None):
+        # Initial conditions loss, the window's initial condition is a traced argument
+        # so that all time windows share the compiled step
         u0_pred = self.u0_pred_fn(params, 0.0, self.x_star, self.y_star)
         v0_pred = self.v0_pred_fn(params, 0.0, self.x_star, self.y_star)
         w0_pred = self.w0_pred_fn(params, 0.0, self.x_star, self.y_star)
 
-        u0_loss = jnp.mean((u0_pred - self.u0) ** 2)
-        v0_loss = jnp.mean((v0_pred - self.v0) ** 2)
-        w0_loss = jnp.mean((w0_pred - self.w0) ** 2)
+        u0_loss = jnp.mean((u0_pred - ics["u0"]) ** 2)
+        v0_loss = jnp.mean((v0_pred - ics["v0"]) ** 2)
+        w0_loss = jnp.mean((w0_pred - ics["w0"]) ** 2)
 
         # Residual loss
         if self.config.weighting.use_causal == True:
-            rm_l, rc_l, gamma = self.res_and_w(params, batch)
+            if causal is None:
+                causal = self.causal_terms(params, batch)
+            rm_l, rc_l = causal["losses"]
+            gamma = causal["weights"]
             rm_loss = jnp.mean(rm_l * gamma)
             rc_loss = jnp.mean(rc_l * gamma)
 
@@ -156,42 +148,58 @@ class NavierStokes(ForwardIVP):
         return loss_dict
 
     @partial(jit, static_argnums=(0,))
-    def compute_diag_ntk(self, params, batch):
-        u_ic_ntk = vmap(
-            vmap(ntk_fn, (None, None, None, None, 0)), (None, None, None, 0, None)
-        )(self.u_net, params, 0.0, self.x_star, self.y_star)
-        v_ic_ntk = vmap(
-            vmap(ntk_fn, (None, None, None, None, 0)), (None, None, None, 0, None)
-        )(self.v_net, params, 0.0, self.x_star, self.y_star)
-        w_ic_ntk = vmap(
-            vmap(ntk_fn, (None, None, None, None, 0)), (None, None, None, 0, None)
-        )(self.w_net, params, 0.0, self.x_star, self.y_star)
+    def compute_diag_ntk(self, params, batch, *args, causal=None, key=None):
+        keys = self.ntk_keys(key)
+        # Initial condition grid, flattened to points
+        x_ic, y_ic = jnp.meshgrid(self.x_star, self.y_star, indexing="ij")
+        x_ic, y_ic = x_ic.ravel(), y_ic.ravel()
+
+        u_ic_ntk = self.diag_ntk(self.u_net, params, 0.0, x_ic, y_ic, key=next(keys))
+        v_ic_ntk = self.diag_ntk(self.v_net, params, 0.0, x_ic, y_ic, key=next(keys))
+        w_ic_ntk = self.diag_ntk(self.w_net, params, 0.0, x_ic, y_ic, key=next(keys))
 
         # Consider the effect of causal weights
         if self.config.weighting.use_causal:
-            batch = jnp.array([batch[:, 0].sort(), batch[:, 1], batch[:, 2]]).T
-            rm_ntk = vmap(ntk_fn, (None, None, 0, 0, 0))(
-                self.mom_net, params, batch[:, 0], batch[:, 1], batch[:, 2]
+            if causal is None:
+                causal = self.causal_terms(params, batch)
+            # the points in time order for the causal chunks
+            batch = causal["batch"]
+            rm_ntk = self.diag_ntk(
+                self.mom_net,
+                params,
+                batch[:, 0],
+                batch[:, 1],
+                batch[:, 2],
+                key=next(keys),
             )
-            rc_ntk = vmap(ntk_fn, (None, None, 0, 0, 0))(
-                self.cont_net, params, batch[:, 0], batch[:, 1], batch[:, 2]
+            rc_ntk = self.diag_ntk(
+                self.cont_net,
+                params,
+                batch[:, 0],
+                batch[:, 1],
+                batch[:, 2],
+                key=next(keys),
             )
 
-            rm_ntk = rm_ntk.reshape(self.num_chunks, -1)
-            rc_ntk = rc_ntk.reshape(self.num_chunks, -1)
-
-            rm_ntk = jnp.mean(rm_ntk, axis=1)
-            rc_ntk = jnp.mean(rc_ntk, axis=1)
-
-            _, _, casual_weights = self.res_and_w(params, batch)
-            rm_ntk = rm_ntk * casual_weights
-            rc_ntk = rc_ntk * casual_weights
+            # average convergence rate over each chunk, times the causal weights
+            rm_ntk = self.causal_ntk(rm_ntk, causal)
+            rc_ntk = self.causal_ntk(rc_ntk, causal)
         else:
-            rm_ntk = vmap(ntk_fn, (None, None, 0, 0, 0))(
-                self.mom_net, params, batch[:, 0], batch[:, 1], batch[:, 2]
+            rm_ntk = self.diag_ntk(
+                self.mom_net,
+                params,
+                batch[:, 0],
+                batch[:, 1],
+                batch[:, 2],
+                key=next(keys),
             )
-            rc_ntk = vmap(ntk_fn, (None, None, 0, 0, 0))(
-                self.cont_net, params, batch[:, 0], batch[:, 1], batch[:, 2]
+            rc_ntk = self.diag_ntk(
+                self.cont_net,
+                params,
+                batch[:, 0],
+                batch[:, 1],
+                batch[:, 2],
+                key=next(keys),
             )
 
         ntk_dict = {
@@ -234,14 +242,10 @@ class NavierStokesEvaluator(BaseEvaluator):
         self.log_dict["v_error"] = v_error
         self.log_dict["w_error"] = w_error
 
-    def __call__(self, state, batch, u_ref, v_ref, w_ref):
-        self.log_dict = super().__call__(state, batch)
+    def __call__(self, state, batch, ics, u_ref, v_ref, w_ref):
+        self.log_dict = super().__call__(state, batch, ics)
 
         if self.config.logging.log_errors:
             self.log_errors(state.params, u_ref, v_ref, w_ref)
 
-        if self.config.weighting.use_causal:
-            _, _, causal_weight = self.model.res_and_w(state.params, batch)
-            self.log_dict["cas_weight"] = causal_weight.min()
-
         return self.log_dict
@@ -12,15 +12,16 @@ import scipy.io
 import ml_collections
 import wandb
 
-from jaxpi.samplers import UniformSampler
+from jaxpi.samplers import UniformSampler, CausalChunkSampler
 from jaxpi.logging import Logger
-from jaxpi.utils import save_checkpoint
+from jaxpi.parallel import replicate, unreplicate
+from jaxpi.utils import save_checkpoint, compilation_cache_stats
 
 import models
 from utils import get_dataset
 
 
-def train_one_window(config, workdir, model, res_sampler, u_ref, v_ref, w_ref, idx):
+def train_one_window(config, workdir, model, res_sampler, ics, u_ref, v_ref, w_ref, idx):
     step_offset = idx * config.training.max_steps
 
     # Logger
@@ -29,25 +30,28 @@ def train_one_window(config, workdir, model, res_sampler, u_ref, v_ref, w_ref, i
     # Initialize evaluator
     evaluator = models.NavierStokesEvaluator(config, model)
 
+    # The initial condition is passed to the compiled functions as a traced argument
+    ics_replicated = replicate(ics, model.mesh)
+
     # jit warm up
     print("Waiting for JIT...")
     start_time = time.time()
     for step in range(config.training.max_steps):
         batch = next(res_sampler)
-        model.state = model.step(model.state, batch)
+        model.state = model.step(model.state, batch, ics_replicated)
 
         # Update weights if necessary
-        if config.weighting.scheme in ["grad_norm", "ntk"]:
+        if config.weighting.scheme in ["grad_norm", "ntk", "lr_annealing"]:
             if step % config.weighting.update_every_steps == 0:
-                model.state = model.update_weights(model.state, batch)
+                model.state = model.update_weights(model.state, batch, ics_replicated)
 
         # Log training metrics, only use host 0 to record results
         if jax.process_index() == 0:
             if step % config.logging.log_every_steps == 0:
                 # Get the first replica of the state and batch
-                state = jax.device_get(tree_map(lambda x: x[0], model.state))
-                batch = jax.device_get(tree_map(lambda x: x[0], batch))
-                log_dict = evaluator(state, batch, u_ref, v_ref, w_ref)
+                state = jax.device_get(unreplicate(model.state))
+                batch = jax.device_get(unreplicate(batch))
+                log_dict = evaluator(state, batch, ics, u_ref, v_ref, w_ref)
                 wandb.log(log_dict, step + step_offset)
 
                 end_time = time.time()
@@ -96,7 +100,32 @@ def train_and_evaluate(config: ml_collections.ConfigDict, workdir: str):
     dom = jnp.array([[t0, t1], [x0, x1], [y0, y1]])
 
     # Initialize the residual sampler
-    res_sampler = iter(UniformSampler(dom, config.training.batch_size_per_device))
+    res_sampler = UniformSampler(dom, config.training.batch_size_per_device)
+
+    # Stratify the residual times over the causal chunks, in chunk order
+    if config.weighting.use_causal and config.weighting.chunk_sampling:
+        res_sampler = CausalChunkSampler(
+            res_sampler, dom[0], config.weighting.num_chunks
+        )
+
+    # A single model serves all time windows, the initial condition of each window
+    # is a traced argument, so step, update_weights and losses are compiled once
+    model = models.NavierStokes(config, t, x_star, y_star, nu)
+    init_state = model.state
+
+    # Compile the train step ahead of time for the shapes of the residual batches,
+    # shape-stable reruns load it from the cache
+    if config.compilation.aot:
+        start_time = time.time()
+        ics = replicate({"u0": u0, "v0": v0, "w0": w0}, model.mesh)
+        model.compile(model.state, res_sampler.batch_spec(), ics)
+        logging.info(
+            "Compiled train step in {:.2f}s, compilation cache {}".format(
+                time.time() - start_time, compilation_cache_stats()
+            )
+        )
+
+    res_sampler = iter(res_sampler)
 
     for idx in range(config.training.num_time_windows):
         logging.info("Training time window {}".format(idx + 1))
@@ -105,21 +134,22 @@ def train_and_evaluate(config: ml_collections.ConfigDict, workdir: str):
         v_star = v_ref[num_time_steps * idx : num_time_steps * (idx + 1), :, :]
         w_star = w_ref[num_time_steps * idx : num_time_steps * (idx + 1), :, :]
 
-        # Initialize the model
-        model = models.NavierStokes(config, t, x_star, y_star, u0, v0, w0, nu)
+        # Every time window starts from the initial parameters
+        model.state = init_state
+        ics = {"u0": u0, "v0": v0, "w0": w0}
 
         # Training the current time window
         model = train_one_window(
-            config, workdir, model, res_sampler, u_star, v_star, w_star, idx
+            config, workdir, model, res_sampler, ics, u_star, v_star, w_star, idx
         )
 
         #  Update the initial condition for the next time window
         if config.training.num_time_windows > 1:
-            state = jax.device_get(jax.tree_util.tree_map(lambda x: x[0], model.state))
+            state = jax.device_get(unreplicate(model.state))
             params = state.params
 
             u0 = model.u0_pred_fn(params, t_star[num_time_steps], x_star, y_star)
             v0 = model.v0_pred_fn(params, t_star[num_time_steps], x_star, y_star)
             w0 = model.w0_pred_fn(params, t_star[num_time_steps], x_star, y_star)
 
-            del model, state, params
+            del state, params
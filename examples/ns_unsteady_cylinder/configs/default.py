@@ -25,6 +25,9 @@ def get_config():
     arch.hidden_dim = 256
     arch.out_dim = 3
     arch.activation = "gelu"  # gelu works better than tanh for this problem
+    arch.remat = "none"  # or "per_layer", "dots_saveable" to recompute activations
+    arch.compute_dtype = None  # e.g. "bfloat16" for the hidden matmuls
+    arch.matmul_precision = None  # e.g. "default" for tf32 hidden matmuls on GPU
     arch.periodicity = False
     arch.fourier_emb = ml_collections.ConfigDict({"embed_scale": 1.0, "embed_dim": 256})
     arch.reparam = ml_collections.ConfigDict(
@@ -41,17 +44,20 @@ def get_config():
     optim.decay_rate = 0.9
     optim.decay_steps = 2000
     optim.grad_accum_steps = 0
+    optim.num_microbatches = 1
 
     # Training
     config.training = training = ml_collections.ConfigDict()
     training.max_steps = 200000
     training.num_time_windows = 10
+    training.steps_per_call = 1  # optimizer steps (with sampling) per compiled call
 
     training.inflow_batch_size = 2048
     training.outflow_batch_size = 2048
     training.noslip_batch_size = 2048
     training.ic_batch_size = 2048
     training.res_batch_size = 4096
+    training.res_sampler = "nodes"  # "nodes" or "cells", uniform inside the mesh triangles
 
     # Weighting
     config.weighting = weighting = ml_collections.ConfigDict()
@@ -72,11 +78,21 @@ def get_config():
     }
 
     weighting.momentum = 0.9
+
+    weighting.running_average = "weights"  # or "grad_norms": reweight at every step
     weighting.update_every_steps = 1000  # 100 for grad norm and 1000 for ntk
+    weighting.ntk_num_points = None  # points per NTK loss term, None for all
+    weighting.ntk_num_probes = None  # random JVP probes, None for exact NTK
+    weighting.ntk_chunk_size = None  # points per exact NTK pass, None for all at once
+    # Temperature of SoftAdapt and ReLoBRaLo, which reweight every step from the losses
+    weighting.temperature = 0.1
+    weighting.alpha = 0.999  # ReLoBRaLo weight of the history
+    weighting.lookback = 0.999  # ReLoBRaLo probability of keeping the history
 
     weighting.use_causal = True
     weighting.causal_tol = 1.0
     weighting.num_chunks = 16
+    weighting.chunk_sampling = False  # draw residual points per causal chunk, no sort
 
     # Logging
     config.logging = logging = ml_collections.ConfigDict()
@@ -93,6 +109,15 @@ def get_config():
     saving.save_every_steps = 10000
     saving.num_keep_ckpts = 10
 
+    # Parallelism: "pmap" over local devices or "sharding" over a global device mesh
+    config.parallel = parallel = ml_collections.ConfigDict()
+    parallel.backend = "pmap"
+
+    # Compilation
+    config.compilation = compilation = ml_collections.ConfigDict()
+    compilation.cache_dir = None  # persistent XLA cache directory, e.g. "~/.cache/jaxpi"
+    compilation.min_compile_time_secs = 1.0
+
     # Input shape for initializing Flax models
     config.input_dim = 3
 
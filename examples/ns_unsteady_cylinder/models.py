@@ -8,13 +8,14 @@ from jax.tree_util import tree_map
 import optax
 
 from jaxpi import archs
+from jaxpi.derivatives import check_remat, partials
 from jaxpi.models import ForwardBVP, ForwardIVP
-from jaxpi.utils import ntk_fn
 from jaxpi.evaluator import BaseEvaluator
 
 
 class NavierStokes2D(ForwardIVP):
     def __init__(self, config, inflow_fn, temporal_dom, coords, Re):
+        check_remat(config.arch.get("remat", "none"))
         super().__init__(config)
 
         self.inflow_fn = inflow_fn
@@ -77,24 +78,21 @@ class NavierStokes2D(ForwardIVP):
         return w
 
     def r_net(self, params, t, x, y):
-        u, v, p = self.neural_net(params, t, x, y)
-
-        u_t = grad(self.u_net, argnums=1)(params, t, x, y)
-        v_t = grad(self.v_net, argnums=1)(params, t, x, y)
-
-        u_x = grad(self.u_net, argnums=2)(params, t, x, y)
-        v_x = grad(self.v_net, argnums=2)(params, t, x, y)
-        p_x = grad(self.p_net, argnums=2)(params, t, x, y)
-
-        u_y = grad(self.u_net, argnums=3)(params, t, x, y)
-        v_y = grad(self.v_net, argnums=3)(params, t, x, y)
-        p_y = grad(self.p_net, argnums=3)(params, t, x, y)
-
-        u_xx = grad(grad(self.u_net, argnums=2), argnums=2)(params, t, x, y)
-        v_xx = grad(grad(self.v_net, argnums=2), argnums=2)(params, t, x, y)
-
-        u_yy = grad(grad(self.u_net, argnums=3), argnums=3)(params, t, x, y)
-        v_yy = grad(grad(self.v_net, argnums=3), argnums=3)(params, t, x, y)
+        d = partials(
+            partial(self.neural_net, params),
+            "txy",
+            {
+                "u": ["t", "x", "y", "xx", "yy"],
+                "v": ["t", "x", "y", "xx", "yy"],
+                "p": ["x", "y"],
+            },
+            outnames=("u", "v", "p"),
+        )(t, x, y)
+
+        u, v, p = d["u"], d["v"], d["p"]
+        u_t, u_x, u_y, u_xx, u_yy = d["u_t"], d["u_x"], d["u_y"], d["u_xx"], d["u_yy"]
+        v_t, v_x, v_y, v_xx, v_yy = d["v_t"], d["v_x"], d["v_y"], d["v_xx"], d["v_yy"]
+        p_x, p_y = d["p_x"], d["p_y"]
 
         # PDE residual
         ru = u_t + u * u_x + v * u_y + p_x - (u_xx + u_yy) / self.Re
@@ -127,34 +125,18 @@ class NavierStokes2D(ForwardIVP):
         _, _, _, _, v_out = self.r_net(params, t, x, y)
         return v_out
 
-    @partial(jit, static_argnums=(0,))
-    def res_and_w(self, params, batch):
-        # Sort temporal coordinates
-        t_sorted = batch[:, 0].sort()
+    def residual_batch(self, batch):
+        return batch["res"]
+
+    def causal_residuals(self, params, batch):
         ru_pred, rv_pred, rc_pred, _, _ = self.r_pred_fn(
-            params, t_sorted, batch[:, 1], batch[:, 2]
+            params, batch[:, 0], batch[:, 1], batch[:, 2]
         )
-
-        ru_pred = ru_pred.reshape(self.num_chunks, -1)
-        rv_pred = rv_pred.reshape(self.num_chunks, -1)
-        rc_pred = rc_pred.reshape(self.num_chunks, -1)
-
-        ru_l = jnp.mean(ru_pred**2, axis=1)
-        rv_l = jnp.mean(rv_pred**2, axis=1)
-        rc_l = jnp.mean(rc_pred**2, axis=1)
-
-        ru_gamma = lax.stop_gradient(jnp.exp(-self.tol * (self.M @ ru_l)))
-        rv_gamma = lax.stop_gradient(jnp.exp(-self.tol * (self.M @ rv_l)))
-        rc_gamma = lax.stop_gradient(jnp.exp(-self.tol * (self.M @ rc_l)))
-
-        # Take minimum of the causal weights
-        gamma = jnp.vstack([ru_gamma, rv_gamma, rc_gamma])
-        gamma = gamma.min(0)
-
-        return ru_l, rv_l, rc_l, gamma
+        return ru_pred, rv_pred, rc_pred
 
     @partial(jit, static_argnums=(0,))
-    def compute_diag_ntk(self, params, batch):
+    def compute_diag_ntk(self, params, batch, *args, causal=None, key=None):
+        keys = self.ntk_keys(key)
         # Unpack batch
         ic_batch = batch["ic"]
         inflow_batch = batch["inflow"]
@@ -162,101 +144,143 @@ class NavierStokes2D(ForwardIVP):
         noslip_batch = batch["noslip"]
         res_batch = batch["res"]
 
-        coords_batch, u_batch, v_batch, p_batch = ic_batch
+        coords_batch, _ = ic_batch
 
-        u_ic_ntk = vmap(ntk_fn, (None, None, None, 0, 0))(
-            self.u_net, params, 0.0, coords_batch[:, 0], coords_batch[:, 1]
+        u_ic_ntk = self.diag_ntk(
+            self.u_net,
+            params,
+            0.0,
+            coords_batch[:, 0],
+            coords_batch[:, 1],
+            key=next(keys),
         )
-        v_ic_ntk = vmap(ntk_fn, (None, None, None, 0, 0))(
-            self.v_net, params, 0.0, coords_batch[:, 0], coords_batch[:, 1]
+        v_ic_ntk = self.diag_ntk(
+            self.v_net,
+            params,
+            0.0,
+            coords_batch[:, 0],
+            coords_batch[:, 1],
+            key=next(keys),
         )
-        p_ic_ntk = vmap(ntk_fn, (None, None, None, 0, 0))(
-            self.p_net, params, 0.0, coords_batch[:, 0], coords_batch[:, 1]
+        p_ic_ntk = self.diag_ntk(
+            self.p_net,
+            params,
+            0.0,
+            coords_batch[:, 0],
+            coords_batch[:, 1],
+            key=next(keys),
         )
 
-        u_in_ntk = vmap(ntk_fn, (None, None, 0, 0, 0))(
+        u_in_ntk = self.diag_ntk(
             self.u_net,
             params,
             inflow_batch[:, 0],
             inflow_batch[:, 1],
             inflow_batch[:, 2],
+            key=next(keys),
         )
-        v_in_ntk = vmap(ntk_fn, (None, None, 0, 0, 0))(
+        v_in_ntk = self.diag_ntk(
             self.v_net,
             params,
             inflow_batch[:, 0],
             inflow_batch[:, 1],
             inflow_batch[:, 2],
+            key=next(keys),
         )
 
-        u_out_ntk = vmap(ntk_fn, (None, None, 0, 0, 0))(
+        u_out_ntk = self.diag_ntk(
             self.u_out_net,
             params,
             outflow_batch[:, 0],
             outflow_batch[:, 1],
             outflow_batch[:, 2],
+            key=next(keys),
         )
-        v_out_ntk = vmap(ntk_fn, (None, None, 0, 0, 0))(
+        v_out_ntk = self.diag_ntk(
             self.v_out_net,
             params,
             outflow_batch[:, 0],
             outflow_batch[:, 1],
             outflow_batch[:, 2],
+            key=next(keys),
         )
 
-        u_noslip_ntk = vmap(ntk_fn, (None, None, 0, 0, 0))(
+        u_noslip_ntk = self.diag_ntk(
             self.u_net,
             params,
             noslip_batch[:, 0],
             noslip_batch[:, 1],
             noslip_batch[:, 2],
+            key=next(keys),
         )
-        v_noslip_ntk = vmap(ntk_fn, (None, None, 0, 0, 0))(
+        v_noslip_ntk = self.diag_ntk(
             self.v_net,
             params,
             noslip_batch[:, 0],
             noslip_batch[:, 1],
             noslip_batch[:, 2],
+            key=next(keys),
         )
 
         # Consider the effect of causal weights
         if self.config.weighting.use_causal:
-            res_batch = jnp.array(
-                [res_batch[:, 0].sort(), res_batch[:, 1], res_batch[:, 2]]
-            ).T
-            ru_ntk = vmap(ntk_fn, (None, None, 0, 0, 0))(
-                self.ru_net, params, res_batch[:, 0], res_batch[:, 1], res_batch[:, 2]
+            if causal is None:
+                causal = self.causal_terms(params, batch)
+            # the points in time order for the causal chunks
+            res_batch = causal["batch"]
+            ru_ntk = self.diag_ntk(
+                self.ru_net,
+                params,
+                res_batch[:, 0],
+                res_batch[:, 1],
+                res_batch[:, 2],
+                key=next(keys),
             )
-            rv_ntk = vmap(ntk_fn, (None, None, 0, 0, 0))(
-                self.rv_net, params, res_batch[:, 0], res_batch[:, 1], res_batch[:, 2]
+            rv_ntk = self.diag_ntk(
+                self.rv_net,
+                params,
+                res_batch[:, 0],
+                res_batch[:, 1],
+                res_batch[:, 2],
+                key=next(keys),
             )
-            rc_ntk = vmap(ntk_fn, (None, None, 0, 0, 0))(
-                self.rc_net, params, res_batch[:, 0], res_batch[:, 1], res_batch[:, 2]
+            rc_ntk = self.diag_ntk(
+                self.rc_net,
+                params,
+                res_batch[:, 0],
+                res_batch[:, 1],
+                res_batch[:, 2],
+                key=next(keys),
             )
 
-            ru_ntk = ru_ntk.reshape(self.num_chunks, -1)  # shape: (num_chunks, -1)
-            rv_ntk = rv_ntk.reshape(self.num_chunks, -1)
-            rc_ntk = rc_ntk.reshape(self.num_chunks, -1)
-
-            ru_ntk = jnp.mean(
-                ru_ntk, axis=1
-            )  # average convergence rate over each chunk
-            rv_ntk = jnp.mean(rv_ntk, axis=1)
-            rc_ntk = jnp.mean(rc_ntk, axis=1)
-
-            _, _, _, causal_weights = self.res_and_w(params, res_batch)
-            ru_ntk = ru_ntk * causal_weights  # multiply by causal weights
-            rv_ntk = rv_ntk * causal_weights
-            rc_ntk = rc_ntk * causal_weights
+            # average convergence rate over each chunk, times the causal weights
+            ru_ntk = self.causal_ntk(ru_ntk, causal)
+            rv_ntk = self.causal_ntk(rv_ntk, causal)
+            rc_ntk = self.causal_ntk(rc_ntk, causal)
         else:
-            ru_ntk = vmap(ntk_fn, (None, None, 0, 0, 0))(
-                self.ru_net, params, res_batch[:, 0], res_batch[:, 1], res_batch[:, 2]
+            ru_ntk = self.diag_ntk(
+                self.ru_net,
+                params,
+                res_batch[:, 0],
+                res_batch[:, 1],
+                res_batch[:, 2],
+                key=next(keys),
             )
-            rv_ntk = vmap(ntk_fn, (None, None, 0, 0, 0))(
-                self.rv_net, params, res_batch[:, 0], res_batch[:, 1], res_batch[:, 2]
+            rv_ntk = self.diag_ntk(
+                self.rv_net,
+                params,
+                res_batch[:, 0],
+                res_batch[:, 1],
+                res_batch[:, 2],
+                key=next(keys),
             )
-            rc_ntk = vmap(ntk_fn, (None, None, 0, 0, 0))(
-                self.rc_net, params, res_batch[:, 0], res_batch[:, 1], res_batch[:, 2]
+            rc_ntk = self.diag_ntk(
+                self.rc_net,
+                params,
+                res_batch[:, 0],
+                res_batch[:, 1],
+                res_batch[:, 2],
+                key=next(keys),
             )
 
         ntk_dict = {
@@ -277,7 +301,7 @@ class NavierStokes2D(ForwardIVP):
         return ntk_dict
 
     @partial(jit, static_argnums=(0,))
-    def losses(self, params, batch):
+    def losses(self, params, batch, ics, causal=None):
         # Unpack batch
         ic_batch = batch["ic"]
         inflow_batch = batch["inflow"]
@@ -285,8 +309,12 @@ class NavierStokes2D(ForwardIVP):
         noslip_batch = batch["noslip"]
         res_batch = batch["res"]
 
-        # Initial condition loss
-        coords_batch, u_batch, v_batch, p_batch = ic_batch
+        # Initial condition loss, the window's initial condition is a traced argument
+        # so that all time windows share the compiled step
+        coords_batch, idx = ic_batch
+        u_batch = ics["u0"][idx]
+        v_batch = ics["v0"][idx]
+        p_batch = ics["p0"][idx]
 
         u_ic_pred = self.u0_pred_fn(params, 0.0, coords_batch[:, 0], coords_batch[:, 1])
         v_ic_pred = self.v0_pred_fn(params, 0.0, coords_batch[:, 0], coords_batch[:, 1])
@@ -330,7 +358,10 @@ class NavierStokes2D(ForwardIVP):
 
         # residual loss
         if self.config.weighting.use_causal == True:
-            ru_l, rv_l, rc_l, gamma = self.res_and_w(params, res_batch)
+            if causal is None:
+                causal = self.causal_terms(params, batch)
+            ru_l, rv_l, rc_l = causal["losses"]
+            gamma = causal["weights"]
             ru_loss = jnp.mean(gamma * ru_l)
             rv_loss = jnp.mean(gamma * rv_l)
             rc_loss = jnp.mean(gamma * rc_l)
@@ -463,12 +494,8 @@ class NavierStokesEvaluator(BaseEvaluator):
     #     log_dict['U_pred'] = fig
     #     fig.close()
 
-    def __call__(self, state, batch):
-        self.log_dict = super().__call__(state, batch)
-
-        if self.config.weighting.use_causal:
-            _, _, _, causal_weight = self.model.res_and_w(state.params, batch["res"])
-            self.log_dict["cas_weight"] = causal_weight.min()
+    def __call__(self, state, batch, ics):
+        self.log_dict = super().__call__(state, batch, ics)
 
         # if self.config.logging.log_errors:
         #     self.log_errors(state.params, coords, u_ref, v_ref)
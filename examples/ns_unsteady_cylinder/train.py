@@ -21,33 +21,34 @@ import wandb
 
 import models
 
-from jaxpi.samplers import BaseSampler, SpaceSampler, TimeSpaceSampler
+from jaxpi.samplers import (
+    BaseSampler,
+    SpaceSampler,
+    TimeSpaceSampler,
+    MultiSampler,
+    MeshSampler,
+    CausalChunkSampler,
+)
 from jaxpi.logging import Logger
+from jaxpi.parallel import create_mesh, replicate, unreplicate
 from jaxpi.utils import save_checkpoint
 
-from utils import get_dataset, get_fine_mesh, parabolic_inflow
+from utils import get_dataset, get_fine_mesh, get_cells, parabolic_inflow
 
 
 class ICSampler(SpaceSampler):
-    def __init__(self, u, v, p, coords, batch_size, rng_key=random.PRNGKey(1234)):
-        super().__init__(coords, batch_size, rng_key)
+    def sample(self, key):
+        """Generates batch_size initial points and their indices into `coords`.
 
-        self.u = u
-        self.v = v
-        self.p = p
-
-    @partial(pmap, static_broadcasted_argnums=(0,))
-    def data_generation(self, key):
-        "Generates data containing batch_size samples"
+        The initial condition values change with every time window, they are looked up
+        from the indices in `losses` so that the sampler (a static argument of the
+        compiled train step) stays the same across windows.
+        """
         idx = random.choice(key, self.coords.shape[0], shape=(self.batch_size,))
 
         coords_batch = self.coords[idx, :]
 
-        u_batch = self.u[idx]
-        v_batch = self.v[idx]
-        p_batch = self.p[idx]
-
-        batch = (coords_batch, u_batch, v_batch, p_batch)
+        batch = (coords_batch, idx)
 
         return batch
 
@@ -68,8 +69,7 @@ class ResSampler(BaseSampler):
         self.coarse_coords = coarse_coords
         self.fine_coords = fine_coords
 
-    @partial(pmap, static_broadcasted_argnums=(0,))
-    def data_generation(self, key):
+    def sample(self, key):
         "Generates data containing batch_size samples"
         subkeys = random.split(key, 4)
 
@@ -105,7 +105,36 @@ class ResSampler(BaseSampler):
         return batch
 
 
-def train_one_window(config, workdir, model, samplers, idx):
+class TimeMeshSampler(BaseSampler):
+    def __init__(
+        self,
+        temporal_dom,
+        mesh_sampler,
+        rng_key=random.PRNGKey(1234),
+    ):
+        super().__init__(mesh_sampler.batch_size, rng_key)
+
+        self.temporal_dom = temporal_dom
+        self.mesh_sampler = mesh_sampler
+
+    def sample(self, key):
+        "Generates data containing batch_size samples, uniform inside the mesh cells"
+        key1, key2 = random.split(key)
+
+        temporal_batch = random.uniform(
+            key1,
+            shape=(self.batch_size, 1),
+            minval=self.temporal_dom[0],
+            maxval=self.temporal_dom[1],
+        )
+        spatial_batch = self.mesh_sampler.sample(key2)
+
+        batch = jnp.concatenate([temporal_batch, spatial_batch], axis=1)
+
+        return batch
+
+
+def train_one_window(config, workdir, model, sampler, ics, idx):
     # Initialize evaluator
     evaluator = models.NavierStokesEvaluator(config, model)
 
@@ -114,29 +143,32 @@ def train_one_window(config, workdir, model, samplers, idx):
 
     step_offset = idx * config.training.max_steps
 
+    # Batches drawn on the host are only needed for logging, all five
+    # loss batches are sampled inside the compiled train step
+    batch_iter = iter(sampler)
+    steps_per_call = config.training.steps_per_call
+
+    # The initial condition is passed to the compiled functions as a traced argument
+    ics_replicated = replicate(ics, model.mesh)
+
     # jit warm up
     print("Waiting for JIT...")
     start_time = time.time()
-    for step in range(config.training.max_steps):
-        # Sample mini-batch
-        batch = {}
-        for key, sampler in samplers.items():
-            batch[key] = next(sampler)
-
-        model.state = model.step(model.state, batch)
-
-        # Update weights if necessary
-        if config.weighting.scheme in ["grad_norm", "ntk"]:
-            if step % config.weighting.update_every_steps == 0:
-                model.state = model.update_weights(model.state, batch)
+    for step in range(0, config.training.max_steps, steps_per_call):
+        # Sample mini-batches and update the model (and loss weights) on device
+        model.state, _ = model.train_steps(
+            model.state, steps_per_call, sampler, ics_replicated
+        )
 
         # Log training metrics, only use host 0 to record results
         if jax.process_index() == 0:
             if step % config.logging.log_every_steps == 0:
+                batch = next(batch_iter)
+
                 # Get the first replica of the state and batch
-                state = jax.device_get(tree_map(lambda x: x[0], model.state))
-                batch = jax.device_get(tree_map(lambda x: x[0], batch))
-                log_dict = evaluator(state, batch)
+                state = jax.device_get(unreplicate(model.state))
+                batch = jax.device_get(unreplicate(batch))
+                log_dict = evaluator(state, batch, ics)
                 wandb.log(log_dict, step + step_offset)
 
                 end_time = time.time()
@@ -146,9 +178,9 @@ def train_one_window(config, workdir, model, samplers, idx):
 
         # Save checkpoint
         if config.saving.save_every_steps is not None:
-            if (step + 1) % config.saving.save_every_steps == 0 or (
-                step + 1
-            ) == config.training.max_steps:
+            if (step + steps_per_call) % config.saving.save_every_steps == 0 or (
+                step + steps_per_call
+            ) >= config.training.max_steps:
                 ckpt_path = os.path.join(os.getcwd(), config.wandb.name, "ckpt", "time_window_{}".format(idx + 1))
                 save_checkpoint(model.state, ckpt_path, keep=config.saving.num_keep_ckpts)
 
@@ -178,6 +210,10 @@ def train_and_evaluate(config: ml_collections.ConfigDict, workdir: str):
         fine_coords_near_cyl,
     ) = get_fine_mesh()  # finer mesh for evaluating PDE residuals
 
+    # Cells of the fine mesh, node indices are unaffected by the nondimensionalization
+    if config.training.res_sampler == "cells":
+        fine_cells = get_cells(fine_coords)
+
     noslip_coords = jnp.vstack((wall_coords, cyl_coords))
 
     # T = 1.0  # final time of simulation
@@ -228,68 +264,86 @@ def train_and_evaluate(config: ml_collections.ConfigDict, workdir: str):
     v0 = v_ref[-1, :]
     p0 = p_ref[-1, :]
 
-    for idx in range(config.training.num_time_windows):
-        logging.info("Training time window {}".format(idx + 1))
-
-        # Initialize Sampler
-        keys = random.split(random.PRNGKey(0), 5)
-        ic_sampler = iter(
-            ICSampler(
-                u0, v0, p0, coords, config.training.ic_batch_size, rng_key=keys[0]
-            )
-        )
-        inflow_sampler = iter(
-            TimeSpaceSampler(
-                temporal_dom,
-                inflow_coords,
-                config.training.inflow_batch_size,
-                rng_key=keys[1],
-            )
+    # Initialize Sampler
+    keys = random.split(random.PRNGKey(0), 5)
+    ic_sampler = ICSampler(coords, config.training.ic_batch_size, rng_key=keys[0])
+    inflow_sampler = TimeSpaceSampler(
+        temporal_dom,
+        inflow_coords,
+        config.training.inflow_batch_size,
+        rng_key=keys[1],
+    )
+    outflow_sampler = TimeSpaceSampler(
+        temporal_dom,
+        outflow_coords,
+        config.training.outflow_batch_size,
+        rng_key=keys[2],
+    )
+    noslip_sampler = TimeSpaceSampler(
+        temporal_dom,
+        noslip_coords,
+        config.training.noslip_batch_size,
+        rng_key=keys[3],
+    )
+    if config.training.res_sampler == "nodes":
+        res_sampler = ResSampler(
+            temporal_dom,
+            fine_coords,
+            fine_coords,
+            config.training.res_batch_size,
+            rng_key=keys[4],
         )
-        outflow_sampler = iter(
-            TimeSpaceSampler(
-                temporal_dom,
-                outflow_coords,
-                config.training.outflow_batch_size,
-                rng_key=keys[2],
-            )
+
+    elif config.training.res_sampler == "cells":
+        # ResSampler draws res_batch_size points from each of its two node sets,
+        # keep the same number of residual points
+        res_sampler = TimeMeshSampler(
+            temporal_dom,
+            MeshSampler(fine_coords, fine_cells, 2 * config.training.res_batch_size),
+            rng_key=keys[4],
         )
-        noslip_sampler = iter(
-            TimeSpaceSampler(
-                temporal_dom,
-                noslip_coords,
-                config.training.noslip_batch_size,
-                rng_key=keys[3],
-            )
+
+    else:
+        raise NotImplementedError(
+            f"Residual sampler {config.training.res_sampler} not supported yet!"
         )
 
-        res_sampler = iter(
-            ResSampler(
-                temporal_dom,
-                fine_coords,
-                fine_coords,
-                config.training.res_batch_size,
-                rng_key=keys[4],
-            )
+    # Stratify the residual times over the causal chunks, in chunk order
+    if config.weighting.use_causal and config.weighting.chunk_sampling:
+        res_sampler = CausalChunkSampler(
+            res_sampler, temporal_dom, config.weighting.num_chunks
         )
 
-        samplers = {
+    sampler = MultiSampler(
+        {
             "ic": ic_sampler,
             "inflow": inflow_sampler,
             "outflow": outflow_sampler,
             "noslip": noslip_sampler,
             "res": res_sampler,
-        }
+        },
+        rng_key=random.PRNGKey(0),
+        mesh=create_mesh(config),
+    )
+
+    # A single model and sampler serve all time windows, the initial condition of
+    # each window is a traced argument, so the train step is compiled once
+    model = models.NavierStokes2D(config, inflow_fn, temporal_dom, coords, Re)
+    init_state = model.state
+
+    for idx in range(config.training.num_time_windows):
+        logging.info("Training time window {}".format(idx + 1))
 
-        # Initialize model
-        model = models.NavierStokes2D(config, inflow_fn, temporal_dom, coords, Re)
+        # Every time window starts from the initial parameters
+        model.state = init_state
+        ics = {"u0": u0, "v0": v0, "p0": p0}
 
         # Train model for the current time window
-        model = train_one_window(config, workdir, model, samplers, idx)
+        model = train_one_window(config, workdir, model, sampler, ics, idx)
 
         # Update the initial condition for the next time window
         if config.training.num_time_windows > 1:
-            state = jax.device_get(jax.tree_util.tree_map(lambda x: x[0], model.state))
+            state = jax.device_get(unreplicate(model.state))
             params = state.params
             u0 = vmap(model.u_net, (None, None, 0, 0))(
                 params, t1, coords[:, 0], coords[:, 1]
@@ -301,4 +355,4 @@ def train_and_evaluate(config: ml_collections.ConfigDict, workdir: str):
                 params, t1, coords[:, 0], coords[:, 1]
             )
 
-            del model, state, params
+            del state, params
@@ -1,5 +1,7 @@
 import jax.numpy as jnp
 
+from scipy.spatial import Delaunay
+
 
 def parabolic_inflow(y, U_max):
     u = 4 * U_max * y * (0.41 - y) / (0.41**2)
@@ -41,3 +43,11 @@ def get_fine_mesh():
     fine_coords_near_cyl = jnp.array(data["coords"])
 
     return fine_coords, fine_coords_near_cyl
+
+
+def get_cells(coords):
+    """Triangulates the mesh nodes, dropping the triangles inside the cylinder"""
+    cells = Delaunay(coords).simplices
+    centroids = coords[cells].mean(axis=1)
+    inside = jnp.linalg.norm(centroids - jnp.array([0.2, 0.2]), axis=1) < 0.05
+    return jnp.array(cells[~inside])
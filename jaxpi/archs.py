@@ -4,7 +4,8 @@ from typing import Any, Callable, Sequence, Tuple, Optional, Union, Dict
 from flax import linen as nn
 from flax.core.frozen_dict import freeze
 
-from jax import random, jit, vmap
+import jax
+from jax import random, jit, vmap, custom_jvp
 import jax.numpy as jnp
 from jax.nn.initializers import glorot_normal, normal, zeros, constant
 
@@ -26,6 +27,66 @@ def _get_activation(str):
         raise NotImplementedError(f"Activation {str} not supported yet!")
 
 
+def _remat(layer_fn, remat):
+    """Wraps `layer_fn(module, *args)`, the body of one hidden layer, in `nn.remat`.
+
+    With "per_layer" no activations inside the layer are kept for the backward pass
+    and the layer is recomputed instead, with "dots_saveable" only the matmul outputs
+    are kept. Parameter names are unchanged, so checkpoints work with any policy.
+    """
+    if remat == "none":
+        return layer_fn
+
+    elif remat == "per_layer":
+        return nn.remat(layer_fn)
+
+    elif remat == "dots_saveable":
+        return nn.remat(layer_fn, policy=jax.checkpoint_policies.dots_saveable)
+
+    else:
+        raise NotImplementedError(f"Remat {remat} not supported yet!")
+
+
+def _dot_precision(dtype, precision):
+    """The matmul precision of float32 operands computed in `dtype`, or `precision`.
+
+    Casting the operands to bfloat16 inside the vmapped and differentiated layers
+    crashes the XLA compiler on CPU, so the reduced precision is requested on the
+    float32 dot instead: "bfloat16" is a single bfloat16 pass (the default precision
+    of TPUs), accumulated in float32.
+    """
+    if dtype is None:
+        return precision
+    if precision is not None:
+        raise ValueError("Set either arch.compute_dtype or arch.matmul_precision")
+    if jnp.dtype(dtype) == jnp.bfloat16:
+        return "bfloat16"
+    if jnp.dtype(dtype) == jnp.float32:
+        return "float32"
+    raise ValueError(f"arch.compute_dtype {dtype} not supported, use bfloat16")
+
+
+@partial(custom_jvp, nondiff_argnums=(2,))
+def _mixed_precision_dot(x, kernel, precision):
+    """Computes `x @ kernel` with matmul `precision` (e.g. "bfloat16").
+
+    Only the value is computed at reduced precision, the derivatives with respect to
+    `x` and `kernel` are computed at the global precision, so gradients and PDE
+    residual derivatives keep full precision. Taylor-mode `jet` ignores custom
+    derivative rules, so jet-based residuals run at the reduced precision.
+    """
+    return jnp.dot(x, kernel, precision=precision, preferred_element_type=x.dtype)
+
+
+@_mixed_precision_dot.defjvp
+def _mixed_precision_dot_jvp(precision, primals, tangents):
+    x, kernel = primals
+    x_dot, kernel_dot = tangents
+    y = _mixed_precision_dot(x, kernel, precision)
+    y_dot = jnp.dot(x_dot, kernel) + jnp.dot(x, kernel_dot)
+    return y, y_dot
+
+
 def _weight_fact(init_fn, mean, stddev):
     def init(key, shape):
         key1, key2 = random.split(key)
@@ -96,6 +157,8 @@ class Dense(nn.Module):
     kernel_init: Callable = glorot_normal()
     bias_init: Callable = zeros
     reparam: Union[None, Dict] = None
+    dtype: Optional[str] = None  # compute dtype of the matmul, e.g. "bfloat16"
+    precision: Optional[str] = None  # matmul precision, overriding the global default
 
     @nn.compact
     def __call__(self, x):
@@ -118,7 +181,11 @@ class Dense(nn.Module):
 
         bias = self.param("bias", self.bias_init, (self.features,))
 
-        y = jnp.dot(x, kernel) + bias
+        precision = _dot_precision(self.dtype, self.precision)
+        if precision is None:
+            y = jnp.dot(x, kernel) + bias
+        else:
+            y = _mixed_precision_dot(x, kernel, precision) + bias
 
         return y
 
@@ -135,6 +202,9 @@ class Mlp(nn.Module):
     periodicity: Union[None, Dict] = None
     fourier_emb: Union[None, Dict] = None
     reparam: Union[None, Dict] = None
+    remat: str = "none"
+    compute_dtype: Optional[str] = None
+    matmul_precision: Optional[str] = None
 
     def setup(self):
         self.activation_fn = _get_activation(self.activation)
@@ -147,9 +217,19 @@ class Mlp(nn.Module):
         if self.fourier_emb:
             x = FourierEmbs(**self.fourier_emb)(x)
 
+        def layer(module, x):
+            x = Dense(
+                features=module.hidden_dim,
+                reparam=module.reparam,
+                dtype=module.compute_dtype,
+                precision=module.matmul_precision,
+            )(x)
+            x = module.activation_fn(x)
+            return x
+
+        layer = _remat(layer, self.remat)
         for _ in range(self.num_layers):
-            x = Dense(features=self.hidden_dim, reparam=self.reparam)(x)
-            x = self.activation_fn(x)
+            x = layer(self, x)
 
         x = Dense(features=self.out_dim, reparam=self.reparam)(x)
         return x
@@ -164,6 +244,9 @@ class ModifiedMlp(nn.Module):
     periodicity: Union[None, Dict] = None
     fourier_emb: Union[None, Dict] = None
     reparam: Union[None, Dict] = None
+    remat: str = "none"
+    compute_dtype: Optional[str] = None
+    matmul_precision: Optional[str] = None
 
     def setup(self):
         self.activation_fn = _get_activation(self.activation)
@@ -176,16 +259,34 @@ class ModifiedMlp(nn.Module):
         if self.fourier_emb:
             x = FourierEmbs(**self.fourier_emb)(x)
 
-        u = Dense(features=self.hidden_dim, reparam=self.reparam)(x)
-        v = Dense(features=self.hidden_dim, reparam=self.reparam)(x)
+        # Hidden matmuls use the compute dtype, the embeddings and output layer float32
+        dense = partial(
+            Dense,
+            features=self.hidden_dim,
+            reparam=self.reparam,
+            dtype=self.compute_dtype,
+            precision=self.matmul_precision,
+        )
+        u = dense()(x)
+        v = dense()(x)
 
         u = self.activation_fn(u)
         v = self.activation_fn(v)
 
-        for _ in range(self.num_layers):
-            x = Dense(features=self.hidden_dim, reparam=self.reparam)(x)
-            x = self.activation_fn(x)
+        def layer(module, x, u, v):
+            x = Dense(
+                features=module.hidden_dim,
+                reparam=module.reparam,
+                dtype=module.compute_dtype,
+                precision=module.matmul_precision,
+            )(x)
+            x = module.activation_fn(x)
             x = x * u + (1 - x) * v
+            return x
+
+        layer = _remat(layer, self.remat)
+        for _ in range(self.num_layers):
+            x = layer(self, x, u, v)
 
         x = Dense(features=self.out_dim, reparam=self.reparam)(x)
         return x
@@ -198,15 +299,28 @@ class MlpBlock(nn.Module):
     activation: str
     reparam: Union[None, Dict]
     final_activation: bool
+    remat: str = "none"
+    compute_dtype: Optional[str] = None
+    matmul_precision: Optional[str] = None
 
     def setup(self):
         self.activation_fn = _get_activation(self.activation)
 
     @nn.compact
     def __call__(self, x):
+        def layer(module, x):
+            x = Dense(
+                features=module.hidden_dim,
+                reparam=module.reparam,
+                dtype=module.compute_dtype,
+                precision=module.matmul_precision,
+            )(x)
+            x = module.activation_fn(x)
+            return x
+
+        layer = _remat(layer, self.remat)
         for _ in range(self.num_layers):
-            x = Dense(features=self.hidden_dim, reparam=self.reparam)(x)
-            x = self.activation_fn(x)
+            x = layer(self, x)
 
         x = Dense(features=self.out_dim, reparam=self.reparam)(x)
         if self.final_activation:
@@ -225,6 +339,9 @@ class DeepONet(nn.Module):
     periodicity: Union[None, Dict] = None
     fourier_emb: Union[None, Dict] = None
     reparam: Union[None, Dict] = None
+    remat: str = "none"
+    compute_dtype: Optional[str] = None
+    matmul_precision: Optional[str] = None
 
     def setup(self):
         self.activation_fn = _get_activation(self.activation)
@@ -238,6 +355,9 @@ class DeepONet(nn.Module):
             activation=self.activation,
             final_activation=False,
             reparam=self.reparam,
+            remat=self.remat,
+            compute_dtype=self.compute_dtype,
+            matmul_precision=self.matmul_precision,
         )(u)
 
         x = Mlp(
@@ -248,9 +368,32 @@ class DeepONet(nn.Module):
             periodicity=self.periodicity,
             fourier_emb=self.fourier_emb,
             reparam=self.reparam,
+            remat=self.remat,
+            compute_dtype=self.compute_dtype,
+            matmul_precision=self.matmul_precision,
         )(x)
 
         y = u * x
         y = self.activation_fn(y)
         y = Dense(features=self.out_dim, reparam=self.reparam)(y)
         return y
+
+
+class HardConstraint(nn.Module):
+    """Imposes Dirichlet or initial conditions exactly on the outputs of `arch`.
+
+    The output is `lifting(x) + distance(x) * arch(x)`, where `distance` vanishes
+    where the conditions hold and `lifting` satisfies them there. Both take the
+    network inputs and return one value per output; unconstrained outputs use a
+    distance of 1 and a lifting of 0. The parameters of `arch` are nested under
+    "arch".
+    """
+
+    arch: nn.Module
+    distance: Callable
+    lifting: Callable
+
+    @nn.compact
+    def __call__(self, *args):
+        y = self.arch(*args)
+        return self.lifting(*args) + self.distance(*args) * y
@@ -0,0 +1,204 @@
+import itertools
+import math
+
+import numpy as np
+
+import jax
+import jax.numpy as jnp
+from jax import core, vmap
+from jax.extend import linear_util as lu
+from jax.experimental import jet as jet_module
+from jax.experimental.jet import jet
+
+
+def _remat_jet_rule(primals_in, series_in, *, jaxpr, policy, prevent_cse, **params):
+    """Taylor propagation through a `jax.checkpoint` block (see `arch.remat`).
+
+    The block is expanded with jet inside a new checkpoint with the same policy, so
+    the Taylor coefficients are rematerialized as well in the backward pass.
+    """
+    orders = [len(terms) for terms in series_in if terms is not jet_module.zero_series]
+    fn = lu.wrap_init(core.jaxpr_as_fun(core.ClosedJaxpr(jaxpr, ())))
+
+    if not orders:
+        # No input carries a series, so neither do the outputs
+        block = jax.checkpoint(fn.call_wrapped, prevent_cse=prevent_cse, policy=policy)
+        primals_out = block(*primals_in)
+        return primals_out, [jet_module.zero_series] * len(primals_out)
+
+    def jet_fn(primals, series):
+        jet_fn = jet_module.jet_fun(jet_module.jet_subtrace(fn), orders[0])
+        return jet_fn.call_wrapped(primals, series)
+
+    jet_fn = jax.checkpoint(jet_fn, prevent_cse=prevent_cse, policy=policy)
+    return jet_fn(primals_in, series_in)
+
+
+def _register_remat_jet_rule():
+    """Lets jet propagate through `jax.checkpoint` blocks, which it has no rule for.
+
+    The rule is built on jet's internal tracing API, which changed with the tracing
+    rewrite of jax 0.4.36, so it is only registered on older versions. Newer ones
+    are rejected by `check_remat`.
+    """
+    if jax.__version_info__ >= (0, 4, 36):
+        return
+
+    from jax._src.ad_checkpoint import remat_p
+
+    jet_module.jet_rules.setdefault(remat_p, _remat_jet_rule)
+
+
+def check_remat(remat):
+    """Raises if the `arch.remat` policy cannot be used with `partials`.
+
+    Models whose residuals use `partials` call it on their config, so that the
+    missing jet rule on jax 0.4.36 and later is reported before any tracing.
+    """
+    if remat != "none" and jax.__version_info__ >= (0, 4, 36):
+        raise ValueError(
+            f"arch.remat={remat} needs jax < 0.4.36 with the Taylor-mode partials of "
+            f"jaxpi.derivatives, which cannot propagate through checkpoint blocks on "
+            f"jax {jax.__version__}. Use arch.remat=none."
+        )
+
+
+def _multi_indices(dim, order):
+    "All multi-indices over `dim` variables with entries summing to `order`"
+    return [
+        alpha
+        for alpha in itertools.product(range(order + 1), repeat=dim)
+        if sum(alpha) == order
+    ]
+
+
+def _polarization(alpha):
+    """Directions and coefficients recovering the mixed partial `alpha`.
+
+    With n = |alpha| and S the variables in alpha, the n-th directional derivatives
+    along v_beta = beta / n, for all multi-indices beta over S with |beta| = n,
+    determine every n-th order partial over S:
+
+        D^n_{v_beta} f = sum_gamma n! / gamma! * v_beta^gamma * d^gamma f
+
+    Returns the directions (as multi-indices over all variables, scaled by 1/n) and
+    the row of the inverted system that yields d^alpha f.
+    """
+    order = sum(alpha)
+    axes = [i for i, a in enumerate(alpha) if a > 0]
+    basis = _multi_indices(len(axes), order)
+
+    directions = []
+    for beta in basis:
+        v = np.zeros(len(alpha))
+        v[axes] = np.array(beta) / order
+        directions.append(tuple(v))
+
+    M = np.array(
+        [
+            [
+                math.factorial(order)
+                / np.prod([math.factorial(g) for g in gamma])
+                * np.prod([(b / order) ** g for b, g in zip(beta, gamma)])
+                for gamma in basis
+            ]
+            for beta in basis
+        ]
+    )
+    row = np.linalg.inv(M)[basis.index(tuple(alpha[i] for i in axes))]
+    return directions, row
+
+
+def partials(fn, argnames, spec, outnames=None):
+    """Returns a function computing declared partial derivatives of a field.
+
+    All partials are read from Taylor-mode (`jax.experimental.jet`) propagations of
+    `fn` along a few input directions: one jet per derivative order, vectorized over
+    the directions of that order, shared by all outputs. A pure partial such as
+    "xx" uses the coordinate direction itself (lower orders along it come for free),
+    mixed partials such as "xy" or "xxy" are recovered by polarization from
+    directional derivatives of the same order.
+
+    Example:
+        d = partials(
+            lambda t, x, y: self.neural_net(params, t, x, y),
+            "txy",
+            {"u": ["t", "x", "y", "xx", "yy"], "p": ["x", "y"]},
+            outnames=("u", "v", "p"),
+        )(t, x, y)
+        u, u_t, u_xx = d["u"], d["u_t"], d["u_xx"]
+
+    Args:
+      fn: Function of scalar coordinates returning a scalar, a tuple or a dict of
+        scalar outputs.
+      argnames: One character naming each positional argument of `fn`.
+      spec: Maps output names to the partials to compute, each a string of
+        `argnames` characters.
+      outnames: Names of the outputs when `fn` returns a tuple (or a scalar).
+
+    Returns:
+      A function of the same arguments as `fn` returning a dict with the value of
+      every output in `spec` under its name and each partial under "<name>_<partial>".
+    """
+    _register_remat_jet_rule()
+    argnames = tuple(argnames)
+
+    # Directional derivatives D^m_v needed by every requested partial
+    requests = []
+    max_order = {}
+    for name, derivs in spec.items():
+        for deriv in derivs:
+            if not deriv or any(c not in argnames for c in deriv):
+                raise ValueError(f"Invalid partial {deriv} for arguments {argnames}!")
+
+            alpha = tuple(deriv.count(c) for c in argnames)
+            directions, row = _polarization(alpha)
+            requests.append((name, deriv, sum(alpha), directions, row))
+
+            for v in directions:
+                max_order[v] = max(max_order.get(v, 0), sum(alpha))
+
+    # One jet per order, vmapped over the directions propagated to that order
+    groups = {}
+    for v, order in max_order.items():
+        groups.setdefault(order, []).append(v)
+
+    def as_dict(outputs):
+        if isinstance(outputs, dict):
+            return outputs
+        if outnames is None:
+            (name,) = spec.keys()
+            return {name: outputs}
+        if not isinstance(outputs, (tuple, list)):
+            outputs = (outputs,)
+        return dict(zip(outnames, outputs))
+
+    def wrapped(*primals):
+        z = jnp.stack(primals)
+        g = lambda z: as_dict(fn(*[z[i] for i in range(len(argnames))]))
+
+        values = None
+        series = {}  # direction -> {name: [D^1_v, ..., D^order_v]}
+        for order, directions in groups.items():
+
+            def along(v):
+                zeros = jnp.zeros_like(v)
+                return jet(g, (z,), ([v] + [zeros] * (order - 1),))
+
+            primal_out, series_out = vmap(along)(jnp.array(directions))
+            if values is None:
+                values = {name: out[0] for name, out in primal_out.items()}
+            for i, v in enumerate(directions):
+                series[v] = {
+                    name: [term[i] for term in terms]
+                    for name, terms in series_out.items()
+                }
+
+        derivs = {name: values[name] for name in spec}
+        for name, deriv, order, directions, row in requests:
+            terms = [series[v][name][order - 1] for v in directions]
+            derivs[f"{name}_{deriv}"] = sum(c * d for c, d in zip(row, terms))
+
+        return derivs
+
+    return wrapped
@@ -1,6 +1,6 @@
 import jax.numpy as jnp
 
-from jax import jacrev
+from jax import jacrev, random, vmap
 from jax.tree_util import tree_map
 
 from jaxpi.utils import flatten_pytree
@@ -11,9 +11,14 @@ class BaseEvaluator:
         self.config = config
         self.model = model
         self.log_dict = {}
+        self.causal = None
+
+    def _causal_kwargs(self):
+        "Passes the causal terms of the evaluated batch to the model, if computed"
+        return {} if self.causal is None else {"causal": self.causal}
 
     def log_losses(self, params, batch, *args):
-        losses = self.model.losses(params, batch, *args)
+        losses = self.model.losses(params, batch, *args, **self._causal_kwargs())
 
         for key, values in losses.items():
             self.log_dict[key + "_loss"] = values
@@ -23,6 +28,11 @@ class BaseEvaluator:
         for key, values in weights.items():
             self.log_dict[key + "_weight"] = values
 
+        # Self-adaptive weights of the collocation pool points
+        if state.point_weights is not None:
+            self.log_dict["point_weight_mean"] = jnp.mean(state.point_weights)
+            self.log_dict["point_weight_max"] = jnp.max(state.point_weights)
+
     def log_grads(self, params, batch, *args):
         grads = jacrev(self.model.losses)(params, batch, *args)
         for key, value in grads.items():
@@ -30,18 +40,42 @@ class BaseEvaluator:
             grad_norm = jnp.linalg.norm(flattened_grad)
             self.log_dict[key + "_grad_norm"] = grad_norm
 
-    def log_ntk(self, params, batch, *args):
-        ntk = self.model.compute_diag_ntk(params, batch)
-        mean_ntk_dict = tree_map(lambda x: jnp.mean(x), ntk)
+    def log_ntk(self, params, batch, *args, key=None):
+        def mean_ntk_fn(key):
+            ntk = self.model.compute_diag_ntk(
+                params, batch, *args, key=key, **self._causal_kwargs()
+            )
+            return tree_map(lambda x: jnp.mean(x), ntk)
+
+        weighting = self.config.weighting
+        estimated = weighting.get("ntk_num_points") or weighting.get("ntk_num_probes")
+        if not estimated or key is None:
+            for key, values in mean_ntk_fn(key).items():
+                self.log_dict[key + "_ntk"] = values
+            return
+
+        # Means of independent draws of the sampled points and probes. Their spread is
+        # the sampling variance of the estimate, from the random probes shared by all
+        # points plus the choice of a point in each stratum, and it also holds for the
+        # causally weighted entries of the residuals
+        num_draws = self.config.logging.get("ntk_var_draws", 8)
+        mean_ntk_dict = vmap(mean_ntk_fn)(random.split(key, num_draws))
 
         for key, values in mean_ntk_dict.items():
-            self.log_dict[key + "_ntk"] = values
+            self.log_dict[key + "_ntk"] = jnp.mean(values)
+            self.log_dict[key + "_ntk_var"] = jnp.var(values, ddof=1) / num_draws
 
     def __call__(self, state, batch, *args):
         # Initialize the log dict
         self.log_dict = {}
         params = state.params
 
+        # Residuals of a causal model, evaluated once and shared by the logs below
+        self.causal = None
+        if self.config.weighting.get("use_causal", False):
+            self.causal = self.model.causal_terms(params, batch)
+            self.log_dict["cas_weight"] = self.causal["weights"].min()
+
         if self.config.logging.log_losses:
             self.log_losses(params, batch, *args)
 
@@ -52,6 +86,18 @@ class BaseEvaluator:
             self.log_grads(params, batch, *args)
 
         if self.config.logging.log_ntk:
-            self.log_ntk(params, batch, *args)
+            self.log_ntk(params, batch, *args, key=state.key)
 
         return self.log_dict
+
+    def population(self, state, batch, *args):
+        """Evaluates every member of a population state (see `config.population`).
+
+        Runs `__call__` vmapped over the member axis, so each logged value is an array
+        with one entry per member. Only numeric logs are supported, not plots.
+        """
+        log_dict = vmap(lambda state: self(state, batch, *args), axis_name="member")(
+            state
+        )
+        self.log_dict = log_dict
+        return log_dict
@@ -0,0 +1,334 @@
+from functools import cached_property
+
+import numpy as np
+
+import jax
+import jax.numpy as jnp
+from jax import grad, lax, random, vmap
+
+
+def _rejection_sample(draw, accept, key, num, rate):
+    """Returns `num` points of `draw(key, n)` that `accept` holds for, with a fixed
+    output shape.
+
+    Each round draws enough candidates for `num` valid ones at the acceptance `rate`
+    with a margin, so a single round almost always suffices. Rounds repeat with new
+    keys until `num` valid points are collected, in the order they were drawn.
+    """
+    if rate == 0:
+        raise ValueError("No candidate points are valid, the geometry is empty")
+    num_candidates = int(np.ceil(1.5 * num / rate)) + 64
+
+    def cond_fn(carry):
+        _, _, count = carry
+        return count < num
+
+    def body_fn(carry):
+        key, points, count = carry
+        key, subkey = random.split(key)
+        x = draw(subkey, num_candidates)
+        valid = accept(x)
+        # Write the valid candidates after the points collected so far
+        (idx,) = jnp.nonzero(valid, size=num_candidates, fill_value=0)
+        slots = jnp.where(jnp.arange(num_candidates) < jnp.sum(valid), count, num)
+        slots = slots + jnp.arange(num_candidates)
+        points = points.at[slots].set(x[idx], mode="drop")
+        return key, points, count + jnp.sum(valid)
+
+    points = jnp.zeros((num, 2))
+    _, points, _ = lax.while_loop(cond_fn, body_fn, (key, points, 0))
+    return points
+
+
+class Geometry:
+    """A 2D domain given by its signed distance function (SDF), negative inside.
+
+    `sdf`, `distance` and `normal` act on a single point and are meant to be vmapped
+    like the `*_net` functions of the models; `distance` vanishes on the boundary, so
+    it can multiply a network output to impose a boundary condition exactly. The
+    samplers draw fixed-size batches on device and can be traced into a train step.
+    Geometries combine with `|` (union), `&` (intersection) and `-` (difference).
+
+    `boundary_measure` is the total length of the curves `_boundary_candidates`
+    draws from, the boundary itself for the primitives.
+    """
+
+    def sdf(self, x):
+        raise NotImplementedError("Subclasses should implement this!")
+
+    def distance(self, x):
+        "Distance from `x` to the boundary"
+        return jnp.abs(self.sdf(x))
+
+    def normal(self, x):
+        "Outward unit normal at a boundary point `x`, the normalized SDF gradient"
+        n = grad(self.sdf)(x)
+        return n / jnp.linalg.norm(n)
+
+    @property
+    def bounds(self):
+        "Lower and upper corners of a bounding box"
+        raise NotImplementedError("Subclasses should implement this!")
+
+    def _boundary_candidates(self, key, num):
+        "Points drawn uniformly on a curve set containing the boundary"
+        raise NotImplementedError("Subclasses should implement this!")
+
+    @cached_property
+    def _tol(self):
+        lo, hi = self.bounds
+        return 1e-5 * float(jnp.max(hi - lo))
+
+    @cached_property
+    def _interior_rate(self):
+        "Fraction of the bounding box inside the domain"
+        with jax.ensure_compile_time_eval():
+            lo, hi = self.bounds
+            x = random.uniform(random.PRNGKey(0), (16384, 2), minval=lo, maxval=hi)
+            return float(jnp.mean(vmap(self.sdf)(x) < 0))
+
+    @cached_property
+    def _boundary_rate(self):
+        "Fraction of the boundary candidates on the boundary"
+        with jax.ensure_compile_time_eval():
+            x = self._boundary_candidates(random.PRNGKey(0), 16384)
+            return float(jnp.mean(jnp.abs(vmap(self.sdf)(x)) < self._tol))
+
+    def sample_interior(self, key, num):
+        "Draws `num` points uniformly inside the domain, by rejection from its bounds"
+        lo, hi = self.bounds
+        draw = lambda key, n: random.uniform(key, (n, 2), minval=lo, maxval=hi)
+        accept = lambda x: vmap(self.sdf)(x) < 0
+        return _rejection_sample(draw, accept, key, num, self._interior_rate)
+
+    def sample_boundary(self, key, num):
+        "Draws `num` points uniformly (by arc length) on the boundary"
+        accept = lambda x: jnp.abs(vmap(self.sdf)(x)) < self._tol
+        return _rejection_sample(
+            self._boundary_candidates, accept, key, num, self._boundary_rate
+        )
+
+    def __or__(self, other):
+        return Union(self, other)
+
+    def __and__(self, other):
+        return Intersection(self, other)
+
+    def __sub__(self, other):
+        return Difference(self, other)
+
+
+class Segment(Geometry):
+    """The line segment from `a` to `b`, e.g. one wall of a domain.
+
+    It has no interior, its SDF is the unsigned distance to the segment.
+    """
+
+    def __init__(self, a, b):
+        self.a = jnp.asarray(a, dtype=jnp.float32)
+        self.b = jnp.asarray(b, dtype=jnp.float32)
+        self.boundary_measure = float(np.linalg.norm(np.subtract(b, a)))
+
+    def sdf(self, x):
+        e = self.b - self.a
+        s = jnp.clip(jnp.dot(x - self.a, e) / jnp.dot(e, e), 0.0, 1.0)
+        return jnp.linalg.norm(x - self.a - s * e)
+
+    @property
+    def bounds(self):
+        return jnp.minimum(self.a, self.b), jnp.maximum(self.a, self.b)
+
+    def _boundary_candidates(self, key, num):
+        s = random.uniform(key, (num, 1))
+        return self.a + s * (self.b - self.a)
+
+    def sample_interior(self, key, num):
+        raise NotImplementedError("A segment has no interior")
+
+    def sample_boundary(self, key, num):
+        return self._boundary_candidates(key, num)
+
+    def boundary_grid(self, num):
+        "`num` evenly spaced points from `a` to `b`, both included"
+        s = jnp.linspace(0, 1, num)[:, None]
+        return self.a + s * (self.b - self.a)
+
+
+class Polygon(Geometry):
+    "A simple polygon with the given vertices, in either orientation"
+
+    def __init__(self, vertices):
+        v = np.asarray(vertices, dtype=np.float32)
+        e = np.roll(v, -1, axis=0) - v
+        self.vertices = jnp.asarray(v)
+        self.edges = jnp.asarray(e)
+        self.lengths = jnp.asarray(np.linalg.norm(e, axis=1))
+        self.boundary_measure = float(np.sum(np.linalg.norm(e, axis=1)))
+
+        # +1 for counterclockwise vertices, where the interior is left of every edge
+        self.orientation = float(np.sign(np.sum(v[:, 0] * e[:, 1] - v[:, 1] * e[:, 0])))
+
+    def sdf(self, x):
+        v, e = self.vertices, self.edges
+
+        # Nearest edge
+        w = x - v
+        s = jnp.sum(w * e, axis=1) / self.lengths**2
+        b = w - jnp.clip(s, 0.0, 1.0)[:, None] * e
+        d2 = jnp.sum(b**2, axis=1)
+        k = jnp.argmin(d2)
+
+        # Inside if a ray along +x crosses the boundary an odd number of times
+        straddles = (v[:, 1] <= x[1]) != (v[:, 1] + e[:, 1] <= x[1])
+        t = (x[1] - v[:, 1]) / jnp.where(e[:, 1] == 0, 1.0, e[:, 1])
+        crosses = straddles & (v[:, 0] + t * e[:, 0] > x[0])
+        inside = jnp.sum(crosses) % 2 == 1
+
+        # Facing the nearest edge, the signed distance to its line, which is smooth
+        # across the boundary (its gradient is the edge normal), else to its vertex
+        facing = (s[k] > 0.0) & (s[k] < 1.0)
+        cross = e[k, 0] * w[k, 1] - e[k, 1] * w[k, 0]
+        line = -self.orientation * cross / self.lengths[k]
+        corner = jnp.sqrt(jnp.where(facing, 1.0, d2[k]))
+
+        return jnp.where(facing, line, jnp.where(inside, -corner, corner))
+
+    @property
+    def bounds(self):
+        return jnp.min(self.vertices, axis=0), jnp.max(self.vertices, axis=0)
+
+    def _boundary_candidates(self, key, num):
+        key1, key2 = random.split(key)
+        edge = random.choice(key1, len(self.lengths), (num,), p=self.lengths)
+        s = random.uniform(key2, (num, 1))
+        return self.vertices[edge] + s * self.edges[edge]
+
+    def sample_boundary(self, key, num):
+        return self._boundary_candidates(key, num)
+
+    def boundary_grid(self, num):
+        "`num` points evenly spaced by arc length on the edges, from the first vertex"
+        arc = jnp.linspace(0, self.boundary_measure, num, endpoint=False)
+        ends = jnp.cumsum(self.lengths)
+        edge = jnp.searchsorted(ends, arc, side="right")
+        s = (arc - (ends[edge] - self.lengths[edge])) / self.lengths[edge]
+        return self.vertices[edge] + s[:, None] * self.edges[edge]
+
+
+class Rectangle(Polygon):
+    "The axis-aligned rectangle with lower corner `lo` and upper corner `hi`"
+
+    def __init__(self, lo, hi):
+        (x0, y0), (x1, y1) = lo, hi
+        super().__init__([[x0, y0], [x1, y0], [x1, y1], [x0, y1]])
+        self.lo = jnp.asarray(lo, dtype=jnp.float32)
+        self.hi = jnp.asarray(hi, dtype=jnp.float32)
+
+    def sample_interior(self, key, num):
+        return random.uniform(key, (num, 2), minval=self.lo, maxval=self.hi)
+
+
+class Step(Polygon):
+    """A backward-facing step: the channel from `lo` to `hi` without the block from
+    `lo` to `corner`, so the flow enters on the left above the step."""
+
+    def __init__(self, lo, hi, corner):
+        (x0, y0), (x1, y1), (xc, yc) = lo, hi, corner
+        super().__init__([[xc, y0], [x1, y0], [x1, y1], [x0, y1], [x0, yc], [xc, yc]])
+
+
+class Circle(Geometry):
+    "The disk with the given `center` and `radius`"
+
+    def __init__(self, center, radius):
+        self.center = jnp.asarray(center, dtype=jnp.float32)
+        self.radius = radius
+        self.boundary_measure = 2 * np.pi * radius
+
+    def sdf(self, x):
+        return jnp.linalg.norm(x - self.center) - self.radius
+
+    @property
+    def bounds(self):
+        return self.center - self.radius, self.center + self.radius
+
+    def _boundary_candidates(self, key, num):
+        theta = random.uniform(key, (num,), maxval=2 * jnp.pi)
+        return self.center + self.radius * jnp.stack(
+            [jnp.cos(theta), jnp.sin(theta)], axis=1
+        )
+
+    def sample_interior(self, key, num):
+        key1, key2 = random.split(key)
+        r = self.radius * jnp.sqrt(random.uniform(key1, (num, 1)))
+        theta = random.uniform(key2, (num, 1), maxval=2 * jnp.pi)
+        return self.center + r * jnp.concatenate([jnp.cos(theta), jnp.sin(theta)], 1)
+
+    def sample_boundary(self, key, num):
+        return self._boundary_candidates(key, num)
+
+    def boundary_grid(self, num):
+        "`num` evenly spaced points on the circle"
+        theta = jnp.linspace(0, 2 * jnp.pi, num, endpoint=False)
+        return self.center + self.radius * jnp.stack(
+            [jnp.cos(theta), jnp.sin(theta)], axis=1
+        )
+
+
+class _Composite(Geometry):
+    """Combines the SDFs of `parts`. The boundary is drawn from the parts' boundaries,
+    proportionally to their lengths, keeping the points on the combined boundary."""
+
+    def __init__(self, *parts):
+        self.parts = parts
+
+    @property
+    def boundary_measure(self):
+        return sum(part.boundary_measure for part in self.parts)
+
+    def _boundary_candidates(self, key, num):
+        keys = random.split(key, len(self.parts) + 1)
+        candidates = jnp.stack(
+            [
+                part._boundary_candidates(subkey, num)
+                for part, subkey in zip(self.parts, keys[1:])
+            ]
+        )
+        p = jnp.array([part.boundary_measure for part in self.parts])
+        part = random.choice(keys[0], len(self.parts), (num,), p=p)
+        return candidates[part, jnp.arange(num)]
+
+
+class Union(_Composite):
+    def sdf(self, x):
+        return jnp.min(jnp.stack([part.sdf(x) for part in self.parts]))
+
+    @property
+    def bounds(self):
+        lo, hi = zip(*[part.bounds for part in self.parts])
+        return jnp.min(jnp.stack(lo), axis=0), jnp.max(jnp.stack(hi), axis=0)
+
+
+class Intersection(_Composite):
+    def sdf(self, x):
+        return jnp.max(jnp.stack([part.sdf(x) for part in self.parts]))
+
+    @property
+    def bounds(self):
+        lo, hi = zip(*[part.bounds for part in self.parts])
+        return jnp.max(jnp.stack(lo), axis=0), jnp.min(jnp.stack(hi), axis=0)
+
+
+class Difference(_Composite):
+    "The points of `a` outside `b`"
+
+    def __init__(self, a, b):
+        super().__init__(a, b)
+
+    def sdf(self, x):
+        a, b = self.parts
+        return jnp.maximum(a.sdf(x), -b.sdf(x))
+
+    @property
+    def bounds(self):
+        return self.parts[0].bounds
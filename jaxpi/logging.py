@@ -1,4 +1,6 @@
 import logging
+
+import numpy as np
 from tabulate import tabulate
 
 
@@ -12,6 +14,11 @@ def get_log_keys(log_dict):
     return key_list
 
 
+def format_value(value):
+    "Formats a scalar, or the per-member values of a population, in scientific notation"
+    return " ".join("{:.3e}".format(v) for v in np.ravel(value))
+
+
 class Logger:
     def __init__(self, name: str = "main"):
         self.logger = logging.getLogger(name)
@@ -31,7 +38,7 @@ class Logger:
     def log_iter(self, step, start_time, end_time, log_dict):
         log_keys = get_log_keys(log_dict)
 
-        log_list = [[key, "{:.3e}".format(log_dict[key])] for key in log_keys]
+        log_list = [[key, format_value(log_dict[key])] for key in log_keys]
 
         message = tabulate(
             log_list,
@@ -4,23 +4,34 @@ from typing import Any, Callable, Sequence, Tuple, Optional, Dict
 from flax.training import train_state
 from flax import jax_utils
 
+import jax
 import jax.numpy as jnp
-from jax import lax, jit, grad, pmap, random, tree_map, jacfwd, jacrev
+from jax import lax, jit, grad, value_and_grad, pmap, random, tree_map, jacfwd, jacrev, vmap
 from jax.tree_util import tree_map, tree_reduce, tree_leaves
 
 import optax
 
 from jaxpi import archs
-from jaxpi.utils import flatten_pytree
+from jaxpi.parallel import create_mesh, replicate, data_parallel
+from jaxpi.utils import diag_ntk_fn
+from jaxpi.weighting import create_scheme, grad_norms, weights_from_grad_norms
 
 
 class TrainState(train_state.TrainState):
     weights: Dict
     momentum: float
+    key: Any = None  # PRNG key for samplers traced into the train step
+    grad_norms: Any = None  # running average of the per-loss gradient norms
+    weighting_state: Any = None  # state of the loss-based weighting schemes
+    point_weights: Any = None  # self-adaptive weights of the collocation pool points
 
-    def apply_weights(self, weights, **kwargs):
+    def apply_weights(self, weights=None, grad_norms=None, **kwargs):
         """Updates `weights` using running average  in return value.
 
+        With `grad_norms` instead of `weights`, the running average is taken over the
+        per-loss gradient norms, kept in `self.grad_norms`, and the new weights are the
+        grad-norm weights of the averaged norms.
+
         Returns:
           An updated instance of `self` with new weights updated by applying `running_average`,
           and additional attributes replaced as specified by `kwargs`.
@@ -29,7 +40,17 @@ class TrainState(train_state.TrainState):
         running_average = (
             lambda old_w, new_w: old_w * self.momentum + (1 - self.momentum) * new_w
         )
-        weights = tree_map(running_average, self.weights, weights)
+        if grad_norms is None:
+            weights = tree_map(running_average, self.weights, weights)
+        else:
+            # The average starts from zeros, which the first norms replace
+            grad_norms = tree_map(
+                lambda old, new: jnp.where(old == 0, new, running_average(old, new)),
+                self.grad_norms,
+                grad_norms,
+            )
+            kwargs["grad_norms"] = lax.stop_gradient(grad_norms)
+            weights = weights_from_grad_norms(grad_norms)
         weights = lax.stop_gradient(weights)
 
         return self.replace(
@@ -41,6 +62,24 @@ class TrainState(train_state.TrainState):
         )
 
 
+def _member_value(values):
+    "Selects the current population member's entry of `values`, under the `member` axis"
+    return jnp.asarray(values)[lax.axis_index("member")]
+
+
+def _scale_by_member(scales):
+    "Scales updates by a per-member factor, giving each member its own learning rate"
+
+    def init_fn(params):
+        return optax.EmptyState()
+
+    def update_fn(updates, state, params=None):
+        scale = _member_value(scales)
+        return tree_map(lambda u: scale * u, updates), state
+
+    return optax.GradientTransformation(init_fn, update_fn)
+
+
 def _create_arch(config):
     if config.arch_name == "Mlp":
         arch = archs.Mlp(**config)
@@ -57,7 +96,7 @@ def _create_arch(config):
     return arch
 
 
-def _create_optimizer(config):
+def _create_optimizer(config, learning_rates=None):
     if config.optimizer == "Adam":
         lr = optax.exponential_decay(
             init_value=config.learning_rate,
@@ -71,6 +110,11 @@ def _create_optimizer(config):
     else:
         raise NotImplementedError(f"Optimizer {config.optimizer} not supported yet!")
 
+    # Per-member learning rates of a population, relative to the configured one
+    if learning_rates is not None:
+        scales = [lr / config.learning_rate for lr in learning_rates]
+        tx = optax.chain(tx, _scale_by_member(scales))
+
     # Gradient accumulation
     if config.grad_accum_steps > 1:
         tx = optax.MultiSteps(tx, every_k_schedule=config.grad_accum_steps)
@@ -78,33 +122,144 @@ def _create_optimizer(config):
     return tx
 
 
-def _create_train_state(config):
-    # Initialize network
+def _create_train_state(
+    config, mesh=None, output_transform=None, exact_losses=()
+):
+    population = config.get("population", None)
+    if population is not None and population.size is None:
+        population = None
+
+    # Initialize network, sampled PDE coefficients are extra inputs
     arch = _create_arch(config.arch)
-    x = jnp.ones(config.input_dim)
-    params = arch.init(random.PRNGKey(config.seed), x)
+    if output_transform is not None:
+        arch = archs.HardConstraint(arch, *output_transform)
+    parametric = config.get("parametric", None)
+    num_coefs = 0 if parametric is None or parametric.dom is None else len(parametric.dom)
+    x = jnp.ones(config.input_dim + num_coefs)
 
     # Initialize optax optimizer
-    tx = _create_optimizer(config.optim)
+    learning_rates = None if population is None else population.learning_rates
+    tx = _create_optimizer(config.optim, learning_rates)
 
-    # Convert config dict to dict
+    # Convert config dict to dict, without the losses the output transform satisfies
     init_weights = dict(config.weighting.init_weights)
+    for name in exact_losses:
+        init_weights.pop(name, None)
+
+    scheme = create_scheme(config.weighting)
+
+    # Running average of the gradient norms, updated at every step
+    grad_norms = None
+    if config.weighting.get("running_average", "weights") == "grad_norms":
+        grad_norms = {name: jnp.zeros(()) for name in init_weights}
+
+    # Self-adaptive weights of the points of the pools of all devices
+    point_weights = None
+    pool = config.training.get("pool", None)
+    if pool is not None and pool.get("point_weights_lr", None) is not None:
+        if pool.size is None or pool.refresh_every_epochs:
+            raise ValueError("Self-adaptive point weights need a fixed pool")
+        num_devices = jax.local_device_count() if mesh is None else mesh.size
+        point_weights = jnp.ones(num_devices * pool.size)
+
+    def create(seed, momentum):
+        params = arch.init(random.PRNGKey(seed), x)
+        weighting_state = None
+        if scheme is not None and scheme.needs == "losses":
+            key = random.fold_in(random.PRNGKey(seed), 2)
+            weighting_state = scheme.init(init_weights, key)
+        state = TrainState.create(
+            apply_fn=arch.apply,
+            params=params,
+            tx=tx,
+            weights=init_weights,
+            momentum=momentum,
+            key=random.fold_in(random.PRNGKey(seed), 1),
+            grad_norms=grad_norms,
+            weighting_state=weighting_state,
+            point_weights=point_weights,
+        )
+        return state
 
-    state = TrainState.create(
-        apply_fn=arch.apply,
-        params=params,
-        tx=tx,
-        weights=init_weights,
-        momentum=config.weighting.momentum,
-    )
+    if population is None:
+        state = create(config.seed, config.weighting.momentum)
 
-    return jax_utils.replicate(state)
+    else:
+        # Stack the members' states along a leading axis
+        size = population.size
+        seeds = population.seeds or [config.seed + i for i in range(size)]
+        momentums = population.momentums or [config.weighting.momentum] * size
+        state = vmap(create)(jnp.array(seeds), jnp.array(momentums))
+
+    return replicate(state, mesh)
 
 
 class PINN:
-    def __init__(self, config):
+    # Positions, among the extra arguments of `losses` after the batch, of arguments
+    # that are Python values (e.g. None) rather than arrays. `step`, `update_weights`,
+    # `step_and_reweight` and `train_steps` pass them as static arguments.
+    static_args = ()
+
+    def __init__(self, config, output_transform=None, exact_losses=()):
+        """
+        Args:
+          config: The experiment config.
+          output_transform: Optional `(distance, lifting)` functions of the network
+            inputs, imposing Dirichlet or initial conditions exactly through
+            `archs.HardConstraint`.
+          exact_losses: Names of the loss terms the output transform satisfies, which
+            `losses` then omits; they are dropped from the loss weights.
+        """
         self.config = config
-        self.state = _create_train_state(config)
+        self.mesh = create_mesh(config)
+        self.state = _create_train_state(
+            config, self.mesh, output_transform, exact_losses
+        )
+        self._executables = {}  # ahead-of-time compiled methods, see `compile`
+
+        # Loss weighting scheme, None for fixed weights (see `jaxpi.weighting`)
+        self.weighting = create_scheme(config.weighting)
+
+        # Grad-norm weights from a running average of every step's per-loss gradient
+        # norms, instead of a separate pass every `update_every_steps`. Every step then
+        # takes a backward pass per loss term, so this is off by default
+        running_average = config.weighting.get("running_average", "weights")
+        if running_average not in ["weights", "grad_norms"]:
+            raise ValueError(f"Unknown weighting.running_average {running_average}")
+        self.grad_norm_ema = running_average == "grad_norms"
+        if self.grad_norm_ema and config.weighting.scheme != "grad_norm":
+            raise ValueError(
+                'weighting.running_average="grad_norms" requires the "grad_norm" scheme'
+            )
+
+        # Number of vmapped population members, None for a single model
+        population = config.get("population", None)
+        self.population_size = None if population is None else population.size
+
+        # Ranges of the PDE coefficients sampled per point and fed to the network,
+        # None when training at fixed coefficients (see `coef_inputs`)
+        parametric = config.get("parametric", None)
+        self.coef_dom = None
+        if parametric is not None and parametric.dom is not None:
+            self.coef_dom = jnp.asarray(parametric.dom, dtype=float)
+            self.coef_log_scale = parametric.log_scale
+
+    def coef_inputs(self, *coefs):
+        """Rescales PDE coefficients to network inputs in [0, 1] over `coef_dom`.
+
+        Uses log scale if `parametric.log_scale` is set, and returns an empty list for
+        models trained at fixed coefficients, so that `jnp.stack([x, y, *coef_inputs])`
+        works in both cases.
+        """
+        if self.coef_dom is None:
+            return []
+
+        coefs = jnp.stack(coefs)
+        dom = self.coef_dom
+        if self.coef_log_scale:
+            coefs, dom = jnp.log(coefs), jnp.log(dom)
+        coefs = (coefs - dom[:, 0]) / (dom[:, 1] - dom[:, 0])
+        return list(coefs)
 
     def u_net(self, params, *args):
         raise NotImplementedError("Subclasses should implement this!")
@@ -115,9 +270,35 @@ class PINN:
     def losses(self, params, batch, *args):
         raise NotImplementedError("Subclasses should implement this!")
 
-    def compute_diag_ntk(self, params, batch, *args):
+    def compute_diag_ntk(self, params, batch, *args, key=None):
         raise NotImplementedError("Subclasses should implement this!")
 
+    def diag_ntk(self, apply_fn, params, *args, key=None):
+        """Diagonal NTK entries of `apply_fn` over the points in `args`, for
+        `compute_diag_ntk`. They are estimated on `weighting.ntk_num_points` points
+        with `weighting.ntk_num_probes` random probes if set, drawn with `key`, and
+        exact ones are computed `weighting.ntk_chunk_size` points at a time, see
+        `diag_ntk_fn`.
+        """
+        return diag_ntk_fn(
+            apply_fn,
+            params,
+            *args,
+            num_points=self.config.weighting.get("ntk_num_points", None),
+            num_probes=self.config.weighting.get("ntk_num_probes", None),
+            chunk_size=self.config.weighting.get("ntk_chunk_size", None),
+            key=key,
+        )
+
+    def ntk_keys(self, key):
+        "Yields a new subkey of `key` for each `diag_ntk` call, or None without a key"
+        while True:
+            if key is None:
+                yield None
+            else:
+                key, subkey = random.split(key)
+                yield subkey
+
     @partial(jit, static_argnums=(0,))
     def loss(self, params, weights, batch, *args):
         # Compute losses
@@ -129,61 +310,414 @@ class PINN:
         return loss
 
     @partial(jit, static_argnums=(0,))
-    def compute_weights(self, params, batch, *args):
-        if self.config.weighting.scheme == "grad_norm":
+    def compute_weights(self, params, batch, *args, key=None):
+        """Weights of a scheme that needs the per-loss gradients or the diagonal NTK.
+        `key` draws the points and probes of an estimated NTK."""
+        if self.weighting.needs == "grads":
             # Compute the gradient of each loss w.r.t. the parameters
             grads = jacrev(self.losses)(params, batch, *args)
+            w = self.weighting(grads)
 
-            # Compute the grad norm of each loss
-            grad_norm_dict = {}
-            for key, value in grads.items():
-                flattened_grad = flatten_pytree(value)
-                grad_norm_dict[key] = jnp.linalg.norm(flattened_grad)
-
-            # Compute the mean of grad norms over all losses
-            mean_grad_norm = jnp.mean(jnp.stack(tree_leaves(grad_norm_dict)))
-            # Grad Norm Weighting
-            w = tree_map(lambda x: (mean_grad_norm / x), grad_norm_dict)
-
-        elif self.config.weighting.scheme == "ntk":
+        elif self.weighting.needs == "ntk":
             # Compute the diagonal of the NTK of each loss
-            ntk = self.compute_diag_ntk(params, batch, *args)
-
-            # Compute the mean of the diagonal NTK corresponding to each loss
-            mean_ntk_dict = tree_map(lambda x: jnp.mean(x), ntk)
+            ntk = self.compute_diag_ntk(params, batch, *args, key=key)
+            w = self.weighting(ntk)
 
-            # Compute the average over all ntk means
-            mean_ntk = jnp.mean(jnp.stack(tree_leaves(mean_ntk_dict)))
-            # NTK Weighting
-            w = tree_map(lambda x: (mean_ntk / x), mean_ntk_dict)
+        else:
+            raise ValueError(
+                f"Weighting scheme {self.config.weighting.scheme} is updated at "
+                "every step from the losses"
+            )
 
         return w
 
-    @partial(pmap, axis_name="batch", static_broadcasted_argnums=(0,))
-    def update_weights(self, state, batch, *args):
-        weights = self.compute_weights(state.params, batch, *args)
+    def _members(self, fn):
+        """Maps a per-member function of `state` over the population axis.
+
+        Inside, the member index is bound to the `member` axis name, which per-member
+        hyperparameters such as learning rates and causal tolerances are selected by.
+        Other arguments are shared by all members. Without a population `fn` is
+        returned unchanged.
+        """
+        if self.population_size is None:
+            return fn
+
+        def mapped(state, *args):
+            return vmap(lambda state: fn(state, *args), axis_name="member")(state)
+
+        return mapped
+
+    def _update_weights(self, state, batch, *args):
+        "Per-device weight update, to be called over the `batch` axis"
+        if self.grad_norm_ema:
+            # The weights are already refreshed at every step
+            return state
+
+        batch, _, _ = self._pool_batch(state, batch)
+        # The estimated NTK samples points and probes with a subkey of the state's key
+        key = None
+        weighting = self.config.weighting
+        if weighting.get("ntk_num_points") or weighting.get("ntk_num_probes"):
+            key, subkey = random.split(state.key)
+            state = state.replace(key=key)
+            # Decorrelate replicas, which all hold the same key
+            key = random.fold_in(subkey, lax.axis_index("batch"))
+        weights = self.compute_weights(state.params, batch, *args, key=key)
         weights = lax.pmean(weights, "batch")
         state = state.apply_weights(weights=weights)
         return state
 
-    @partial(pmap, axis_name="batch", static_broadcasted_argnums=(0,))
-    def step(self, state, batch, *args):
-        grads = grad(self.loss)(state.params, state.weights, batch, *args)
+    def _sample(self, state, sampler):
+        "Draws a per-device batch from `sampler`, advancing the PRNG key held in `state`"
+        key, subkey = random.split(state.key)
+        # Decorrelate replicas, which all hold the same key
+        subkey = random.fold_in(subkey, lax.axis_index("batch"))
+        batch = sampler.sample(subkey)
+        return state.replace(key=key), batch
+
+    def _microbatched(self, grad_fn, batch):
+        """Averages the gradients and losses returned by `grad_fn(batch)` over
+        `optim.num_microbatches` slices of `batch`, computed one after another in a
+        `lax.scan`.
+
+        Only one microbatch of residual derivatives is held in memory at a time, at
+        the cost of a sequential loop inside the step. Every leaf of `batch` is split
+        along its leading axis with a stride, microbatch `i` taking the points `i`,
+        `i + num_microbatches`, ... Losses that couple the points of a batch, such as
+        the causal weights, are computed per microbatch; with the chunk-ordered
+        batches of `weighting.chunk_sampling` every microbatch thus still holds all
+        causal chunks in order.
+        """
+        num_microbatches = self.config.optim.num_microbatches
+        if num_microbatches <= 1:
+            return grad_fn(batch)
+
+        def split(x):
+            if x.shape[0] % num_microbatches != 0:
+                raise ValueError(
+                    f"Batch size {x.shape[0]} is not divisible by "
+                    f"num_microbatches = {num_microbatches}"
+                )
+            return x.reshape(-1, num_microbatches, *x.shape[1:]).swapaxes(0, 1)
+
+        def body_fn(carry, microbatch):
+            outputs = grad_fn(microbatch)
+            carry = tree_map(lambda x, y: x + y / num_microbatches, carry, outputs)
+            return carry, None
+
+        microbatches = tree_map(split, batch)
+        outputs = tree_map(
+            jnp.zeros_like, grad_fn(tree_map(lambda x: x[0], microbatches))
+        )
+        outputs, _ = lax.scan(body_fn, outputs, microbatches)
+        return outputs
+
+    def _pool_batch(self, state, batch):
+        """Splits a pool minibatch `(points, indices)` if the state holds self-adaptive
+        point weights, returning the points, their weights and their indices."""
+        if state.point_weights is None:
+            return batch, None, None
+
+        batch, idx = batch
+        return batch, state.point_weights[idx], idx
+
+    def _pool_losses(self, params, batch, point_weights, *args):
+        "`losses`, passing the self-adaptive weights of the residual points if any"
+        if point_weights is None:
+            return self.losses(params, batch, *args)
+        return self.losses(params, batch, *args, point_weights=point_weights)
+
+    def _ascend_point_weights(self, state, point_grads, batch_size):
+        """Gradient ascent step of the self-adaptive point weights, which maximize the
+        loss while the parameters minimize it.
+
+        `point_grads` holds the gradient of this device's loss for the whole pool,
+        which is zero outside its points. Scaled by the global batch size, the step of
+        a point is `training.pool.point_weights_lr` times its weighted squared
+        residual, independently of the batch size.
+        """
+        if point_grads is None:
+            return state
+
+        point_grads = lax.pmean(point_grads, "batch") * lax.psum(batch_size, "batch")
+        lr = self.config.training.pool.point_weights_lr
+        return state.replace(point_weights=state.point_weights + lr * point_grads)
+
+    def _train_step(self, state, batch, *args):
+        "Per-device optimizer step, to be called over the `batch` axis"
+
+        def loss_fn(params, point_weights, batch):
+            losses = self._pool_losses(params, batch, point_weights, *args)
+            weighted_losses = tree_map(lambda x, y: x * y, losses, state.weights)
+            loss = tree_reduce(lambda x, y: x + y, weighted_losses)
+            return loss, losses
+
+        def grad_fn(batch):
+            batch, point_weights, idx = self._pool_batch(state, batch)
+            (_, losses), (grads, point_grads) = value_and_grad(
+                loss_fn, argnums=(0, 1), has_aux=True
+            )(state.params, point_weights, batch)
+
+            # Gradient with respect to the weights of the whole pool
+            if idx is not None:
+                pool_grads = jnp.zeros_like(state.point_weights)
+                point_grads = pool_grads.at[idx].add(point_grads)
+            return (grads, point_grads), losses
+
+        (grads, point_grads), losses = self._microbatched(grad_fn, batch)
         grads = lax.pmean(grads, "batch")
+        losses = lax.pmean(losses, "batch")
+        state = self._ascend_point_weights(
+            state, point_grads, tree_leaves(batch)[0].shape[0]
+        )
         state = state.apply_gradients(grads=grads)
+
+        # Loss-based schemes reweight at every step, for the next one
+        if self.weighting is not None and self.weighting.needs == "losses":
+            weights, weighting_state = self.weighting.update(
+                state.weighting_state, state.weights, losses, state.momentum
+            )
+            state = state.replace(
+                weights=lax.stop_gradient(weights), weighting_state=weighting_state
+            )
+
+        return state, losses
+
+    def _step_and_reweight(self, state, batch, *args):
+        """Per-device gradient-based reweighting and optimizer step from the same
+        per-loss gradients.
+
+        The per-loss gradients are computed once, the weights are derived from them
+        and the update applies their weighted sum with the refreshed weights. Compared
+        with `step` followed by `update_weights`, the weights are thus computed at the
+        pre-step parameters and already used for the current update. With
+        `weighting.running_average="grad_norms"` this is the train step, and the
+        gradient norms rather than the weights are averaged over steps. Each per-loss
+        gradient only runs through the terms of its loss, so when the losses are
+        evaluated on their own points (initial, boundary and residual batches) they
+        cost about as much as the gradient of the weighted sum.
+        """
+
+        def loss_fn(params, point_weights, batch, key):
+            return self._pool_losses(params, batch, point_weights, *args)[key]
+
+        def grad_fn(batch):
+            batch, point_weights, idx = self._pool_batch(state, batch)
+            losses, grads, point_grads = {}, {}, {}
+            # One gradient per loss, each pruned by XLA to the terms it depends on
+            for key in state.weights:
+                losses[key], (grads[key], point_grads[key]) = value_and_grad(
+                    loss_fn, argnums=(0, 1)
+                )(state.params, point_weights, batch, key)
+
+            # Gradients with respect to the weights of the whole pool
+            if idx is not None:
+                point_grads = tree_map(
+                    lambda g: jnp.zeros_like(state.point_weights).at[idx].add(g),
+                    point_grads,
+                )
+            return (grads, point_grads), losses
+
+        (grads, point_grads), losses = self._microbatched(grad_fn, batch)
+
+        if self.grad_norm_ema:
+            norms = lax.pmean(grad_norms(grads), "batch")
+            state = state.apply_weights(grad_norms=norms)
+        else:
+            weights = self.weighting(grads)
+            weights = lax.pmean(weights, "batch")
+            state = state.apply_weights(weights=weights)
+
+        # Weighted sum of the per-loss gradients
+        keys = list(grads.keys())
+        weighted_sum = lambda *g: sum(
+            state.weights[key] * g_k for key, g_k in zip(keys, g)
+        )
+        grads = tree_map(weighted_sum, *[grads[key] for key in keys])
+        if state.point_weights is not None:
+            point_grads = weighted_sum(*[point_grads[key] for key in keys])
+        else:
+            point_grads = None
+
+        grads = lax.pmean(grads, "batch")
+        losses = lax.pmean(losses, "batch")
+        state = self._ascend_point_weights(
+            state, point_grads, tree_leaves(batch)[0].shape[0]
+        )
+        state = state.apply_gradients(grads=grads)
+        return state, losses
+
+    def compile(self, state, batch, *args):
+        """Compiles `step`, and `update_weights` for gradient- and NTK-based schemes,
+        ahead of time for inputs shaped like `state`, `batch` and `args`.
+
+        Later calls of these methods run the stored executables without tracing. With
+        the persistent compilation cache enabled (see
+        `jaxpi.utils.enable_compilation_cache`) the executables of a previous run with
+        the same shapes are loaded from disk instead of being recompiled.
+        """
+        type(self).step.compile(self, state, batch, *args)
+
+        needs = None if self.weighting is None else self.weighting.needs
+        if needs in ["grads", "ntk"] and not self.grad_norm_ema:
+            type(self).update_weights.compile(self, state, batch, *args)
+
+    @data_parallel(batch_argnums=(2,), args_argnum=3)
+    def update_weights(self, state, batch, *args):
+        return self._members(self._update_weights)(state, batch, *args)
+
+    @data_parallel(batch_argnums=(2,), args_argnum=3)
+    def step(self, state, batch, *args):
+        step_fn = self._step_and_reweight if self.grad_norm_ema else self._train_step
+        state, _ = self._members(step_fn)(state, batch, *args)
         return state
 
+    @data_parallel(batch_argnums=(2,), args_argnum=3)
+    def step_and_reweight(self, state, batch, *args):
+        "Gradient-based weight update and optimizer step on the same batch in one pass"
+        state, _ = self._members(self._step_and_reweight)(state, batch, *args)
+        return state
+
+    @data_parallel(static_argnums=(0, 2, 3), args_argnum=4)
+    def train_steps(self, state, num_steps, sampler, *args):
+        """Runs `num_steps` optimizer steps inside a single compiled `lax.scan`.
+
+        Each iteration draws a fresh batch on device with `sampler.sample`, using the
+        PRNG key carried in `state`, takes an optimizer step and, for gradient- and
+        NTK-based schemes, refreshes the loss weights every
+        `weighting.update_every_steps` steps, mirroring the host loop in the example
+        `train.py` files. Gradient-based refreshes go through `step_and_reweight`, so
+        they reuse the per-loss gradients for the update, which every step does with
+        `weighting.running_average="grad_norms"`. Loss-based schemes reweight at every
+        step. With `num_steps=1` this is a single step with sampling fused into the
+        same XLA program. Population members draw their own batches.
+
+        Args:
+          state: Replicated train state (see `jaxpi.parallel.replicate`).
+          num_steps: Number of optimizer steps to run (static).
+          sampler: A `BaseSampler` whose `sample` method generates one batch (static).
+          *args: Extra arguments forwarded to `losses`.
+
+        Returns:
+          The updated state and a dict of per-step losses stacked along the leading axis
+          (followed by the member axis for a population).
+        """
+        needs = None if self.weighting is None else self.weighting.needs
+
+        def member_fn(state, update):
+            state, batch = self._sample(state, sampler)
+
+            if self.grad_norm_ema:
+                state, losses = self._step_and_reweight(state, batch, *args)
+
+            elif needs == "grads":
+                state, losses = lax.cond(
+                    update,
+                    lambda state: self._step_and_reweight(state, batch, *args),
+                    lambda state: self._train_step(state, batch, *args),
+                    state,
+                )
+
+            else:
+                state, losses = self._train_step(state, batch, *args)
+
+                if needs == "ntk":
+                    state = lax.cond(
+                        update,
+                        lambda state: self._update_weights(state, batch, *args),
+                        lambda state: state,
+                        state,
+                    )
+
+            return state, losses
+
+        def body_fn(state, _):
+            # Members step in lockstep, deciding on the shared step keeps the cond a
+            # real branch instead of a select over both branches under vmap
+            step = state.step if self.population_size is None else state.step[0]
+            update = step % self.config.weighting.update_every_steps == 0
+            return self._members(member_fn)(state, update)
+
+        state, losses = lax.scan(body_fn, state, None, length=num_steps)
+        return state, losses
+
 
 class ForwardIVP(PINN):
-    def __init__(self, config):
-        super().__init__(config)
+    def __init__(self, config, output_transform=None, exact_losses=()):
+        super().__init__(config, output_transform, exact_losses)
 
         if config.weighting.use_causal:
-            self.tol = config.weighting.causal_tol
             self.num_chunks = config.weighting.num_chunks
             self.M = jnp.triu(jnp.ones((self.num_chunks, self.num_chunks)), k=1).T
 
+            # Batches of a `CausalChunkSampler` are already in chunk order
+            self.chunk_sampling = config.weighting.get("chunk_sampling", False)
+
+            # The subsampled NTK entries are averaged over the same chunks
+            num_points = config.weighting.get("ntk_num_points", None)
+            if num_points is not None and num_points % self.num_chunks != 0:
+                raise ValueError(
+                    f"weighting.ntk_num_points = {num_points} is not divisible by "
+                    f"num_chunks = {self.num_chunks}"
+                )
+
+    def causal_order(self, batch):
+        """Orders the points of a residual batch in time, for the causal weights.
+
+        The points (rows) are sorted by their time coordinate (column 0), keeping
+        each time with its spatial coordinates. Splitting the result into
+        `num_chunks` equal parts then gives the causal chunks. With
+        `weighting.chunk_sampling` the batch comes from a `CausalChunkSampler`,
+        which draws exactly batch_size / num_chunks points inside every chunk in
+        chunk order, so it is returned as is.
+        """
+        if self.chunk_sampling:
+            return batch
+        return batch[jnp.argsort(batch[:, 0])]
+
+    def residual_batch(self, batch):
+        "The residual points of a loss batch, which the causal weights are computed on"
+        return batch
+
+    def causal_residuals(self, params, batch):
+        "Tuple of the residuals at the points of a time-ordered residual batch"
+        raise NotImplementedError("Subclasses should implement this!")
+
+    @partial(jit, static_argnums=(0,))
+    def causal_terms(self, params, batch):
+        """Evaluates the residuals once on the residual points of `batch` and derives
+        everything causal training needs from them.
+
+        Returns a dict with the time-ordered residual points ("batch"), the mean
+        squared residuals over each of the `num_chunks` chunks, one array per residual
+        ("losses"), and the causal weights ("weights"), the minimum over residuals of
+        `exp(-tol * M @ l)`, without gradient. `losses` and `compute_diag_ntk` compute
+        it if not passed one, the evaluator passes the same dict to both.
+        """
+        batch = self.causal_order(self.residual_batch(batch))
+        residuals = self.causal_residuals(params, batch)
+
+        losses = tuple(
+            jnp.mean(r.reshape(self.num_chunks, -1) ** 2, axis=1) for r in residuals
+        )
+        gamma = jnp.stack([jnp.exp(-self.tol * (self.M @ l)) for l in losses])
+        weights = lax.stop_gradient(gamma.min(0))
+        return {"batch": batch, "losses": losses, "weights": weights}
+
+    def causal_ntk(self, ntk, causal):
+        """Averages the diagonal NTK of a residual, computed on the ordered points of
+        `causal["batch"]`, over each chunk and scales it by the causal weights."""
+        return jnp.mean(ntk.reshape(self.num_chunks, -1), axis=1) * causal["weights"]
+
+    @property
+    def tol(self):
+        "Causal tolerance, selected per member when training a population"
+        population = self.config.get("population", None)
+        if self.population_size is None or population.causal_tols is None:
+            return self.config.weighting.causal_tol
+        return _member_value(population.causal_tols)
+
 
 class ForwardBVP(PINN):
-    def __init__(self, config):
-        super().__init__(config)
+    def __init__(self, config, output_transform=None, exact_losses=()):
+        super().__init__(config, output_transform, exact_losses)
@@ -0,0 +1,166 @@
+from functools import partial, wraps
+
+import numpy as np
+
+import jax
+from jax import jit, pmap
+from jax.tree_util import tree_map
+from jax.sharding import Mesh, NamedSharding, PartitionSpec as P
+from jax.experimental.shard_map import shard_map
+
+from flax import jax_utils
+
+
+def create_mesh(config):
+    """Returns the device mesh selected by `config.parallel.backend`.
+
+    "pmap" (the default, also used when the config has no `parallel` section)
+    returns None, and all data-parallel functions fall back to `pmap` over the local
+    devices. "sharding" returns a 1D mesh with a "batch" axis over all global
+    devices, so the same code runs on a single host (e.g. with
+    `--xla_force_host_platform_device_count`) and on multi-process setups after
+    `jax.distributed.initialize()`.
+    """
+    parallel = config.get("parallel", None)
+    backend = "pmap" if parallel is None else parallel.backend
+
+    if backend == "pmap":
+        return None
+
+    elif backend == "sharding":
+        return Mesh(np.array(jax.devices()), ("batch",))
+
+    else:
+        raise NotImplementedError(f"Parallel backend {backend} not supported yet!")
+
+
+def replicate(tree, mesh=None):
+    "Replicates `tree` on every device, stacked (pmap) or as global arrays (mesh)"
+    if mesh is None:
+        return jax_utils.replicate(tree)
+
+    sharding = NamedSharding(mesh, P())
+
+    def put(x):
+        x = np.asarray(x)
+        return jax.make_array_from_callback(x.shape, sharding, lambda idx: x[idx])
+
+    return tree_map(put, tree)
+
+
+def unreplicate(tree):
+    """Returns the first local replica of every leaf.
+
+    Works for pmap outputs (leading device axis) and for global arrays, where the
+    first addressable shard is the full value of a replicated leaf and the local
+    device's part of a batch-sharded leaf.
+    """
+
+    def first(x):
+        if not isinstance(x, jax.Array):
+            return x
+        if isinstance(x.sharding, jax.sharding.PmapSharding):
+            return x[0]
+        return x.addressable_shards[0].data
+
+    return tree_map(first, tree)
+
+
+def data_parallel(static_argnums=(0,), batch_argnums=(), out_specs=P(), args_argnum=None):
+    """Maps a method over the "batch" axis with pmap or shard_map.
+
+    The wrapped function is written for a single device and may use collectives
+    over the "batch" axis name (e.g. `lax.pmean`). If the instance it is bound to
+    has no mesh (`self.mesh is None`), it is pmapped exactly like
+    `partial(pmap, axis_name="batch", static_broadcasted_argnums=static_argnums)`.
+    Otherwise it is jitted and shard_mapped over `self.mesh`: arguments in
+    `batch_argnums` are split along their leading axis, every other traced argument
+    is replicated, and outputs follow `out_specs`.
+
+    If the method takes `*args` starting at position `args_argnum`, the entries of
+    them listed in the instance's `static_args` (positions within `*args`) are static
+    as well, so subclasses can pass Python values such as None there.
+
+    The wrapped method also gets a `compile(self, *args)` attribute that lowers and
+    compiles it ahead of time for the given arguments. The executable is stored in
+    `self._executables` and later calls with the same static arguments dispatch to
+    it directly, skipping tracing (the traced arguments must then keep their shapes).
+    """
+
+    def decorator(fn):
+        transforms = {}
+
+        def transform(static_argnums):
+            "The pmapped and sharded `fn` for the given static arguments, built once"
+            if static_argnums in transforms:
+                return transforms[static_argnums]
+
+            pmapped = pmap(
+                fn, axis_name="batch", static_broadcasted_argnums=static_argnums
+            )
+
+            @partial(jit, static_argnums=static_argnums)
+            def sharded(*args):
+                self = args[0]
+                dynamic_argnums = [
+                    i for i in range(len(args)) if i not in static_argnums
+                ]
+                in_specs = tuple(
+                    P("batch") if i in batch_argnums else P() for i in dynamic_argnums
+                )
+
+                def body(*dynamic_args):
+                    all_args = list(args)
+                    for i, arg in zip(dynamic_argnums, dynamic_args):
+                        all_args[i] = arg
+                    return fn(*all_args)
+
+                return shard_map(
+                    body,
+                    mesh=self.mesh,
+                    in_specs=in_specs,
+                    out_specs=out_specs,
+                    check_rep=False,
+                )(*[args[i] for i in dynamic_argnums])
+
+            transforms[static_argnums] = pmapped, sharded
+            return pmapped, sharded
+
+        def all_static_argnums(self):
+            static_args = getattr(self, "static_args", ())
+            if args_argnum is None or not static_args:
+                return tuple(static_argnums)
+            return tuple(static_argnums) + tuple(args_argnum + i for i in static_args)
+
+        def split(static, args):
+            key = tuple(a for i, a in enumerate(args, 1) if i in static)
+            dynamic = [a for i, a in enumerate(args, 1) if i not in static]
+            return (fn.__name__, key), dynamic
+
+        @wraps(fn)
+        def wrapper(self, *args):
+            static = all_static_argnums(self)
+            key, dynamic = split(static, args)
+            executable = getattr(self, "_executables", {}).get(key)
+            if executable is not None:
+                return executable(*dynamic)
+
+            pmapped, sharded = transform(static)
+            if self.mesh is None:
+                return pmapped(self, *args)
+            return sharded(self, *args)
+
+        def compile(self, *args):
+            static = all_static_argnums(self)
+            key, _ = split(static, args)
+            pmapped, sharded = transform(static)
+            lowered = (pmapped if self.mesh is None else sharded).lower(self, *args)
+            executable = lowered.compile()
+            self._executables[key] = executable
+            return executable
+
+        wrapper.compile = compile
+
+        return wrapper
+
+    return decorator
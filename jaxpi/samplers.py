@@ -1,37 +1,97 @@
 from abc import ABC, abstractmethod
+from collections import deque
 from functools import partial
 
+import numpy as np
+from scipy.stats import qmc
+
+import jax
 import jax.numpy as jnp
-from jax import random, pmap, local_device_count
+from jax import lax, random, jit, pmap, vmap, local_device_count
+from jax.tree_util import tree_map
+from jax.sharding import NamedSharding, PartitionSpec as P
+from jax.experimental.shard_map import shard_map
 
 from torch.utils.data import Dataset
 
+from jaxpi.parallel import replicate, data_parallel
+
 
 class BaseSampler(Dataset):
-    def __init__(self, batch_size, rng_key=random.PRNGKey(1234)):
+    def __init__(self, batch_size, rng_key=random.PRNGKey(1234), mesh=None):
         self.batch_size = batch_size
         self.key = rng_key
+        self.mesh = mesh
         self.num_devices = local_device_count()
 
     def __getitem__(self, index):
         "Generate one batch of data"
         self.key, subkey = random.split(self.key)
-        keys = random.split(subkey, self.num_devices)
-        batch = self.data_generation(keys)
+        if self.mesh is None:
+            keys = random.split(subkey, self.num_devices)
+            batch = self.data_generation(keys)
+        else:
+            batch = self.sharded_data_generation(replicate(subkey, self.mesh))
         return batch
 
+    @partial(pmap, static_broadcasted_argnums=(0,))
     def data_generation(self, key):
+        "Generates data containing batch_size samples on each device"
+        return self.sample(key)
+
+    @partial(jit, static_argnums=(0,))
+    def sharded_data_generation(self, key):
+        "Generates a global batch sharded along the leading axis of `self.mesh`"
+
+        def sample(key):
+            key = random.fold_in(key, lax.axis_index("batch"))
+            return self.sample(key)
+
+        return shard_map(
+            sample, mesh=self.mesh, in_specs=P(), out_specs=P("batch"), check_rep=False
+        )(key)
+
+    def sample(self, key):
+        "Generates a single-device batch, pure in `key` so it can be traced into a train step"
         raise NotImplementedError("Subclasses should implement this!")
 
+    def batch_spec(self):
+        """Shapes, dtypes and shardings of the batches of `__getitem__`, as
+        `jax.ShapeDtypeStruct`s, to compile for them without drawing a batch."""
+        spec = jax.eval_shape(self.sample, self.key)
+        if self.mesh is None:
+            shape = lambda s: (self.num_devices,) + s.shape
+            sharding = None
+        else:
+            shape = lambda s: (self.mesh.size * s.shape[0],) + s.shape[1:]
+            sharding = NamedSharding(self.mesh, P("batch"))
+        return tree_map(
+            lambda s: jax.ShapeDtypeStruct(shape(s), s.dtype, sharding=sharding), spec
+        )
+
+
+def prefetch(sampler, size=2):
+    """Iterates over `sampler` with `size` batches in flight (double buffering by default).
+
+    Sampling is dispatched asynchronously, so drawing the next batch before the
+    current one is consumed lets the host work of sampling (key splitting, launching
+    the sampling program) overlap the previous train step instead of delaying it.
+    The batches are the same as from `iter(sampler)`.
+    """
+    iterator = iter(sampler)
+    queue = deque(next(iterator) for _ in range(size))
+    while True:
+        yield queue.popleft()
+        queue.append(next(iterator))
+
 
 class UniformSampler(BaseSampler):
-    def __init__(self, dom, batch_size, rng_key=random.PRNGKey(1234)):
-        super().__init__(batch_size, rng_key)
+    def __init__(self, dom, batch_size, rng_key=random.PRNGKey(1234), mesh=None):
+        super().__init__(batch_size, rng_key, mesh)
         self.dom = dom
         self.dim = dom.shape[0]
 
-    @partial(pmap, static_broadcasted_argnums=(0,))
-    def data_generation(self, key):
+    def sample(self, key):
         "Generates data containing batch_size samples"
         batch = random.uniform(
             key,
@@ -43,13 +103,112 @@ class UniformSampler(BaseSampler):
         return batch
 
 
+class SobolSampler(UniformSampler):
+    """Scrambled Sobol points in the box `dom`.
+
+    The unscrambled net of 2^m >= batch_size points is computed once on the host;
+    every batch applies a fresh random linear matrix scramble and digital shift on
+    device, which keeps the net's stratification. Batch sizes that are powers of two
+    give balanced nets.
+    """
+
+    def __init__(self, dom, batch_size, rng_key=random.PRNGKey(1234), mesh=None):
+        super().__init__(dom, batch_size, rng_key, mesh)
+        m = int(np.ceil(np.log2(batch_size)))
+        net = qmc.Sobol(d=self.dim, scramble=False).random_base2(m)[:batch_size]
+        self.net = jnp.asarray((net * 2**32).astype(np.uint64).astype(np.uint32))
+
+    def sample(self, key):
+        "Generates data containing batch_size samples"
+        key1, key2 = random.split(key)
+        bits = 2 ** jnp.arange(31, -1, -1, dtype=jnp.uint32)
+
+        # Random lower triangular bit matrices with unit diagonal, one per dimension,
+        # stored as one mask per output bit
+        lower = random.bernoulli(key1, shape=(self.dim, 32, 32))
+        lower = jnp.tril(lower, k=-1) | jnp.eye(32, dtype=bool)
+        masks = jnp.sum(jnp.where(lower, bits, 0), axis=-1, dtype=jnp.uint32)
+
+        # Output bit j is the parity of the input bits selected by mask j
+        parity = lax.population_count(self.net[:, :, None] & masks) & 1
+        x = jnp.sum(parity * bits, axis=-1, dtype=jnp.uint32)
+
+        # Random digital shift
+        x = x ^ random.bits(key2, (self.dim,), dtype=jnp.uint32)
+
+        u = (x >> 8).astype(jnp.float32) / 2**24
+        batch = self.dom[:, 0] + u * (self.dom[:, 1] - self.dom[:, 0])
+
+        return batch
+
+
+def _primes(num):
+    "The first `num` prime numbers"
+    primes = []
+    n = 2
+    while len(primes) < num:
+        if all(n % p for p in primes if p * p <= n):
+            primes.append(n)
+        n += 1
+    return primes
+
+
+class HaltonSampler(UniformSampler):
+    """Scrambled Halton points in the box `dom`.
+
+    Coordinate j is the radical inverse of the point index in the j-th prime base,
+    with an independent random permutation of the digits at every position, drawn
+    afresh for every batch.
+    """
+
+    def __init__(self, dom, batch_size, rng_key=random.PRNGKey(1234), mesh=None):
+        super().__init__(dom, batch_size, rng_key, mesh)
+        self.primes = _primes(self.dim)
+
+    def sample(self, key):
+        "Generates data containing batch_size samples"
+        idx = jnp.arange(self.batch_size)
+
+        coords = []
+        for j, base in enumerate(self.primes):
+            # Number of digits resolving float32 precision in this base
+            num_digits = int(np.ceil(24 * np.log(2) / np.log(base)))
+            keys = random.split(random.fold_in(key, j), num_digits)
+            perms = vmap(lambda key: random.permutation(key, base))(keys)
+
+            u = jnp.zeros(self.batch_size)
+            n = idx
+            for k in range(num_digits):
+                u = u + perms[k][n % base] / float(base) ** (k + 1)
+                n = n // base
+            coords.append(u)
+
+        u = jnp.stack(coords, axis=1)
+        batch = self.dom[:, 0] + u * (self.dom[:, 1] - self.dom[:, 0])
+
+        return batch
+
+
+class LatinHypercubeSampler(UniformSampler):
+    "Latin hypercube points in the box `dom`, one point per stratum of every axis"
+
+    def sample(self, key):
+        "Generates data containing batch_size samples"
+        key1, key2 = random.split(key)
+        keys = random.split(key1, self.dim)
+        strata = vmap(lambda key: random.permutation(key, self.batch_size))(keys).T
+        u = (strata + random.uniform(key2, (self.batch_size, self.dim))) / self.batch_size
+        batch = self.dom[:, 0] + u * (self.dom[:, 1] - self.dom[:, 0])
+
+        return batch
+
+
 class SpaceSampler(BaseSampler):
-    def __init__(self, coords, batch_size, rng_key=random.PRNGKey(1234)):
-        super().__init__(batch_size, rng_key)
+    def __init__(self, coords, batch_size, rng_key=random.PRNGKey(1234), mesh=None):
+        super().__init__(batch_size, rng_key, mesh)
         self.coords = coords
 
-    @partial(pmap, static_broadcasted_argnums=(0,))
-    def data_generation(self, key):
+    def sample(self, key):
         "Generates data containing batch_size samples"
         idx = random.choice(key, self.coords.shape[0], shape=(self.batch_size,))
         batch = self.coords[idx, :]
@@ -57,17 +216,127 @@ class SpaceSampler(BaseSampler):
         return batch
 
 
+class GeometrySampler(BaseSampler):
+    """Draws points uniformly inside a `jaxpi.geometry.Geometry`, or on its boundary
+    with `boundary=True`."""
+
+    def __init__(
+        self,
+        geometry,
+        batch_size,
+        boundary=False,
+        rng_key=random.PRNGKey(1234),
+        mesh=None,
+    ):
+        super().__init__(batch_size, rng_key, mesh)
+        self.geometry = geometry
+        self.boundary = boundary
+
+    def sample(self, key):
+        "Generates data containing batch_size samples"
+        if self.boundary:
+            return self.geometry.sample_boundary(key, self.batch_size)
+
+        return self.geometry.sample_interior(key, self.batch_size)
+
+
+def _alias_table(probs):
+    """Walker's alias table (Vose's construction) for the discrete distribution `probs`.
+
+    Drawing a uniform slot i and a uniform u, and taking i if u < prob[i] else
+    alias[i], samples from `probs` in O(1) per draw.
+    """
+    n = len(probs)
+    scaled = n * np.asarray(probs, dtype=np.float64) / np.sum(probs)
+    prob = np.ones(n)
+    alias = np.arange(n)
+
+    small = list(np.flatnonzero(scaled < 1.0))
+    large = list(np.flatnonzero(scaled >= 1.0))
+    while small and large:
+        s, l = small.pop(), large.pop()
+        prob[s], alias[s] = scaled[s], l
+        scaled[l] = scaled[l] + scaled[s] - 1.0
+        if scaled[l] < 1.0:
+            small.append(l)
+        else:
+            large.append(l)
+
+    return prob, alias
+
+
+class MeshSampler(BaseSampler):
+    """Draws points uniformly inside the cells of an unstructured simplex mesh.
+
+    `cells` holds the node indices of each triangle (or tetrahedron) of `nodes`. A
+    cell is picked with probability proportional to its area times `density`, which
+    is an optional weight per cell or a function of the cell centroids, using an
+    alias table built once on the host. The point inside the cell has uniform
+    barycentric coordinates, so the batch is not limited to the node set.
+    """
+
+    def __init__(
+        self,
+        nodes,
+        cells,
+        batch_size,
+        density=None,
+        rng_key=random.PRNGKey(1234),
+        mesh=None,
+    ):
+        super().__init__(batch_size, rng_key, mesh)
+        vertices = np.asarray(nodes, dtype=np.float64)[np.asarray(cells)]
+
+        # Cell volumes from the Gram determinant of the edge vectors, which also
+        # covers triangles embedded in 3D
+        edges = vertices[:, 1:] - vertices[:, :1]
+        gram = np.einsum("nid,njd->nij", edges, edges)
+        areas = np.sqrt(np.abs(np.linalg.det(gram)))
+
+        weights = areas
+        if density is not None:
+            if callable(density):
+                density = density(vertices.mean(axis=1))
+            weights = weights * np.asarray(density)
+
+        prob, alias = _alias_table(weights)
+
+        self.vertices = jnp.asarray(vertices, dtype=jnp.float32)
+        self.prob = jnp.asarray(prob, dtype=jnp.float32)
+        self.alias = jnp.asarray(alias, dtype=jnp.int32)
+
+    def sample(self, key):
+        "Generates data containing batch_size samples"
+        key1, key2, key3 = random.split(key, 3)
+        num_cells, num_vertices = self.vertices.shape[:2]
+
+        idx = random.randint(key1, (self.batch_size,), 0, num_cells)
+        u = random.uniform(key2, (self.batch_size,))
+        cell = jnp.where(u < self.prob[idx], idx, self.alias[idx])
+
+        # Normalized exponentials are uniform on the simplex
+        w = random.exponential(key3, (self.batch_size, num_vertices))
+        w = w / jnp.sum(w, axis=1, keepdims=True)
+        batch = jnp.einsum("bk,bkd->bd", w, self.vertices[cell])
+
+        return batch
+
+
 class TimeSpaceSampler(BaseSampler):
     def __init__(
-        self, temporal_dom, spatial_coords, batch_size, rng_key=random.PRNGKey(1234)
+        self,
+        temporal_dom,
+        spatial_coords,
+        batch_size,
+        rng_key=random.PRNGKey(1234),
+        mesh=None,
     ):
-        super().__init__(batch_size, rng_key)
+        super().__init__(batch_size, rng_key, mesh)
 
         self.temporal_dom = temporal_dom
         self.spatial_coords = spatial_coords
 
-    @partial(pmap, static_broadcasted_argnums=(0,))
-    def data_generation(self, key):
+    def sample(self, key):
         "Generates data containing batch_size samples"
         key1, key2 = random.split(key)
 
@@ -85,3 +354,279 @@ class TimeSpaceSampler(BaseSampler):
         batch = jnp.concatenate([temporal_batch, spatial_batch], axis=1)
 
         return batch
+
+
+class MultiSampler(BaseSampler):
+    """Combines named samplers so that the whole batch dict is drawn at once.
+
+    The sub-samplers' own keys are not used; a single key is split across them, so
+    the dict of batches comes from one compiled program, either through the iterator
+    interface or traced into `PINN.train_steps`. Iterating with `prefetch` overlaps
+    the sampling with the previous step.
+    """
+
+    def __init__(self, samplers, rng_key=random.PRNGKey(1234), mesh=None):
+        # The batch size of each stream is that of its sub-sampler
+        batch_size = {name: sampler.batch_size for name, sampler in samplers.items()}
+        super().__init__(batch_size, rng_key, mesh)
+        self.samplers = samplers
+
+    def sample(self, key):
+        "Generates a dict with one batch per named sampler"
+        keys = random.split(key, len(self.samplers))
+        batch = {
+            name: sampler.sample(subkey)
+            for (name, sampler), subkey in zip(self.samplers.items(), keys)
+        }
+
+        return batch
+
+
+class CausalChunkSampler(BaseSampler):
+    """Stratifies the times of `sampler`'s batches over the causal chunks.
+
+    `sampler` must draw the time (column 0) uniformly over `temporal_dom`. The i-th
+    block of batch_size / num_chunks points is mapped affinely into the i-th of
+    `num_chunks` equal time chunks, keeping the other columns, so every chunk holds
+    exactly its share of points and the batch is already in chunk order (see
+    `ForwardIVP.causal_order` and `weighting.chunk_sampling`).
+    """
+
+    def __init__(
+        self,
+        sampler,
+        temporal_dom,
+        num_chunks,
+        rng_key=random.PRNGKey(1234),
+        mesh=None,
+    ):
+        if sampler.batch_size % num_chunks != 0:
+            raise ValueError(
+                f"Batch size {sampler.batch_size} is not divisible by "
+                f"num_chunks = {num_chunks}"
+            )
+
+        super().__init__(sampler.batch_size, rng_key, mesh)
+        self.sampler = sampler
+        self.temporal_dom = temporal_dom
+        self.num_chunks = num_chunks
+
+    def sample(self, key):
+        "Generates data containing batch_size samples in causal chunk order"
+        batch = self.sampler.sample(key)
+
+        t0, t1 = self.temporal_dom[0], self.temporal_dom[1]
+        chunk = jnp.arange(batch.shape[0]) // (batch.shape[0] // self.num_chunks)
+        s = (batch[:, 0] - t0) / (t1 - t0)
+        t = t0 + (chunk + s) * (t1 - t0) / self.num_chunks
+        batch = batch.at[:, 0].set(t)
+
+        return batch
+
+
+class ParametricSampler(BaseSampler):
+    """Appends PDE coefficients, drawn per point, as extra columns to `sampler`'s batches.
+
+    Coefficients are uniform in the ranges `coef_dom` (one [min, max] row per
+    coefficient), or log-uniform with `log_scale=True`, which suits coefficients
+    spanning orders of magnitude such as Reynolds numbers.
+    """
+
+    def __init__(
+        self,
+        sampler,
+        coef_dom,
+        log_scale=False,
+        rng_key=random.PRNGKey(1234),
+        mesh=None,
+    ):
+        super().__init__(sampler.batch_size, rng_key, mesh)
+        self.sampler = sampler
+        self.coef_dom = jnp.asarray(coef_dom, dtype=float)
+        self.log_scale = log_scale
+
+    def sample(self, key):
+        "Generates data containing batch_size samples followed by their coefficients"
+        key1, key2 = random.split(key)
+        batch = self.sampler.sample(key1)
+
+        dom = jnp.log(self.coef_dom) if self.log_scale else self.coef_dom
+        coefs = random.uniform(
+            key2,
+            shape=(batch.shape[0], dom.shape[0]),
+            minval=dom[:, 0],
+            maxval=dom[:, 1],
+        )
+        if self.log_scale:
+            coefs = jnp.exp(coefs)
+
+        batch = jnp.concatenate([batch, coefs], axis=1)
+
+        return batch
+
+
+class PoolSampler(BaseSampler):
+    """Iterates over a fixed pool of points in shuffled minibatches, epoch by epoch.
+
+    Every device holds a pool drawn once by `sampler` (whose `batch_size` is the pool
+    size per device). Each epoch permutes the pool on device and yields its
+    pool_size // batch_size minibatches in turn, so every point is visited once per
+    epoch. With `refresh_every_epochs` the pool is redrawn every that many epochs;
+    `num_refreshes` counts the redraws, so per-point quantities computed from `pool`
+    stay valid in between. The pool lives on device, sharded like the batches, and
+    only the iterator interface is supported (not `PINN.train_steps`).
+
+    With `with_indices`, minibatches come as `(points, indices)`, where the indices
+    number the points of the pools of all devices, device after device. Per-point
+    quantities of the whole pool, such as self-adaptive weights, can be indexed by
+    them.
+    """
+
+    def __init__(
+        self,
+        sampler,
+        batch_size,
+        refresh_every_epochs=None,
+        with_indices=False,
+        rng_key=random.PRNGKey(1234),
+        mesh=None,
+    ):
+        super().__init__(batch_size, rng_key, mesh)
+        self.sampler = sampler
+        self.refresh_every_epochs = refresh_every_epochs
+        self.with_indices = with_indices
+
+        self.num_batches = sampler.batch_size // batch_size
+        if self.num_batches == 0:
+            raise ValueError("The pool must hold at least one batch per device")
+
+        self.epoch = 0
+        self.step = 0  # minibatch index within the epoch
+        self.num_refreshes = 0
+
+        self.key, subkey = random.split(self.key)
+        self.pool = self._draw_pool(replicate(subkey, self.mesh))
+
+    def __getitem__(self, index):
+        "Generate the next minibatch of the current epoch"
+        if self.step == 0:
+            if self.refresh_every_epochs and self.epoch > 0:
+                if self.epoch % self.refresh_every_epochs == 0:
+                    self.refresh()
+
+            self.key, subkey = random.split(self.key)
+            self.perm = self._shuffle(replicate(subkey, self.mesh))
+
+        batch = self._minibatch(self.pool, self.perm, replicate(self.step, self.mesh))
+
+        self.step = (self.step + 1) % self.num_batches
+        if self.step == 0:
+            self.epoch += 1
+
+        return batch
+
+    def refresh(self):
+        "Redraws the pool"
+        self.key, subkey = random.split(self.key)
+        self.pool = self._draw_pool(replicate(subkey, self.mesh))
+        self.num_refreshes += 1
+
+    @data_parallel(out_specs=P("batch"))
+    def _draw_pool(self, key):
+        key = random.fold_in(key, lax.axis_index("batch"))
+        return self.sampler.sample(key)
+
+    @data_parallel(out_specs=P("batch"))
+    def _shuffle(self, key):
+        key = random.fold_in(key, lax.axis_index("batch"))
+        return random.permutation(key, self.sampler.batch_size)
+
+    @data_parallel(batch_argnums=(1, 2), out_specs=P("batch"))
+    def _minibatch(self, pool, perm, step):
+        idx = lax.dynamic_slice(perm, (step * self.batch_size,), (self.batch_size,))
+        if self.with_indices:
+            offset = lax.axis_index("batch") * self.sampler.batch_size
+            return pool[idx], idx + offset
+        return pool[idx]
+
+    def sample(self, key):
+        raise NotImplementedError(
+            "PoolSampler iterates over a device-resident pool, use it as an "
+            "iterator instead of tracing it into the train step"
+        )
+
+
+class ResidualAdaptiveSampler(BaseSampler):
+    """Residual-based adaptive distribution (RAD) sampling from a candidate pool.
+
+    Every device holds a pool of candidate points drawn by `sampler` (whose
+    `batch_size` is the pool size per device). `refresh(params)` redraws the pool and
+    scores it with `residual_fn(params, pool)`, which returns the PDE residual of
+    each candidate, e.g. `vmap(model.r_net, (None, 0, 0))(params, pool[:, 0],
+    pool[:, 1])`. Batches are drawn from the pool with probability proportional to
+
+        |r|^k / mean(|r|^k) + c
+
+    so refreshes, the expensive part, can be amortized over many steps. Until the
+    first refresh points are drawn uniformly from the pool. The pool and its scores
+    live on device, sharded like the batches, and only the iterator interface is
+    supported (not `PINN.train_steps`), since they change between calls.
+    """
+
+    def __init__(
+        self,
+        sampler,
+        residual_fn,
+        batch_size,
+        k=1.0,
+        c=1.0,
+        rng_key=random.PRNGKey(1234),
+        mesh=None,
+    ):
+        super().__init__(batch_size, rng_key, mesh)
+        self.sampler = sampler
+        self.residual_fn = residual_fn
+        self.k = k
+        self.c = c
+
+        self.key, subkey = random.split(self.key)
+        self.pool = self._draw_pool(replicate(subkey, self.mesh))
+        self.logits = jnp.zeros_like(self.pool[..., 0])
+
+    def __getitem__(self, index):
+        "Generate one batch of data from the pool"
+        self.key, subkey = random.split(self.key)
+        batch = self._draw(replicate(subkey, self.mesh), self.pool, self.logits)
+        return batch
+
+    def refresh(self, params):
+        "Redraws the candidate pool and scores it with the residuals of `params`"
+        self.key, subkey = random.split(self.key)
+        self.pool, self.logits = self._refresh(replicate(subkey, self.mesh), params)
+
+    @data_parallel(out_specs=P("batch"))
+    def _draw_pool(self, key):
+        key = random.fold_in(key, lax.axis_index("batch"))
+        return self.sampler.sample(key)
+
+    @data_parallel(out_specs=P("batch"))
+    def _refresh(self, key, params):
+        key = random.fold_in(key, lax.axis_index("batch"))
+        pool = self.sampler.sample(key)
+
+        r = self.residual_fn(params, pool)
+        density = jnp.abs(r) ** self.k
+        density = density / jnp.mean(density) + self.c
+        return pool, jnp.log(density)
+
+    @data_parallel(batch_argnums=(2, 3), out_specs=P("batch"))
+    def _draw(self, key, pool, logits):
+        key = random.fold_in(key, lax.axis_index("batch"))
+        idx = random.categorical(key, logits, shape=(self.batch_size,))
+        return pool[idx]
+
+    def sample(self, key):
+        raise NotImplementedError(
+            "ResidualAdaptiveSampler draws from a device-resident pool, use it as an "
+            "iterator instead of tracing it into the train step"
+        )
@@ -4,12 +4,61 @@ from functools import partial
 
 import jax
 import jax.numpy as jnp
-from jax import jit, grad, tree_map
-from jax.tree_util import tree_map
+from jax import lax, jit, grad, jvp, jacrev, random, vmap, tree_map
+from jax.tree_util import tree_map, tree_leaves, tree_flatten, tree_unflatten
 from jax.flatten_util import ravel_pytree
+from jax.experimental.compilation_cache import compilation_cache
 
 from flax.training import checkpoints
 
+from jaxpi.parallel import unreplicate
+
+
+_compilation_cache_stats = None
+
+
+def _record_compilation_cache_event(event, **kwargs):
+    if event == "/jax/compilation_cache/cache_hits":
+        _compilation_cache_stats["hits"] += 1
+    elif event == "/jax/compilation_cache/cache_misses":
+        _compilation_cache_stats["misses"] += 1
+
+
+def enable_compilation_cache(config):
+    """Enables JAX's persistent compilation cache from `config.compilation`.
+
+    Executables that take longer than `compilation.min_compile_time_secs` to compile
+    are written to `compilation.cache_dir` and reused by later runs with the same
+    shapes. Does nothing if the config has no `compilation` section or its
+    `cache_dir` is None.
+    """
+    compilation = config.get("compilation", None)
+    if compilation is None or compilation.cache_dir is None:
+        return
+
+    jax.config.update(
+        "jax_persistent_cache_min_compile_time_secs",
+        compilation.min_compile_time_secs,
+    )
+    compilation_cache.set_cache_dir(os.path.expanduser(compilation.cache_dir))
+    # Importing jaxpi already compiles a few small functions, which initializes the
+    # cache without a directory. Reset it so that it is set up again with this one.
+    compilation_cache.reset_cache()
+
+    # Count the cache hits and misses from now on
+    global _compilation_cache_stats
+    if _compilation_cache_stats is None:
+        _compilation_cache_stats = {"hits": 0, "misses": 0}
+        jax.monitoring.register_event_listener(_record_compilation_cache_event)
+
+
+def compilation_cache_stats():
+    """Returns the number of persistent compilation cache hits and misses since
+    `enable_compilation_cache`, or None if the cache is not enabled"""
+    if _compilation_cache_stats is None:
+        return None
+    return dict(_compilation_cache_stats)
+
 
 def flatten_pytree(pytree):
     return ravel_pytree(pytree)[0]
@@ -31,6 +80,93 @@ def ntk_fn(apply_fn, params, *args):
     return K
 
 
+def diag_ntk_fn(
+    apply_fn,
+    params,
+    *args,
+    num_points=None,
+    num_probes=None,
+    chunk_size=None,
+    key=None,
+):
+    """Diagonal of the NTK of the scalar `apply_fn(params, *x)` over a batch of points,
+    i.e. the squared norms of the per-point parameter gradients.
+
+    Arguments with a leading axis hold the points, scalars are shared by all of them.
+    With `num_points`, only one random point in each of `num_points` equal strata of
+    the batch is evaluated. The strata keep the order of the batch, so the entries of
+    a time-ordered batch can still be split into causal chunks if `num_points` is a
+    multiple of the number of chunks. With `num_probes`, the squared norms are
+    estimated as the mean of (J v)^2 over Gaussian probes v of the parameters, with
+    J v computed for all points by one forward-mode JVP per probe. The probes are
+    shared by all points, so their noise shrinks with `num_probes` but not with the
+    number of points. Otherwise the squared norms are exact, from the vmapped
+    per-point gradients. These are computed `chunk_size` points at a time in a
+    `lax.map` if set, so only `chunk_size` gradients are held in memory at once.
+
+    `key` draws the points and probes, and is required with `num_points` or
+    `num_probes`.
+    """
+    in_axes = tuple(0 if jnp.ndim(x) > 0 else None for x in args)
+    num = max(jnp.shape(x)[0] for x in args if jnp.ndim(x) > 0)
+    if (num_points is not None and num_points < num) or num_probes is not None:
+        if key is None:
+            raise ValueError("Estimating the NTK needs a PRNG key")
+        points_key, probes_key = random.split(key)
+
+    if num_points is not None and num_points < num:
+        # One point per stratum, in order
+        offsets = random.randint(points_key, (num_points,), 0, num // num_points)
+        idx = jnp.arange(num_points) * num // num_points + offsets
+        args = [jnp.asarray(x)[idx] if jnp.ndim(x) > 0 else x for x in args]
+        num = num_points
+
+    if num_probes is None:
+
+        def sq_norm_fn(*x):
+            g = grad(apply_fn)(params, *x)
+            return sum(jnp.sum(leaf**2) for leaf in tree_leaves(g))
+
+        batch_fn = vmap(sq_norm_fn, in_axes)
+        if chunk_size is None or chunk_size >= num:
+            return batch_fn(*args)
+
+        # Pad the points to whole chunks, mapped over one after another
+        num_chunks = -(-num // chunk_size)
+
+        def split(x):
+            x = jnp.asarray(x)
+            pad = [(0, num_chunks * chunk_size - num)] + [(0, 0)] * (x.ndim - 1)
+            return jnp.pad(x, pad, mode="edge").reshape(
+                num_chunks, chunk_size, *x.shape[1:]
+            )
+
+        points = [split(x) for x, axis in zip(args, in_axes) if axis == 0]
+
+        def chunk_fn(points):
+            points = iter(points)
+            return batch_fn(
+                *[next(points) if axis == 0 else x for x, axis in zip(args, in_axes)]
+            )
+
+        return lax.map(chunk_fn, points).reshape(-1)[:num]
+
+    batch_fn = vmap(apply_fn, (None,) + in_axes)
+
+    leaves, treedef = tree_flatten(params)
+    keys = random.split(probes_key, len(leaves))
+    probes = tree_unflatten(
+        treedef,
+        [
+            random.normal(k, (num_probes, *jnp.shape(x)), jnp.result_type(x))
+            for k, x in zip(keys, leaves)
+        ],
+    )
+    jvp_fn = lambda v: jvp(lambda p: batch_fn(p, *args), (params,), (v,))[1]
+    Jv = vmap(jvp_fn)(probes)
+    return jnp.mean(Jv**2, axis=0)
+
+
 def save_checkpoint(state, workdir, keep=5, name=None):
     # Create the workdir if it doesn't exist.
     if not os.path.isdir(workdir):
@@ -39,20 +175,15 @@ def save_checkpoint(state, workdir, keep=5, name=None):
     # Save the checkpoint.
     if jax.process_index() == 0:
         # Get the first replica's state and save it.
-        state = jax.device_get(tree_map(lambda x: x[0], state))
+        state = jax.device_get(unreplicate(state))
         step = int(state.step)
         checkpoints.save_checkpoint(workdir, state, step=step, keep=keep)
 
 
 def restore_checkpoint(state, workdir, step=None):
-    # check if passed state is in a sharded state
-    # if so, reduce to a single device sharding
-
-    if isinstance(
-        jax.tree_map(lambda x: jnp.array(x).sharding, jax.tree_leaves(state.params))[0],
-        jax.sharding.PmapSharding,
-    ):
-        state = jax.tree_map(lambda x: x[0], state)
+    # check if passed state is replicated (pmap) or a global array (mesh)
+    # if so, reduce to a single device copy
+    state = unreplicate(state)
 
     # ensuring that we're in a single device setting
     assert isinstance(
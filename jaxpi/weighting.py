@@ -0,0 +1,193 @@
+import jax
+import jax.numpy as jnp
+from jax import random
+from jax.tree_util import tree_map, tree_leaves
+
+from jaxpi.utils import flatten_pytree
+
+
+def grad_norms(grads):
+    "Norms of a dict of per-loss gradients"
+    grad_norm_dict = {}
+    for key, value in grads.items():
+        flattened_grad = flatten_pytree(value)
+        grad_norm_dict[key] = jnp.linalg.norm(flattened_grad)
+    return grad_norm_dict
+
+
+def weights_from_grad_norms(grad_norm_dict):
+    "Grad Norm Weighting from the per-loss gradient norms"
+    # Compute the mean of grad norms over all losses
+    mean_grad_norm = jnp.mean(jnp.stack(tree_leaves(grad_norm_dict)))
+    # Grad Norm Weighting
+    w = tree_map(lambda x: (mean_grad_norm / x), grad_norm_dict)
+    return w
+
+
+class GradNorm:
+    "Weights that equalize the norms of the weighted per-loss gradients"
+
+    needs = "grads"
+
+    def __init__(self, config):
+        pass
+
+    def __call__(self, grads):
+        return weights_from_grad_norms(grad_norms(grads))
+
+
+class LRAnnealing:
+    """Learning rate annealing: the PDE residual losses keep a weight of one, every
+    other loss is weighted by the largest gradient entry of the residual losses over
+    the mean magnitude of its own gradient.
+
+    The residual losses are `config.residual_losses`, by default those whose names
+    start with "r" as in the examples ("res", "ru", "rc", ...).
+    """
+
+    needs = "grads"
+
+    def __init__(self, config):
+        self.residual_losses = config.get("residual_losses", None)
+
+    def __call__(self, grads):
+        residual_losses = self.residual_losses
+        if residual_losses is None:
+            residual_losses = [key for key in grads if key.startswith("r")]
+        if not residual_losses:
+            raise ValueError(
+                f"No residual loss among {list(grads)}, set weighting.residual_losses"
+            )
+
+        grads = {key: jnp.abs(flatten_pytree(value)) for key, value in grads.items()}
+        max_grad = jnp.max(jnp.stack([jnp.max(grads[key]) for key in residual_losses]))
+        return {
+            key: jnp.ones(()) if key in residual_losses else max_grad / jnp.mean(g)
+            for key, g in grads.items()
+        }
+
+
+class NTK:
+    "Weights that equalize the mean diagonal NTK of the losses"
+
+    needs = "ntk"
+
+    def __init__(self, config):
+        pass
+
+    def __call__(self, ntk):
+        # Compute the mean of the diagonal NTK corresponding to each loss
+        mean_ntk_dict = tree_map(lambda x: jnp.mean(x), ntk)
+
+        # Compute the average over all ntk means
+        mean_ntk = jnp.mean(jnp.stack(tree_leaves(mean_ntk_dict)))
+        # NTK Weighting
+        return tree_map(lambda x: (mean_ntk / x), mean_ntk_dict)
+
+
+class SoftAdapt:
+    """SoftAdapt: weights proportional to the softmax of the relative rates of change
+    of the losses over the last step, so that the losses decreasing the slowest
+    gain weight, averaged over steps with `momentum`. The weights sum to the number
+    of losses.
+    """
+
+    needs = "losses"
+
+    def __init__(self, config):
+        self.temperature = config.get("temperature", 0.1)
+
+    def init(self, weights, key):
+        return {"prev_losses": tree_map(lambda _: jnp.zeros(()), weights)}
+
+    def update(self, state, weights, losses, momentum):
+        keys = list(losses.keys())
+        stack = lambda d: jnp.stack([d[key] for key in keys])
+        l, l_prev = stack(losses), stack(state["prev_losses"])
+
+        # No rates at the first step, where the weights stay uniform
+        known = l_prev > 0
+        rates = jnp.where(known, (l - l_prev) / jnp.where(known, l_prev, 1.0), 0.0)
+        w_new = len(keys) * jax.nn.softmax(rates / self.temperature)
+        w = momentum * stack(weights) + (1 - momentum) * w_new
+        return dict(zip(keys, w)), {"prev_losses": losses}
+
+
+class ReLoBRaLo:
+    """Relative Loss Balancing with Random Lookback (ReLoBRaLo).
+
+    The balancing weights are the softmax of the losses relative to their values at
+    the previous step. They enter with weight `1 - alpha` a running average of the
+    weights, whose history is replaced with probability `1 - lookback` by the
+    balancing weights relative to the first step. The weights sum to the number of
+    losses.
+    """
+
+    needs = "losses"
+
+    def __init__(self, config):
+        self.temperature = config.get("temperature", 0.1)
+        self.alpha = config.get("alpha", 0.999)
+        self.lookback = config.get("lookback", 0.999)
+
+    def init(self, weights, key):
+        zeros = tree_map(lambda _: jnp.zeros(()), weights)
+        return {"init_losses": zeros, "prev_losses": zeros, "key": key}
+
+    def update(self, state, weights, losses, momentum):
+        keys = list(losses.keys())
+        stack = lambda d: jnp.stack([d[key] for key in keys])
+        l, w = stack(losses), stack(weights)
+        l_init, l_prev = stack(state["init_losses"]), stack(state["prev_losses"])
+
+        # The first losses are the reference for the following steps
+        first = jnp.all(l_init == 0)
+        l_init = jnp.where(first, l, l_init)
+        l_prev = jnp.where(first, l, l_prev)
+
+        def balance(ref):
+            return len(keys) * jax.nn.softmax(l / (self.temperature * ref + 1e-12))
+
+        key, subkey = random.split(state["key"])
+        rho = random.bernoulli(subkey, self.lookback).astype(l.dtype)
+        history = rho * w + (1 - rho) * balance(l_init)
+        w_new = self.alpha * history + (1 - self.alpha) * balance(l_prev)
+        w_new = jnp.where(first, w, w_new)
+
+        state = {
+            "init_losses": dict(zip(keys, l_init)),
+            "prev_losses": losses,
+            "key": key,
+        }
+        return dict(zip(keys, w_new)), state
+
+
+schemes = {
+    "grad_norm": GradNorm,
+    "lr_annealing": LRAnnealing,
+    "ntk": NTK,
+    "softadapt": SoftAdapt,
+    "relobralo": ReLoBRaLo,
+}
+
+
+def create_scheme(config):
+    """Returns the weighting scheme `config.scheme` of the `weighting` config.
+
+    Schemes that need `grads` or the `ntk` are called on the per-loss gradients or
+    diagonal NTKs every `update_every_steps` (see `PINN.compute_weights`), and the
+    weights are averaged with `momentum`. Schemes that need the `losses` only are
+    pure functions of a small state carried in `TrainState.weighting_state`, updated
+    at every train step with the state's (per-member) `momentum`. Returns None for
+    fixed weights (a scheme of None or False).
+    """
+    if not config.scheme:
+        return None
+
+    elif config.scheme in schemes:
+        return schemes[config.scheme](config)
+
+    else:
+        raise NotImplementedError(
+            f"Weighting scheme {config.scheme} not supported yet!"
+        )
@@ -0,0 +1,29 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+# Two host devices for the data-parallel tests, set before jax is imported
+os.environ["XLA_FLAGS"] = (
+    os.environ.get("XLA_FLAGS", "") + " --xla_force_host_platform_device_count=2"
+)
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(__file__)), "examples")
+
+
+@pytest.fixture
+def load_example(monkeypatch):
+    "Imports the modules of an example, run from its directory like its main.py"
+
+    def load(name, *modules):
+        path = os.path.join(EXAMPLES, name)
+        monkeypatch.chdir(path)
+        monkeypatch.syspath_prepend(path)
+        # Every example has its own configs, models, utils, ... modules
+        for module in list(sys.modules):
+            if module.split(".")[0] in ("configs", "models", "utils", "eval", "train"):
+                monkeypatch.delitem(sys.modules, module)
+        return [importlib.import_module(module) for module in modules]
+
+    return load
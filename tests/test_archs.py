@@ -0,0 +1,53 @@
+import pytest
+
+import jax
+import jax.numpy as jnp
+from jax import random, vmap
+
+from jaxpi.archs import HardConstraint, Mlp
+
+
+def init_and_apply(arch, x):
+    params = arch.init(random.PRNGKey(0), x)
+    return params, arch.apply(params, x)
+
+
+def test_reduced_compute_dtype_keeps_float32_values_and_gradients():
+    x = random.uniform(random.PRNGKey(1), (2,))
+    reduced = Mlp(hidden_dim=16, compute_dtype="bfloat16")
+    params, y = init_and_apply(reduced, x)
+    assert y.dtype == jnp.float32
+
+    # The derivatives of the hidden matmuls are those of the full precision model
+    grad_fn = lambda arch: jax.grad(lambda x: arch.apply(params, x)[0])(x)
+    assert jnp.allclose(grad_fn(reduced), grad_fn(Mlp(hidden_dim=16)), rtol=1e-5)
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"compute_dtype": "float16"},
+        {"compute_dtype": "bfloat16", "matmul_precision": "default"},
+    ],
+)
+def test_unsupported_precision_options_raise(kwargs):
+    with pytest.raises(ValueError):
+        init_and_apply(Mlp(hidden_dim=16, **kwargs), jnp.ones(2))
+
+
+def test_hard_constraint_holds_the_boundary_values_exactly():
+    # u = sin(pi y) at x = 0 and u = 0 at x = 1, the second output is unconstrained
+    distance = lambda z: jnp.stack([z[0] * (1 - z[0]), 1.0])
+    lifting = lambda z: jnp.stack([(1 - z[0]) * jnp.sin(jnp.pi * z[1]), 0.0])
+    arch = HardConstraint(Mlp(hidden_dim=16, out_dim=2), distance, lifting)
+    params = arch.init(random.PRNGKey(0), jnp.ones(2))
+    assert list(params["params"]) == ["arch"]
+
+    y = random.uniform(random.PRNGKey(1), (16,))
+    apply_fn = vmap(lambda x, y: arch.apply(params, jnp.stack([x, y])), (None, 0))
+    assert jnp.all(apply_fn(0.0, y)[:, 0] == jnp.sin(jnp.pi * y))
+    assert jnp.all(apply_fn(1.0, y)[:, 0] == 0.0)
+
+    inner = apply_fn(0.5, y)
+    assert not jnp.allclose(inner[:, 0], 0.5 * jnp.sin(jnp.pi * y))
+    assert not jnp.allclose(inner[:, 1], 0.0)
@@ -0,0 +1,97 @@
+import math
+
+import numpy as np
+import pytest
+
+import jax
+import jax.numpy as jnp
+from jax.experimental import jet
+
+from jaxpi.derivatives import _polarization, _remat_jet_rule, check_remat, partials
+
+
+def f(x, y, z):
+    return jnp.sin(x) * y**3 + jnp.exp(x * z) + x * y * z
+
+
+def nested_grad(fn, deriv, argnames):
+    "The partial `deriv` of `fn` by nested reverse-mode gradients"
+    for c in deriv:
+        fn = jax.grad(fn, argnums=argnames.index(c))
+    return fn
+
+
+@pytest.mark.parametrize(
+    "deriv", ["x", "y", "xx", "xy", "yz", "xxy", "xyz", "xxz", "yyy", "xxyy"]
+)
+def test_partials_match_nested_gradients(deriv):
+    args = (0.3, 0.7, -0.4)
+    d = partials(f, "xyz", {"u": [deriv]})(*args)
+
+    assert jnp.allclose(d["u"], f(*args))
+    expected = nested_grad(f, deriv, "xyz")(*args)
+    assert jnp.allclose(d["u_" + deriv], expected, rtol=1e-4, atol=1e-5)
+
+
+def test_polarization_recovers_monomials():
+    # The monomial x^a y^b z^c has d^alpha = a! b! c! for alpha = (a, b, c)
+    for alpha in [(1, 1, 0), (2, 1, 0), (1, 1, 1), (2, 2, 0)]:
+        directions, row = _polarization(alpha)
+        order = sum(alpha)
+        monomial = lambda v: np.prod(np.power(v, alpha))
+        # D^n_v of the monomial is n! times its value at v
+        values = [math.factorial(order) * monomial(np.array(v)) for v in directions]
+        expected = np.prod([math.factorial(a) for a in alpha])
+        assert np.isclose(np.dot(row, values), expected)
+
+
+def test_partials_of_named_outputs():
+    fn = lambda t, x: (jnp.sin(t) * x**2, jnp.cos(x) * t)
+    d = partials(fn, "tx", {"u": ["t", "xx"], "v": ["x"]}, outnames=("u", "v"))(
+        0.5, 0.2
+    )
+
+    assert set(d) == {"u", "u_t", "u_xx", "v", "v_x"}
+    assert jnp.allclose(d["u_t"], jnp.cos(0.5) * 0.2**2)
+    assert jnp.allclose(d["u_xx"], 2 * jnp.sin(0.5))
+    assert jnp.allclose(d["v_x"], -jnp.sin(0.2) * 0.5)
+
+
+def test_partials_reject_unknown_arguments():
+    with pytest.raises(ValueError):
+        partials(f, "xyz", {"u": ["xw"]})
+
+
+@pytest.mark.skipif(
+    jax.__version_info__ >= (0, 4, 36), reason="jet remat rule needs jax < 0.4.36"
+)
+def test_partials_through_checkpointed_blocks():
+    g = lambda x, y: jax.checkpoint(lambda a, b: jnp.sin(a) * b**2)(x, y)
+    d = partials(g, "xy", {"u": ["xx", "xy"]})(0.3, 0.7)
+    assert jnp.allclose(d["u_xx"], -jnp.sin(0.3) * 0.49)
+    assert jnp.allclose(d["u_xy"], 2 * jnp.cos(0.3) * 0.7)
+
+
+@pytest.mark.skipif(
+    jax.__version_info__ >= (0, 4, 36), reason="jet remat rule needs jax < 0.4.36"
+)
+def test_remat_jet_rule_without_input_series():
+    jaxpr = jax.make_jaxpr(jnp.cos)(2.0).jaxpr
+    primals_out, series_out = _remat_jet_rule(
+        [jnp.float32(2.0)],
+        [jet.zero_series],
+        jaxpr=jaxpr,
+        policy=None,
+        prevent_cse=True,
+        differentiated=False,
+    )
+    assert jnp.allclose(primals_out[0], jnp.cos(2.0))
+    assert series_out == [jet.zero_series]
+
+
+def test_remat_is_rejected_where_jet_cannot_run_through_it(monkeypatch):
+    check_remat("none")
+    monkeypatch.setattr(jax, "__version_info__", (0, 4, 36))
+    check_remat("none")
+    with pytest.raises(ValueError, match="arch.remat=per_layer"):
+        check_remat("per_layer")
@@ -0,0 +1,108 @@
+import os
+
+import pytest
+
+import jax.numpy as jnp
+from jax import random
+from jax.tree_util import tree_leaves
+
+from jaxpi.parallel import replicate, unreplicate
+from jaxpi.samplers import CausalChunkSampler, UniformSampler
+from jaxpi.utils import save_checkpoint
+
+
+def small_config(default):
+    config = default.get_config()
+    config.arch.num_layers = 2
+    config.arch.hidden_dim = 16
+    return config
+
+
+def advection(models, utils, config):
+    u_ref, t_star, x_star = utils.get_dataset(2.0, 2 * jnp.pi, 50, 200, 128)
+    return models.Advection(config, u_ref[0, :], t_star, x_star, 50)
+
+
+def allen_cahn(models, utils, config):
+    u_ref, t_star, x_star = utils.get_dataset()
+    return models.AllenCahn(config, u_ref[0, :], t_star, x_star)
+
+
+@pytest.mark.parametrize(
+    "name, create_model", [("adv", advection), ("allen_cahn", allen_cahn)]
+)
+def test_eval_runs_on_a_checkpoint(load_example, tmp_path, name, create_model):
+    default, models, utils, eval = load_example(
+        name, "configs.default", "models", "utils", "eval"
+    )
+    config = small_config(default)
+    config.mode = "eval"
+
+    # A checkpoint of the untrained model where eval.py looks for it
+    model = create_model(models, utils, config)
+    save_checkpoint(model.state, str(tmp_path / "ckpt" / config.wandb.name))
+
+    eval.evaluate(config, str(tmp_path))
+    assert os.listdir(tmp_path / "figures" / config.wandb.name)
+
+
+def test_logged_ntk_variance_matches_the_spread_of_the_estimates(load_example):
+    default, models, utils = load_example("adv", "configs.default", "models", "utils")
+    config = small_config(default)
+    config.weighting.ntk_num_points = 64
+    config.weighting.ntk_num_probes = 4
+    config.logging.ntk_var_draws = 32
+    model = advection(models, utils, config)
+    params = unreplicate(model.state).params
+
+    dom = jnp.array([[0.0, 1.0], [0.0, 2 * jnp.pi]])
+    sampler = CausalChunkSampler(UniformSampler(dom, 256), dom[0], 32)
+    batch = sampler.sample(random.PRNGKey(0))
+
+    evaluator = models.AdvectionEvaluator(config, model)
+    evaluator.causal = model.causal_terms(params, batch)
+    evaluator.log_ntk(params, batch, key=random.PRNGKey(1))
+
+    # The variance of a single estimate over many draws, over the number of draws
+    draws = [
+        model.compute_diag_ntk(params, batch, causal=evaluator.causal, key=key)
+        for key in random.split(random.PRNGKey(2), 256)
+    ]
+    for key in ("ics", "res"):
+        means = jnp.array([jnp.mean(ntk[key]) for ntk in draws])
+        expected = jnp.var(means, ddof=1) / 32
+        assert 0.5 < evaluator.log_dict[key + "_ntk_var"] / expected < 2.0
+
+
+def ldc(models, utils, config):
+    return models.NavierStokes2D(config)
+
+
+def burgers(models, utils, config):
+    u_ref, t_star, x_star = utils.get_dataset()
+    return models.Burgers(config, u_ref[0, :], t_star, x_star)
+
+
+@pytest.mark.parametrize(
+    "name, create_model, args",
+    [("ldc", ldc, (0.01,)), ("burgers", burgers, ())],
+)
+def test_step_with_a_reduced_compute_dtype(load_example, name, create_model, args):
+    default, models, utils = load_example(name, "configs.default", "models", "utils")
+    config = small_config(default)
+    config.arch.compute_dtype = "bfloat16"
+    model = create_model(models, utils, config)
+
+    batch = replicate(random.uniform(random.PRNGKey(0), (64, 2)))
+    state = model.step(model.state, batch, *args)
+    state = model.update_weights(state, batch, *args)
+
+    params = unreplicate(state).params
+    losses = model.losses(params, unreplicate(batch), *args)
+    assert all(jnp.isfinite(value) for value in losses.values())
+    assert any(
+        not jnp.allclose(new, old)
+        for new, old in zip(
+            tree_leaves(params), tree_leaves(unreplicate(model.state).params)
+        )
+    )
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+import jax
+import jax.numpy as jnp
+from jax import random, vmap
+
+from jaxpi.geometry import Circle, Rectangle, Segment, Step, _rejection_sample
+
+
+def sdf(geometry, points):
+    return vmap(geometry.sdf)(jnp.asarray(points, dtype=jnp.float32))
+
+
+def test_rectangle_sdf():
+    rect = Rectangle([0.0, 0.0], [2.0, 1.0])
+    d = sdf(rect, [[1.0, 0.5], [1.0, 0.9], [3.0, 0.5], [1.0, -0.25], [3.0, 2.0]])
+    assert jnp.allclose(d, jnp.array([-0.5, -0.1, 1.0, 0.25, np.sqrt(2.0)]), atol=1e-6)
+
+
+def test_step_excludes_the_block():
+    step = Step([0.0, 0.0], [4.0, 2.0], [1.0, 1.0])
+    d = sdf(step, [[0.5, 0.5], [0.5, 1.5], [2.0, 0.5]])
+    assert d[0] > 0 and d[1] < 0 and d[2] < 0
+
+
+def test_circle_sdf_and_normal():
+    circle = Circle([1.0, 1.0], 0.5)
+    d = sdf(circle, [[1.0, 1.0], [2.0, 1.0]])
+    assert jnp.allclose(d, jnp.array([-0.5, 0.5]))
+
+    n = circle.normal(jnp.array([1.0, 1.5]))
+    assert jnp.allclose(n, jnp.array([0.0, 1.0]), atol=1e-6)
+
+
+def test_segment_sdf_is_the_distance_to_the_segment():
+    segment = Segment([0.0, 0.0], [1.0, 0.0])
+    d = sdf(segment, [[0.5, 0.3], [2.0, 0.0], [0.5, 0.0]])
+    assert jnp.allclose(d, jnp.array([0.3, 1.0, 0.0]), atol=1e-6)
+
+
+def test_composite_sdfs():
+    a = Rectangle([0.0, 0.0], [2.0, 2.0])
+    b = Circle([2.0, 1.0], 0.5)
+    points = [[1.0, 1.0], [2.2, 1.0], [1.8, 1.0], [3.0, 3.0]]
+
+    da, db = sdf(a, points), sdf(b, points)
+    assert jnp.allclose(sdf(a | b, points), jnp.minimum(da, db))
+    assert jnp.allclose(sdf(a & b, points), jnp.maximum(da, db))
+    assert jnp.allclose(sdf(a - b, points), jnp.maximum(da, -db))
+    # Inside the rectangle but in the hole
+    assert sdf(a - b, points)[2] > 0
+
+
+def test_samples_lie_in_the_domain_and_on_its_boundary():
+    domain = Rectangle([0.0, 0.0], [2.0, 1.0]) - Circle([0.5, 0.5], 0.3)
+
+    interior = jax.jit(lambda key: domain.sample_interior(key, 1000))(
+        random.PRNGKey(0)
+    )
+    assert interior.shape == (1000, 2)
+    assert jnp.all(sdf(domain, interior) < 0)
+    assert len(np.unique(np.asarray(interior), axis=0)) == 1000
+
+    boundary = domain.sample_boundary(random.PRNGKey(1), 500)
+    assert boundary.shape == (500, 2)
+    assert jnp.all(jnp.abs(sdf(domain, boundary)) < domain._tol)
+
+
+def test_rejection_sampling_repeats_rounds_until_enough_points_are_valid():
+    # A rate far above the true one of 1%, so the first round falls short
+    draw = lambda key, n: random.uniform(key, (n, 2))
+    accept = lambda x: x[:, 0] < 0.01
+    points = _rejection_sample(draw, accept, random.PRNGKey(0), 300, 0.5)
+
+    assert jnp.all(points[:, 0] < 0.01)
+    assert len(np.unique(np.asarray(points), axis=0)) == 300
+
+
+def test_empty_geometry_raises():
+    empty = Circle([0.0, 0.0], 1.0) - Circle([0.0, 0.0], 2.0)
+    with pytest.raises(ValueError):
+        empty.sample_interior(random.PRNGKey(0), 10)
@@ -0,0 +1,196 @@
+import ml_collections
+import pytest
+
+import jax
+import jax.numpy as jnp
+from jax import random, vmap
+from jax.tree_util import tree_leaves
+
+from jaxpi.parallel import replicate, unreplicate
+from jaxpi.samplers import CausalChunkSampler, UniformSampler
+
+
+DOM = jnp.array([[0.0, 0.99], [-1.0, 1.0]])
+
+
+@pytest.fixture
+def burgers(load_example):
+    "Creates small Burgers models, with the config entries of `updates` changed"
+    default, models, utils = load_example(
+        "burgers", "configs.default", "models", "utils"
+    )
+    u_ref, t_star, x_star = utils.get_dataset()
+
+    def create(updates={}):
+        config = default.get_config()
+        config.arch.num_layers = 2
+        config.arch.hidden_dim = 16
+        config.arch.fourier_emb.embed_dim = 16
+        config.weighting.num_chunks = 4
+        config.population = ml_collections.ConfigDict(
+            dict.fromkeys(
+                ["size", "seeds", "learning_rates", "causal_tols", "momentums"]
+            )
+        )
+        config.update_from_flattened_dict(updates)
+        return models.Burgers(config, u_ref[0, :], t_star, x_star)
+
+    return create
+
+
+def device_batch(key, size=32):
+    "A batch of residual points for every device"
+    keys = random.split(key, jax.local_device_count())
+    return jnp.stack([UniformSampler(DOM, size).sample(key) for key in keys])
+
+
+def assert_states_close(state1, state2):
+    state1, state2 = unreplicate(state1), unreplicate(state2)
+    for x, y in zip(tree_leaves(state1.params), tree_leaves(state2.params)):
+        assert jnp.allclose(x, y, rtol=1e-5, atol=1e-6)
+    for key in state1.weights:
+        assert jnp.allclose(state1.weights[key], state2.weights[key], rtol=1e-5)
+
+
+def test_train_steps_match_single_steps(burgers):
+    model = burgers({"weighting.update_every_steps": 2})
+    sampler = UniformSampler(DOM, 32)
+    state, losses = model.train_steps(model.state, 3, sampler)
+    assert unreplicate(losses)["res"].shape == (3,)
+
+    # The same batches, drawn on the host from the keys the scan splits off the state
+    expected = model.state
+    for step in range(3):
+        key, subkey = random.split(unreplicate(expected).key)
+        batch = jnp.stack(
+            [
+                sampler.sample(random.fold_in(subkey, i))
+                for i in range(jax.local_device_count())
+            ]
+        )
+        # Gradient-based weights are refreshed every update_every_steps
+        step_fn = model.step_and_reweight if step % 2 == 0 else model.step
+        expected = step_fn(expected, batch).replace(key=replicate(key))
+
+    assert_states_close(state, expected)
+    assert jnp.all(unreplicate(state).key == unreplicate(expected).key)
+
+
+def test_step_and_reweight_updates_with_the_new_weights(burgers):
+    model = burgers()
+    batch = device_batch(random.PRNGKey(0))
+
+    state = model.step_and_reweight(model.state, batch)
+    expected = model.step(model.update_weights(model.state, batch), batch)
+    assert_states_close(state, expected)
+    assert not jnp.allclose(
+        unreplicate(state).weights["res"], unreplicate(model.state).weights["res"]
+    )
+
+
+def test_population_members_train_like_single_models(burgers):
+    members = {
+        "seed": [1, 2],
+        "optim.learning_rate": [1e-3, 1e-2],
+        "weighting.causal_tol": [1.0, 10.0],
+        "weighting.momentum": [0.9, 0.5],
+    }
+    population = burgers(
+        {
+            "population.size": 2,
+            "population.seeds": members["seed"],
+            "population.learning_rates": members["optim.learning_rate"],
+            "population.causal_tols": members["weighting.causal_tol"],
+            "population.momentums": members["weighting.momentum"],
+        }
+    )
+    batch = device_batch(random.PRNGKey(0))
+    state = population.update_weights(population.state, batch)
+    state = unreplicate(population.step(state, batch))
+
+    for i in range(2):
+        model = burgers({key: values[i] for key, values in members.items()})
+        expected = model.update_weights(model.state, batch)
+        expected = unreplicate(model.step(expected, batch))
+
+        for x, y in zip(tree_leaves(state.params), tree_leaves(expected.params)):
+            assert jnp.allclose(x[i], y, rtol=1e-5, atol=1e-6)
+        for key in expected.weights:
+            assert jnp.allclose(state.weights[key][i], expected.weights[key])
+
+
+def test_microbatches_average_to_the_full_batch_gradient(burgers):
+    # Without causal weights, which couple the points of a (micro)batch
+    model = burgers({"weighting.use_causal": False, "optim.num_microbatches": 4})
+    state = unreplicate(model.state)
+    batch = device_batch(random.PRNGKey(0))[0]
+
+    grad_fn = lambda batch: jax.grad(model.loss)(state.params, state.weights, batch)
+    grads = model._microbatched(grad_fn, batch)
+    for x, y in zip(tree_leaves(grads), tree_leaves(grad_fn(batch))):
+        assert jnp.allclose(x, y, rtol=1e-4, atol=1e-6)
+
+
+def test_point_weights_ascend_the_weighted_residuals(load_example):
+    default, models = load_example("ldc", "configs.default", "models")
+    config = default.get_config()
+    config.arch.num_layers = 2
+    config.arch.hidden_dim = 16
+    config.training.pool.size = 16
+    config.training.pool.point_weights_lr = 0.1
+    model = models.NavierStokes2D(config)
+
+    # Every other point of the pool of each device, numbered device after device
+    n = jax.local_device_count()
+    points = random.uniform(random.PRNGKey(0), (n, 8, 2))
+    idx = jnp.arange(n)[:, None] * 16 + 2 * jnp.arange(8)
+    state = unreplicate(model.step(model.state, (points, idx), 0.01))
+
+    # The step of a point is the learning rate times its weighted squared residuals
+    params = unreplicate(model.state).params
+    x, y = points.reshape(-1, 2).T
+    residuals = model.r_pred_fn(params, jnp.full(8 * n, 0.01), x, y)
+    steps = 0.1 * sum(r**2 for r in residuals)
+    expected = jnp.ones(16 * n).at[idx.ravel()].add(steps)
+    assert jnp.allclose(state.point_weights, expected, rtol=1e-4)
+
+
+def test_causal_terms_feed_the_residual_loss(burgers):
+    model = burgers()
+    params = unreplicate(model.state).params
+    batch = device_batch(random.PRNGKey(0))[0]
+    causal = model.causal_terms(params, batch)
+
+    batch = batch[jnp.argsort(batch[:, 0])]
+    assert jnp.all(causal["batch"] == batch)
+    r = vmap(model.r_net, (None, 0, 0))(params, batch[:, 0], batch[:, 1])
+    (losses,) = causal["losses"]
+    assert jnp.allclose(losses, jnp.mean(r.reshape(4, -1) ** 2, axis=1), rtol=1e-5)
+
+    # Each chunk is weighted by the losses of the earlier ones, with causal_tol = 1
+    earlier = jnp.cumsum(losses) - losses
+    assert jnp.allclose(causal["weights"], jnp.exp(-earlier), rtol=1e-5)
+
+    res_loss = model.losses(params, batch, causal=causal)["res"]
+    assert jnp.allclose(res_loss, jnp.mean(losses * causal["weights"]))
+    assert jnp.allclose(res_loss, model.losses(params, batch)["res"])
+
+
+def test_chunk_sampling_skips_the_sort_with_the_same_causal_terms(burgers):
+    sorted_model = burgers()
+    model = burgers({"weighting.chunk_sampling": True})
+    params = unreplicate(model.state).params
+
+    sampler = CausalChunkSampler(UniformSampler(DOM, 32), DOM[0], 4)
+    batch = sampler.sample(random.PRNGKey(0))
+    causal = model.causal_terms(params, batch)
+    expected = sorted_model.causal_terms(params, batch)
+
+    assert jnp.all(causal["batch"] == batch)
+    assert jnp.allclose(causal["losses"][0], expected["losses"][0], rtol=1e-5)
+    assert jnp.allclose(causal["weights"], expected["weights"], rtol=1e-5)
+
+
+def test_subsampled_ntk_points_must_split_into_the_causal_chunks(burgers):
+    with pytest.raises(ValueError):
+        burgers({"weighting.ntk_num_points": 6})
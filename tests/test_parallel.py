@@ -0,0 +1,80 @@
+import ml_collections
+import pytest
+
+import jax
+import jax.numpy as jnp
+from jax import lax
+
+from jaxpi.parallel import create_mesh, data_parallel, replicate, unreplicate
+
+
+class Model:
+    def __init__(self, backend):
+        config = ml_collections.ConfigDict({"parallel": {"backend": backend}})
+        self.mesh = create_mesh(config)
+        self._executables = {}
+
+    @data_parallel(batch_argnums=(2,), args_argnum=3)
+    def mean(self, scale, batch, *args):
+        "Mean of the global batch, times `scale` and the optional `args`"
+        value = lax.pmean(scale * jnp.mean(batch), "batch")
+        for arg in args:
+            if arg is not None:
+                value = value * arg
+        return value
+
+
+def split_batch(model, batch):
+    "The batch laid out for the backend, one slice per device with pmap"
+    if model.mesh is None:
+        return batch.reshape(jax.local_device_count(), -1)
+    return batch
+
+
+@pytest.fixture(params=["pmap", "sharding"])
+def model(request):
+    return Model(request.param)
+
+
+def test_there_are_several_devices():
+    assert jax.local_device_count() == 2
+
+
+def test_backends_reduce_over_the_global_batch(model):
+    batch = jnp.arange(8.0)
+    scale = replicate(jnp.array(2.0), model.mesh)
+    value = unreplicate(model.mean(scale, split_batch(model, batch)))
+    assert jnp.allclose(value, 2.0 * jnp.mean(batch))
+
+
+def test_unknown_backend_raises():
+    with pytest.raises(NotImplementedError):
+        Model("unknown")
+
+
+def test_compiled_executables_are_reused(model):
+    batch = split_batch(model, jnp.arange(8.0))
+    scale = replicate(jnp.array(2.0), model.mesh)
+
+    type(model).mean.compile(model, scale, batch)
+    assert list(model._executables) == [("mean", ())]
+    value = unreplicate(model.mean(scale, batch * 2))
+    assert jnp.allclose(value, 14.0)
+
+
+class StaticModel(Model):
+    static_args = (0,)
+
+
+@pytest.mark.parametrize("backend", ["pmap", "sharding"])
+def test_static_args_accept_python_values(backend):
+    model = StaticModel(backend)
+    batch = split_batch(model, jnp.arange(8.0))
+    scale = replicate(jnp.array(2.0), model.mesh)
+
+    assert jnp.allclose(unreplicate(model.mean(scale, batch, None)), 7.0)
+    assert jnp.allclose(unreplicate(model.mean(scale, batch, 3.0)), 21.0)
+
+    type(model).mean.compile(model, scale, batch, None)
+    assert list(model._executables) == [("mean", (None,))]
+    assert jnp.allclose(unreplicate(model.mean(scale, batch, None)), 7.0)
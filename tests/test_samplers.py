@@ -0,0 +1,166 @@
+import ml_collections
+import numpy as np
+import pytest
+
+import jax.numpy as jnp
+from jax import random
+
+from jaxpi.parallel import create_mesh, replicate
+from jaxpi.samplers import (
+    CausalChunkSampler,
+    HaltonSampler,
+    LatinHypercubeSampler,
+    MeshSampler,
+    PoolSampler,
+    ResidualAdaptiveSampler,
+    SobolSampler,
+    UniformSampler,
+    _alias_table,
+)
+
+
+DOM = jnp.array([[0.0, 1.0], [-1.0, 1.0]])
+
+
+@pytest.mark.parametrize(
+    "sampler_cls", [SobolSampler, HaltonSampler, LatinHypercubeSampler]
+)
+def test_qmc_samplers_fill_the_box(sampler_cls):
+    sampler = sampler_cls(DOM, 256)
+    batch = sampler.sample(random.PRNGKey(0))
+
+    assert batch.shape == (256, 2)
+    assert jnp.all(batch >= DOM[:, 0]) and jnp.all(batch < DOM[:, 1])
+    # Every quarter of each axis holds a quarter of the points, up to rounding
+    for j in range(2):
+        u = (batch[:, j] - DOM[j, 0]) / (DOM[j, 1] - DOM[j, 0])
+        counts = np.bincount(np.asarray(u * 4, dtype=int), minlength=4)
+        assert np.all(np.abs(counts - 64) <= 2)
+
+
+@pytest.mark.parametrize(
+    "sampler_cls", [SobolSampler, HaltonSampler, LatinHypercubeSampler]
+)
+def test_qmc_samplers_draw_new_points_per_key(sampler_cls):
+    sampler = sampler_cls(DOM, 64)
+    batch1 = sampler.sample(random.PRNGKey(0))
+    batch2 = sampler.sample(random.PRNGKey(1))
+    assert not jnp.allclose(batch1, batch2)
+
+
+def test_latin_hypercube_has_one_point_per_stratum():
+    batch = LatinHypercubeSampler(DOM, 100).sample(random.PRNGKey(0))
+    for j in range(2):
+        u = (batch[:, j] - DOM[j, 0]) / (DOM[j, 1] - DOM[j, 0])
+        assert sorted(np.asarray(u * 100, dtype=int)) == list(range(100))
+
+
+def test_halton_covers_every_dimension():
+    dom = jnp.tile(jnp.array([[0.0, 1.0]]), (15, 1))
+    batch = HaltonSampler(dom, 128).sample(random.PRNGKey(0))
+
+    assert batch.shape == (128, 15)
+    assert jnp.all(jnp.abs(jnp.mean(batch, axis=0) - 0.5) < 0.05)
+
+
+def test_uniform_sampler_batches_are_device_stacked():
+    sampler = UniformSampler(DOM, 32)
+    batch = next(iter(sampler))
+    assert batch.shape == (sampler.num_devices, 32, 2)
+
+
+def test_causal_chunk_sampler_fills_the_chunks_in_order():
+    sampler = CausalChunkSampler(UniformSampler(DOM, 64), DOM[0], 8)
+    batch = sampler.sample(random.PRNGKey(0))
+
+    assert batch.shape == (64, 2)
+    chunks = np.asarray(batch[:, 0] * 8, dtype=int)
+    assert np.all(chunks == np.arange(64) // 8)
+    assert jnp.all(batch[:, 1] >= -1.0) and jnp.all(batch[:, 1] < 1.0)
+
+
+def test_causal_chunk_sampler_rejects_uneven_chunks():
+    with pytest.raises(ValueError):
+        CausalChunkSampler(UniformSampler(DOM, 100), DOM[0], 32)
+
+
+@pytest.mark.parametrize("backend", ["pmap", "sharding"])
+def test_batch_spec_matches_the_batches(backend):
+    mesh = create_mesh(ml_collections.ConfigDict({"parallel": {"backend": backend}}))
+    sampler = UniformSampler(DOM, 32, mesh=mesh)
+    key = sampler.key
+    spec = sampler.batch_spec()
+
+    # The spec is computed without drawing a batch
+    assert jnp.all(sampler.key == key)
+    batch = next(iter(sampler))
+    assert spec.shape == batch.shape and spec.dtype == batch.dtype
+
+
+def test_pool_sampler_visits_every_point_once_per_epoch():
+    sampler = PoolSampler(UniformSampler(DOM, 32), 8, 2, with_indices=True)
+    batches = iter(sampler)
+    pool = sampler.pool.reshape(-1, 2)
+
+    orders = []
+    for epoch in range(2):
+        points, idx = zip(*[next(batches) for _ in range(4)])
+        points, idx = jnp.concatenate(points, 1), jnp.concatenate(idx, 1)
+        assert jnp.all(points == pool[idx])
+        # The points of each device, in a new order every epoch
+        for i, device_idx in enumerate(idx):
+            assert sorted(device_idx.tolist()) == list(range(32 * i, 32 * (i + 1)))
+        orders.append(idx)
+    assert not jnp.all(orders[0] == orders[1])
+
+    # A new pool every refresh_every_epochs
+    next(batches)
+    assert sampler.num_refreshes == 1
+    assert not jnp.allclose(sampler.pool.reshape(-1, 2), pool)
+
+
+def test_residual_adaptive_sampler_draws_where_the_residuals_are():
+    # Residuals only where t > 0.5, and no uniform part of the density with c = 0
+    residual_fn = lambda scale, pool: scale * (pool[:, 0] > 0.5)
+    sampler = ResidualAdaptiveSampler(UniformSampler(DOM, 256), residual_fn, 64, c=0.0)
+    batches = iter(sampler)
+
+    # Uniform over the pool until the first refresh
+    assert jnp.any(next(batches)[..., 0] < 0.5)
+
+    pool = sampler.pool
+    sampler.refresh(replicate(jnp.array(1.0)))
+    assert not jnp.allclose(sampler.pool, pool)
+
+    batch = next(batches)
+    assert batch.shape == (sampler.num_devices, 64, 2)
+    assert jnp.all(batch[..., 0] > 0.5)
+    for points, device_pool in zip(batch, sampler.pool):
+        assert jnp.all(jnp.any(jnp.all(points[:, None] == device_pool, -1), 1))
+
+
+def test_alias_table_reproduces_the_distribution():
+    probs = np.array([0.1, 0.5, 0.05, 0.25, 0.1])
+    prob, alias = _alias_table(probs)
+
+    # Each slot keeps prob[i] / n for itself and gives the rest to its alias
+    implied = prob.copy()
+    np.add.at(implied, alias, 1.0 - prob)
+    assert np.allclose(implied / len(probs), probs)
+
+
+@pytest.mark.parametrize(
+    "density, expected",
+    [(None, [1 / 6, 1 / 2, 1 / 3]), ([6.0, 2.0, 3.0], [1 / 3, 1 / 3, 1 / 3])],
+)
+def test_mesh_sampler_picks_cells_by_area_times_density(density, expected):
+    # Three triangles of areas 0.5, 1.5 and 1 side by side along x
+    nodes = jnp.array([[0.0, 0.0], [1.0, 0.0], [0.0, 1.0], [4.0, 0.0], [1.0, 1.0]])
+    nodes = jnp.concatenate([nodes, jnp.array([[6.0, 0.0], [4.0, 1.0]])])
+    cells = jnp.array([[0, 1, 2], [1, 3, 4], [3, 5, 6]])
+    batch = MeshSampler(nodes, cells, 30000, density=density).sample(random.PRNGKey(0))
+
+    counts = np.bincount(np.digitize(np.asarray(batch[:, 0]), [1.0, 4.0]), minlength=3)
+    assert np.allclose(counts / 30000, expected, atol=0.01)
+    # Inside the triangles
+    assert jnp.all(batch[:, 1] >= 0.0) and jnp.all(batch[:, 1] <= 1.0)
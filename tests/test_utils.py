@@ -0,0 +1,61 @@
+import pytest
+
+import jax.numpy as jnp
+from jax import random, vmap
+
+from jaxpi.utils import diag_ntk_fn, ntk_fn
+
+
+def apply_fn(params, t, x):
+    h = jnp.tanh(params["w1"] @ jnp.stack([t, x]) + params["b1"])
+    return params["w2"] @ h
+
+
+@pytest.fixture
+def params():
+    keys = random.split(random.PRNGKey(0), 3)
+    return {
+        "w1": random.normal(keys[0], (16, 2)),
+        "b1": random.normal(keys[1], (16,)),
+        "w2": random.normal(keys[2], (16,)),
+    }
+
+
+@pytest.mark.parametrize("chunk_size", [None, 32, 50, 1000])
+def test_exact_diag_ntk(params, chunk_size):
+    t, x = random.uniform(random.PRNGKey(1), (2, 100))
+    expected = vmap(ntk_fn, (None, None, 0, 0))(apply_fn, params, t, x)
+
+    ntk = diag_ntk_fn(apply_fn, params, t, x, chunk_size=chunk_size)
+    assert ntk.shape == (100,)
+    assert jnp.allclose(ntk, expected, rtol=1e-5)
+
+
+def test_exact_diag_ntk_with_shared_scalars(params):
+    x = random.uniform(random.PRNGKey(1), (40,))
+    expected = vmap(ntk_fn, (None, None, None, 0))(apply_fn, params, 0.0, x)
+
+    ntk = diag_ntk_fn(apply_fn, params, 0.0, x, chunk_size=16)
+    assert jnp.allclose(ntk, expected, rtol=1e-5)
+
+
+def test_estimated_diag_ntk(params):
+    t, x = random.uniform(random.PRNGKey(1), (2, 128))
+    exact = diag_ntk_fn(apply_fn, params, t, x)
+    key = random.PRNGKey(2)
+
+    # One point in each stratum of 8 points, in order
+    ntk = diag_ntk_fn(apply_fn, params, t, x, num_points=16, key=key)
+    assert ntk.shape == (16,)
+    strata = exact.reshape(16, 8)
+    assert jnp.all(jnp.any(jnp.isclose(ntk[:, None], strata, rtol=1e-5), axis=1))
+
+    # Unbiased over the probes
+    ntk = diag_ntk_fn(apply_fn, params, t, x, num_probes=2000, key=key)
+    assert jnp.allclose(jnp.mean(ntk), jnp.mean(exact), rtol=0.1)
+
+
+def test_estimated_diag_ntk_needs_a_key(params):
+    t, x = random.uniform(random.PRNGKey(1), (2, 32))
+    with pytest.raises(ValueError):
+        diag_ntk_fn(apply_fn, params, t, x, num_points=8)
@@ -0,0 +1,91 @@
+import ml_collections
+import pytest
+
+import jax.numpy as jnp
+from jax import random
+
+from jaxpi.weighting import (
+    GradNorm,
+    LRAnnealing,
+    NTK,
+    ReLoBRaLo,
+    SoftAdapt,
+    create_scheme,
+)
+
+
+def weighting_config(**kwargs):
+    return ml_collections.ConfigDict(dict({"scheme": None, "momentum": 0.9}, **kwargs))
+
+
+GRADS = {
+    "ics": {"w": jnp.array([3.0, -4.0]), "b": jnp.array([0.0])},
+    "res": {"w": jnp.array([0.5, 0.0]), "b": jnp.array([-2.0])},
+}
+
+
+def test_grad_norm_equalizes_the_weighted_gradient_norms():
+    w = GradNorm(weighting_config())(GRADS)
+    # Gradient norms 5 and sqrt(4.25)
+    assert jnp.allclose(w["ics"] * 5.0, w["res"] * jnp.sqrt(4.25))
+
+
+def test_lr_annealing_takes_the_max_over_the_residual_gradient():
+    w = LRAnnealing(weighting_config())(GRADS)
+    # The largest residual gradient entry is 2, not the 4 of "ics"
+    assert jnp.allclose(w["ics"], 2.0 / (7.0 / 3))
+    # The residual loss keeps its weight
+    assert jnp.allclose(w["res"], 1.0)
+
+    w = LRAnnealing(weighting_config(residual_losses=["ics"]))(GRADS)
+    assert jnp.allclose(w["ics"], 1.0)
+    assert jnp.allclose(w["res"], 4.0 / (2.5 / 3))
+
+
+def test_lr_annealing_needs_a_residual_loss():
+    with pytest.raises(ValueError):
+        LRAnnealing(weighting_config())({"u_bc": GRADS["ics"]})
+
+
+def test_ntk_equalizes_the_mean_ntk():
+    w = NTK(weighting_config())({"ics": jnp.array([1.0, 3.0]), "res": jnp.array([6.0])})
+    assert jnp.allclose(w["ics"] * 2.0, w["res"] * 6.0)
+
+
+def test_softadapt_weights_the_slowest_loss_most():
+    scheme = SoftAdapt(weighting_config())
+    weights = {"ics": jnp.ones(()), "res": jnp.ones(())}
+    state = scheme.init(weights, random.PRNGKey(0))
+
+    # No rates at the first step
+    losses = {"ics": jnp.array(1.0), "res": jnp.array(1.0)}
+    w, state = scheme.update(state, weights, losses, 0.0)
+    assert jnp.allclose(w["ics"], 1.0) and jnp.allclose(w["res"], 1.0)
+
+    losses = {"ics": jnp.array(0.5), "res": jnp.array(0.9)}
+    w, _ = scheme.update(state, weights, losses, 0.0)
+    assert w["res"] > w["ics"]
+    assert jnp.allclose(w["ics"] + w["res"], 2.0)
+
+    # The momentum passed in averages the new weights with the current ones
+    w_avg, _ = scheme.update(state, weights, losses, 0.5)
+    assert jnp.allclose(w_avg["ics"], 0.5 + 0.5 * w["ics"])
+
+
+def test_relobralo_keeps_the_weights_summing_to_the_number_of_losses():
+    scheme = ReLoBRaLo(weighting_config(alpha=0.5, lookback=0.5))
+    weights = {"ics": jnp.ones(()), "res": jnp.ones(())}
+    state = scheme.init(weights, random.PRNGKey(0))
+
+    for l_ics, l_res in [(1.0, 1.0), (0.5, 0.9), (0.2, 0.8)]:
+        losses = {"ics": jnp.array(l_ics), "res": jnp.array(l_res)}
+        weights, state = scheme.update(state, weights, losses, 0.9)
+        assert jnp.allclose(weights["ics"] + weights["res"], 2.0)
+    assert weights["res"] > weights["ics"]
+
+
+def test_create_scheme():
+    assert create_scheme(weighting_config()) is None
+    assert isinstance(create_scheme(weighting_config(scheme="ntk")), NTK)
+    with pytest.raises(NotImplementedError):
+        create_scheme(weighting_config(scheme="unknown"))